@@ -1,31 +1,309 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path
+from typing import Optional
+import numpy as np
 import pandas as pd
+import psycopg2
+import psycopg2.errors
+import asyncio
+import hashlib
 import json
-from datetime import datetime
+from collections import deque
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 
 from ml.ai_forecast import sarimax_forecast, load_latest_ai_series, FORECAST_HORIZON
+from scripts.raw_reader import read_raw_csv
+from scripts.downsample import downsample_indices
+from scripts.airflow_scripts.resampling import periods_in_window
+from scripts.airflow_scripts.rolling_zscore import rolling_zscore
+from scripts.similarity_index import INDEX_PATH, SimilarityIndex
+from scripts.pipeline_events import CHANNEL as EVENTS_CHANNEL, EVENTS_FILE
+from dashboards.shared_cache import SharedCache, dataset_name
+from dashboards import export
 
 app = FastAPI(title="DataLakeVendredi Dashboard API")
 ANALYTICS_DIR = Path("data/processed/analytics")
 
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+PEAK_WINDOW = "28D"
+PEAK_Z_THRESHOLD = 1.5
+MAX_POINTS = Query(None, ge=3, description="Downsample to at most this many points (LTTB, peaks kept)")
+
+# Analytics files change at most once a day: clients and proxies may reuse a
+# response for 5 minutes, then revalidate it with If-None-Match / If-Modified-Since
+CACHE_CONTROL = "public, max-age=300, must-revalidate"
+
+EVENTS_KEEPALIVE = 15  # seconds between SSE comments on idle connections
+EVENTS_POLL = 2  # seconds between checks of the events file without a database
+EVENTS_REPLAY = 500  # recent events kept for clients reconnecting with Last-Event-ID
+EVENTS_QUEUE = 100  # per subscriber; a slow client loses its oldest events
+EVENTS_CONNECT_TIMEOUT = 3  # seconds before the broker falls back to following the events file
+
+MOVER_PERIODS = ("week", "month", "quarter")
+MOVER_METRICS = ("change", "pct_change", "z_score")
+
 # Utility loaders
 
+shared_cache = SharedCache()
+
 def load_csv(name: str) -> pd.DataFrame:
+    # Memory-mapped copy shared by all workers when built, the CSV otherwise
+    cached = shared_cache.frame(dataset_name(name))
+    if cached is not None:
+        return cached
     path = ANALYTICS_DIR / name
     if not path.exists():
         raise FileNotFoundError(name)
-    return pd.read_csv(path)
+    # Dates are passed through to the JSON responses unchanged
+    return read_raw_csv(path, parse_dates=False)
+
+# Conditional requests
+
+_file_versions = {}
+
+def file_version(path: Path):
+    # Content hash, recomputed only when size or mtime change
+    stat = path.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_versions.get(path)
+    if cached is None or cached[0] != key:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        cached = (key, digest.hexdigest())
+        _file_versions[path] = cached
+    return cached[1], datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def conditional(request: Request, response: Response, version: str, last_modified: datetime):
+    """304 response when the client copy is current, otherwise None (validators set on `response`)
+
+    The ETag covers the data version and the query string, as each query is a
+    different representation of the same data.
+    """
+    tag = hashlib.sha256(f"{version}|{request.url.path}?{request.url.query}".encode()).hexdigest()[:32]
+    headers = {
+        "ETag": f'"{tag}"',
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def file_conditional(request: Request, response: Response, path: Path):
+    # Datasets served from the shared cache are validated by the cached version
+    if path.parent == ANALYTICS_DIR:
+        cached = shared_cache.lookup(dataset_name(path.name))
+        if cached is not None:
+            pointer = cached[1]
+            built_at = datetime.fromisoformat(pointer["built_at"]).replace(tzinfo=timezone.utc)
+            return conditional(request, response, pointer["version"], built_at)
+    # Missing files are left to the endpoint's own 404
+    if not path.exists():
+        return None
+    return conditional(request, response, *file_version(path))
+
+def peak_mask(dates: pd.Series, values: np.ndarray) -> np.ndarray:
+    # Same rule as detect_peaks: z-score over a 28-day window once it is complete
+    index = pd.DatetimeIndex(pd.to_datetime(dates))
+    step = index.to_series().diff().median()
+    min_periods = periods_in_window(PEAK_WINDOW, step) if pd.notna(step) else 1
+    z = rolling_zscore(values, index, window=PEAK_WINDOW, min_periods=min_periods).z[0]
+    with np.errstate(invalid="ignore"):
+        return z > PEAK_Z_THRESHOLD
+
+def downsample(df: pd.DataFrame, columns: list, max_points: Optional[int]) -> pd.DataFrame:
+    # Budget split across the plotted columns; each column keeps its own peaks
+    if max_points is None or len(df) <= max_points:
+        return df
+    x = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    per_column = max(max_points // len(columns), 3)
+    kept = np.unique(np.concatenate([
+        downsample_indices(x, values, per_column, keep=peak_mask(df["date"], values))
+        for values in (df[c].to_numpy(dtype=float) for c in columns)
+    ]))
+    return df.iloc[kept]
+
+_similarity = {"mtime": None, "index": None}
+
+def similarity_index() -> SimilarityIndex:
+    # Reloaded only when the pipeline has rewritten the index file
+    mtime = INDEX_PATH.stat().st_mtime
+    if _similarity["mtime"] != mtime:
+        _similarity["index"] = SimilarityIndex.load(INDEX_PATH)
+        _similarity["mtime"] = mtime
+    return _similarity["index"]
+
+# Pipeline event push
+
+class EventBroker:
+    """Fans pipeline events out to SSE subscribers from a single source
+
+    One LISTEN connection (or one file follower when the database is not
+    reachable) feeds a bounded queue per subscriber, so idle clients cost a
+    queue and a suspended coroutine each.
+
+    Event ids are derived from the payload (which carries its publication time
+    to the microsecond), not counted, so every API worker
+    gives the same event the same id and a client reconnecting to another
+    worker resumes from its Last-Event-ID. Replay covers the events that
+    worker has buffered: those received since its broker started, at most
+    EVENTS_REPLAY.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.recent = deque(maxlen=EVENTS_REPLAY)
+        self.source = None
+        self._conn = None
+        self._task = None
+        self._starting = None
+
+    async def start(self):
+        # Subscribers arriving while the connection is being opened wait for the same attempt
+        if self.source is not None:
+            return
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._connect())
+        await asyncio.shield(self._starting)
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        try:
+            # Blocking connect off the event loop, bounded so an unreachable database cannot stall it
+            conn = await loop.run_in_executor(
+                None, lambda: psycopg2.connect(**DB_CONFIG, connect_timeout=EVENTS_CONNECT_TIMEOUT))
+        except psycopg2.Error:
+            self._follow_from_now()
+            return
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {EVENTS_CHANNEL}")
+            loop.add_reader(conn.fileno(), self._on_notify)
+        except psycopg2.Error:
+            conn.close()
+            self._follow_from_now()
+            return
+        self._conn = conn
+        self.source = "listen"
+
+    def _on_notify(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error:
+            # Connection lost: fall back to the events file
+            asyncio.get_running_loop().remove_reader(self._conn.fileno())
+            self._follow_from_now()
+            return
+        while self._conn.notifies:
+            self.broadcast(self._conn.notifies.pop(0).payload)
+
+    def _follow_from_now(self):
+        # Only events appended from now on are forwarded
+        stat = EVENTS_FILE.stat() if EVENTS_FILE.exists() else None
+        position, inode = (stat.st_size, stat.st_ino) if stat else (0, None)
+        self._task = asyncio.get_running_loop().create_task(self._follow_file(position, inode))
+        self.source = "file"
+
+    async def _follow_file(self, position: int, inode):
+        while True:
+            await asyncio.sleep(EVENTS_POLL)
+            if not EVENTS_FILE.exists():
+                continue
+            stat = EVENTS_FILE.stat()
+            if stat.st_ino != inode or stat.st_size < position:
+                # Rotated (pipeline_events.MAX_EVENTS_BYTES): finish the previous file first,
+                # then read the new one from the start
+                rotated = EVENTS_FILE.with_name(EVENTS_FILE.name + ".1")
+                if inode is not None and rotated.exists() and rotated.stat().st_ino == inode:
+                    self._read_lines(rotated, position, rotated.stat().st_size)
+                position, inode = 0, stat.st_ino
+            position = self._read_lines(EVENTS_FILE, position, stat.st_size)
+
+    def _read_lines(self, path: Path, position: int, size: int) -> int:
+        # Broadcasts the complete lines between position and size, returns the new position
+        if size <= position:
+            return position
+        with open(path, "rb") as f:
+            f.seek(position)
+            chunk = f.read(size - position)
+        # A partially written last line is read on the next pass
+        complete = chunk.rfind(b"\n") + 1
+        for line in chunk[:complete].decode("utf-8").splitlines():
+            if line.strip():
+                self.broadcast(line)
+        return position + complete
+
+    def broadcast(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        # The payload carries its publication time (microseconds), so equal payloads are the same event
+        event_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        message = (event_id, event.get("event", "message"), payload)
+        self.recent.append(message)
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def subscribe(self, last_event_id: Optional[str] = None) -> asyncio.Queue:
+        await self.start()
+        queue = asyncio.Queue(maxsize=EVENTS_QUEUE)
+        if last_event_id is not None:
+            recent = list(self.recent)
+            ids = [message[0] for message in recent]
+            # Events after the last one the client saw; nothing if this worker never buffered it
+            if last_event_id in ids:
+                position = len(ids) - ids[::-1].index(last_event_id)
+                for message in recent[position:][-EVENTS_QUEUE:]:
+                    queue.put_nowait(message)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+broker = EventBroker()
 
 @app.get("/")
 def root():
     return {"service": "dashboard-api", "time": datetime.utcnow().isoformat()}
 
 @app.get("/chatgpt/evolution")
-def chatgpt_evolution():
+def chatgpt_evolution(request: Request, response: Response, max_points: Optional[int] = MAX_POINTS):
+    cached = file_conditional(request, response, ANALYTICS_DIR / "chatgpt_evolution_series.csv")
+    if cached is not None:
+        return cached
     try:
-        df = load_csv("chatgpt_evolution_series.csv")
+        df = downsample(load_csv("chatgpt_evolution_series.csv"), ["value"], max_points)
         return [
             {
                 "date": r.date,
@@ -37,7 +315,10 @@ def chatgpt_evolution():
         raise HTTPException(status_code=404, detail="chatgpt evolution not found")
 
 @app.get("/ai/peaks")
-def ai_peaks():
+def ai_peaks(request: Request, response: Response):
+    cached = file_conditional(request, response, ANALYTICS_DIR / "ai_peaks.csv")
+    if cached is not None:
+        return cached
     try:
         df = load_csv("ai_peaks.csv")
         if df.empty:
@@ -53,7 +334,10 @@ def ai_peaks():
         raise HTTPException(status_code=404, detail="ai peaks not found")
 
 @app.get("/python/map")
-def python_map():
+def python_map(request: Request, response: Response):
+    cached = file_conditional(request, response, ANALYTICS_DIR / "python_top_countries.csv")
+    if cached is not None:
+        return cached
     try:
         df = load_csv("python_top_countries.csv")
         return [
@@ -63,9 +347,12 @@ def python_map():
         raise HTTPException(status_code=404, detail="python map not found")
 
 @app.get("/machine-learning/fr-vs-us")
-def machine_learning_fr_us():
+def machine_learning_fr_us(request: Request, response: Response, max_points: Optional[int] = MAX_POINTS):
+    cached = file_conditional(request, response, ANALYTICS_DIR / "machine_learning_fr_us.csv")
+    if cached is not None:
+        return cached
     try:
-        df = load_csv("machine_learning_fr_us.csv")
+        df = downsample(load_csv("machine_learning_fr_us.csv"), ["fr_value", "us_value"], max_points)
         return [
             {
                 "date": r.date,
@@ -78,14 +365,20 @@ def machine_learning_fr_us():
         raise HTTPException(status_code=404, detail="machine learning fr vs us not found")
 
 @app.get("/data-science/events-correlation")
-def data_science_events():
+def data_science_events(request: Request, response: Response):
     path = ANALYTICS_DIR / "data_quality_event_correlation.json"
     if not path.exists():
         raise HTTPException(status_code=404, detail="event correlation not found")
+    cached = file_conditional(request, response, path)
+    if cached is not None:
+        return cached
     return json.loads(path.read_text())
 
 @app.get("/ai/forecast")
-def ai_forecast():
+def ai_forecast(request: Request, response: Response):
+    cached = file_conditional(request, response, ANALYTICS_DIR / "ai_forecast.csv")
+    if cached is not None:
+        return cached
     try:
         df = load_csv("ai_forecast.csv")
         return [
@@ -99,6 +392,136 @@ def ai_forecast():
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="ai forecast not found")
 
+@app.get("/trends/similar")
+def trends_similar(request: Request, response: Response, keyword: str, k: int = 10,
+                   region: str = "worldwide"):
+    if not INDEX_PATH.exists():
+        raise HTTPException(status_code=404, detail="similarity index not found")
+    cached = file_conditional(request, response, INDEX_PATH)
+    if cached is not None:
+        return cached
+    try:
+        neighbours = similarity_index().query(keyword, region, max(1, min(k, 100)))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"{keyword} ({region}) not in similarity index")
+    return [
+        {"keyword": kw, "region": rg, "distance": distance}
+        for kw, rg, distance in neighbours
+    ]
+
+@app.get("/trends/movers")
+def trends_movers(request: Request, response: Response, period: str = "week", limit: int = 20,
+                  direction: str = "up", metric: str = "change"):
+    if period not in MOVER_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(MOVER_PERIODS)}")
+    if metric not in MOVER_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(MOVER_METRICS)}")
+    if direction not in ("up", "down"):
+        raise HTTPException(status_code=400, detail="direction must be up or down")
+    # metric and direction are whitelisted above; the (period, metric) index serves the top-N
+    order = "DESC" if direction == "up" else "ASC"
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        # Watermark recorded by scripts/top_movers.py each time rows change
+        cursor.execute("""
+            SELECT input_version, computed_at FROM computation_versions WHERE computation = 'top_movers'
+        """)
+        watermark = cursor.fetchone()
+        if watermark:
+            cached = conditional(request, response, watermark[0], watermark[1].replace(tzinfo=timezone.utc))
+            if cached is not None:
+                return cached
+        cursor.execute(f"""
+            SELECT keyword, region, as_of, last_mean, prev_mean, change, pct_change, acceleration, z_score
+            FROM top_movers
+            WHERE period = %s AND {metric} IS NOT NULL
+            ORDER BY {metric} {order}
+            LIMIT %s
+        """, (period, max(1, min(limit, 500))))
+        rows = cursor.fetchall()
+    except psycopg2.errors.UndefinedTable:
+        raise HTTPException(status_code=404, detail="top movers not computed yet")
+    finally:
+        conn.close()
+    return [
+        {
+            "keyword": keyword,
+            "region": region,
+            "as_of": as_of.isoformat(),
+            "last_mean": last_mean,
+            "prev_mean": prev_mean,
+            "change": change,
+            "pct_change": pct_change,
+            "acceleration": acceleration,
+            "z_score": z_score
+        } for keyword, region, as_of, last_mean, prev_mean, change, pct_change, acceleration, z_score in rows
+    ]
+
+@app.api_route("/export/trends", methods=["GET", "HEAD"])
+def export_trends(request: Request, response: Response, keywords: Optional[str] = None,
+                  regions: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+                  format: str = "parquet", compression: str = "zstd"):
+    """trends_raw rows (keyword, region, date, value) as an Arrow IPC or Parquet file
+
+    keywords and regions are comma-separated (default: all). The file is built
+    once per selection and data version, then served with Range support so
+    large pulls can be resumed or fetched in parallel chunks.
+    """
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    if compression not in export.COMPRESSIONS[format]:
+        raise HTTPException(status_code=400,
+                            detail=f"{format} compression must be one of {', '.join(export.COMPRESSIONS[format])}")
+    params = export.selection_params(keywords.split(",") if keywords else None,
+                                     regions.split(",") if regions else None, start, end)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        version = export.selection_version(cursor, params)
+        if version is None:
+            raise HTTPException(status_code=404, detail="no series match the selection")
+        cached = conditional(request, response, *version)
+        if cached is not None:
+            return cached
+        path = export.ensure_export(cursor, version[0], params, format, compression)
+    except psycopg2.errors.UndefinedTable:
+        raise HTTPException(status_code=404, detail="series versions not computed yet")
+    finally:
+        conn.close()
+    extension, media_type = export.FORMATS[format]
+    # Validators from conditional(), so If-Range matches the ETag clients revalidate with
+    headers = {name: response.headers[name] for name in ("etag", "last-modified", "cache-control")}
+    return FileResponse(path, media_type=media_type, filename=f"trends.{extension}", headers=headers)
+
+@app.get("/events")
+async def events(request: Request, types: Optional[str] = None):
+    """Server-sent events: load, peaks, forecast and stage events as the pipeline commits them
+
+    ?types=load,forecast filters by event type; Last-Event-ID replays what a
+    reconnecting client missed (within the recent buffer).
+    """
+    wanted = set(types.split(",")) if types else None
+    last_id = request.headers.get("last-event-id")
+    queue = await broker.subscribe(last_id or None)
+
+    async def stream():
+        try:
+            yield f"retry: 5000\n: source={broker.source}\n\n"
+            while True:
+                try:
+                    event_id, kind, payload = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if wanted is None or kind in wanted:
+                    yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -0,0 +1,199 @@
+"""
+Bulk exports of trends_raw as Arrow IPC or Parquet files
+
+A selection (keywords, regions, date range) is streamed out of PostgreSQL with
+COPY through a pipe into pyarrow's CSV reader, and the record batches it
+produces are written straight to an Arrow IPC file or a Parquet file: no row
+ever becomes a Python object.
+
+Exports are cached under data/processed/exports, named after the selection
+and the content hashes (series_versions) of the series it covers, so repeated
+or resumed downloads are plain file reads and the API answers Range requests
+from the file. Compression is applied inside the file (Arrow IPC buffer
+compression, Parquet column compression) rather than as a Content-Encoding,
+which keeps byte ranges valid against the file on disk.
+
+    python -m dashboards.export --keywords ChatGPT Python --format parquet --output trends.parquet
+"""
+import argparse
+import hashlib
+import os
+import threading
+import uuid
+from datetime import date, timezone
+from pathlib import Path
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+CACHE_DIR = Path("data/processed/exports")
+MAX_CACHE_BYTES = 20 << 30  # least recently served exports are removed beyond this
+BLOCK_SIZE = 16 << 20  # CSV bytes per record batch (one Parquet row group each)
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+FORMATS = {
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+COMPRESSIONS = {
+    "arrow": ("zstd", "lz4", "none"),
+    "parquet": ("zstd", "snappy", "lz4", "gzip", "none"),
+}
+
+SCHEMA = pa.schema([
+    ("keyword", pa.string()),
+    ("region", pa.string()),
+    ("date", pa.date32()),
+    ("value", pa.int32()),
+])
+
+SELECTION = """
+    (%(keywords)s::text[] IS NULL OR keyword = ANY(%(keywords)s))
+    AND (%(regions)s::text[] IS NULL OR region = ANY(%(regions)s))
+"""
+
+def selection_params(keywords=None, regions=None, start=None, end=None) -> dict:
+    return {
+        "keywords": sorted(keywords) if keywords else None,
+        "regions": sorted(regions) if regions else None,
+        "start": start,
+        "end": end,
+    }
+
+def selection_version(cursor, params: dict):
+    """(version, last_modified) of the series a selection covers, or None when it matches none"""
+    cursor.execute(f"""
+        SELECT md5(string_agg(keyword || '|' || region || '|' || content_hash, ';' ORDER BY keyword, region)),
+               MAX(updated_at)
+        FROM series_versions
+        WHERE {SELECTION}
+    """, params)
+    version, updated_at = cursor.fetchone()
+    if version is None:
+        return None
+    return version, updated_at.replace(tzinfo=timezone.utc)
+
+def export_path(version: str, params: dict, fmt: str, compression: str) -> Path:
+    key = repr((version, params["keywords"], params["regions"], str(params["start"]), str(params["end"]),
+                fmt, compression))
+    return CACHE_DIR / f"trends-{hashlib.sha256(key.encode()).hexdigest()[:24]}.{FORMATS[fmt][0]}"
+
+def copy_query(cursor, params: dict) -> str:
+    # COPY takes no bind parameters: the values are quoted client-side by mogrify
+    return cursor.mogrify(f"""
+        COPY (
+            SELECT keyword, region, date, value
+            FROM trends_raw
+            WHERE {SELECTION}
+              AND (%(start)s::date IS NULL OR date >= %(start)s)
+              AND (%(end)s::date IS NULL OR date <= %(end)s)
+            ORDER BY keyword, region, date
+        ) TO STDOUT WITH (FORMAT csv, HEADER true)
+    """, params).decode()
+
+def write_batches(reader, path: Path, fmt: str, compression: str) -> int:
+    codec = None if compression == "none" else compression
+    rows = 0
+    if fmt == "arrow":
+        options = pa.ipc.IpcWriteOptions(compression=codec)
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, SCHEMA, options=options) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    else:
+        with pq.ParquetWriter(str(path), SCHEMA, compression=codec or "none") as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
+
+def write_export(cursor, path: Path, params: dict, fmt: str = "parquet", compression: str = "zstd") -> int:
+    """Stream the selection into `path` (replaced atomically); returns the number of rows"""
+    query = copy_query(cursor, params)
+    read_fd, write_fd = os.pipe()
+    failure = []
+
+    def produce():
+        # COPY writes CSV into the pipe while pyarrow parses the other end
+        with os.fdopen(write_fd, "wb") as sink:
+            try:
+                cursor.copy_expert(query, sink)
+            except Exception as exc:
+                failure.append(exc)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, "rb") as source:
+            reader = pa_csv.open_csv(
+                source,
+                read_options=pa_csv.ReadOptions(block_size=BLOCK_SIZE),
+                # COPY writes NULL unquoted and empty strings quoted
+                convert_options=pa_csv.ConvertOptions(column_types=SCHEMA, include_columns=SCHEMA.names,
+                                                      strings_can_be_null=True,
+                                                      quoted_strings_can_be_null=False),
+            )
+            rows = write_batches(reader, tmp, fmt, compression)
+        producer.join()
+        # A failed COPY ends the pipe early: never publish a truncated export
+        if failure:
+            raise failure[0]
+        os.replace(tmp, path)
+    finally:
+        producer.join()
+        tmp.unlink(missing_ok=True)
+    return rows
+
+def prune_cache(keep: Path):
+    files = [path for path in CACHE_DIR.glob("trends-*") if path.suffix != ".tmp"]
+    files.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    total = 0
+    for path in files:
+        total += path.stat().st_size
+        if total > MAX_CACHE_BYTES and path != keep:
+            path.unlink(missing_ok=True)
+
+def ensure_export(cursor, version: str, params: dict, fmt: str, compression: str) -> Path:
+    """Cached export file of a selection at `version`, written on first request"""
+    path = export_path(version, params, fmt, compression)
+    if path.exists():
+        os.utime(path)  # mtime tracks the last use for prune_cache()
+        return path
+    write_export(cursor, path, params, fmt, compression)
+    prune_cache(keep=path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export trends_raw series as Arrow IPC or Parquet")
+    parser.add_argument("--keywords", nargs="+", help="Keywords to export (default: all)")
+    parser.add_argument("--regions", nargs="+", help="Regions to export (default: all)")
+    parser.add_argument("--start", type=date.fromisoformat, help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last date (YYYY-MM-DD)")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet")
+    parser.add_argument("--compression", default="zstd",
+                        help="zstd, lz4 or none (Parquet also accepts snappy and gzip)")
+    parser.add_argument("--output", required=True, help="File to write")
+    args = parser.parse_args()
+
+    if args.compression not in COMPRESSIONS[args.format]:
+        parser.error(f"{args.format} compression must be one of {', '.join(COMPRESSIONS[args.format])}")
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    rows = write_export(cursor, Path(args.output),
+                        selection_params(args.keywords, args.regions, args.start, args.end),
+                        args.format, args.compression)
+    cursor.close()
+    conn.close()
+    size = Path(args.output).stat().st_size
+    print(f"✅ {rows} rows written to {args.output} ({size / (1 << 20):.1f} MB)")
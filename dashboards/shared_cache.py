@@ -0,0 +1,191 @@
+"""
+Shared-memory dataset cache for the API worker processes
+
+The loader converts each analytics CSV once into an uncompressed Arrow IPC
+file under data/processed/shared_cache, named after the CSV content hash, and
+then atomically replaces the dataset's pointer file (<name>.json) with
+os.replace. Workers memory-map the file the pointer names: the table's
+buffers are the OS page cache pages, shared by every worker without copies,
+and a worker notices a new version by a stat of the pointer file.
+
+Files of replaced versions are deleted once they are two versions old; a
+worker still mapping one keeps reading it until it switches (POSIX unlink).
+
+The pointer records the (mtime, size) of the CSV it was built from. Other
+writers (airflow_scripts/transform_trends.py) rewrite some of these CSVs
+without rebuilding the cache, so a lookup whose CSV no longer matches
+returns None and the API reads the CSV until the next --build.
+
+    python -m dashboards.shared_cache --build
+"""
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from scripts.raw_reader import read_raw_csv
+
+ANALYTICS_DIR = Path("data/processed/analytics")
+CACHE_DIR = Path("data/processed/shared_cache")
+DATASETS = (
+    "chatgpt_evolution_series.csv",
+    "ai_peaks.csv",
+    "python_top_countries.csv",
+    "machine_learning_fr_us.csv",
+    "ai_forecast.csv",
+)
+KEEP_VERSIONS = 2
+
+
+def dataset_name(csv_name: str) -> str:
+    return Path(csv_name).stem
+
+
+def pointer_path(name: str) -> Path:
+    return CACHE_DIR / f"{name}.json"
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_path(name: str) -> Path:
+    return ANALYTICS_DIR / f"{name}.csv"
+
+
+def source_key(stat) -> list:
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_pointer(name: str):
+    try:
+        return json.loads(pointer_path(name).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_pointer(name: str, pointer: dict):
+    tmp_pointer = pointer_path(name).with_suffix(".json.tmp")
+    tmp_pointer.write_text(json.dumps(pointer, indent=2))
+    os.replace(tmp_pointer, pointer_path(name))
+
+
+def build_dataset(csv_name: str, force: bool = False):
+    """Convert one CSV into a new cache version; returns the pointer, or None when missing"""
+    source = ANALYTICS_DIR / csv_name
+    if not source.exists():
+        return None
+    name = dataset_name(csv_name)
+    # Taken before hashing: a rewrite during the build leaves the pointer stale, never wrong
+    stat = source.stat()
+    version = file_hash(source)
+    current = read_pointer(name)
+    if current and current["version"] == version and (CACHE_DIR / current["file"]).exists() and not force:
+        if current.get("source") != source_key(stat):
+            # Same content rewritten: only the recorded source changes
+            current["source"] = source_key(stat)
+            write_pointer(name, current)
+        return current
+
+    # Dates stay strings, as the JSON endpoints pass them through unchanged
+    table = pa.Table.from_pandas(read_raw_csv(source, parse_dates=False), preserve_index=False)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    data_file = f"{name}-{version[:16]}.arrow"
+    tmp = CACHE_DIR / f"{data_file}.tmp"
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, CACHE_DIR / data_file)
+
+    previous = [current["file"], *current.get("previous", [])] if current else []
+    pointer = {
+        "version": version,
+        "file": data_file,
+        "rows": table.num_rows,
+        "built_at": datetime.utcnow().isoformat(),
+        "source": source_key(stat),
+        "previous": [f for f in previous if f != data_file][:KEEP_VERSIONS - 1],
+    }
+    write_pointer(name, pointer)
+
+    # Versions older than the ones still listed can no longer be picked up by a worker
+    keep = {data_file, *pointer["previous"]}
+    for old in CACHE_DIR.glob(f"{name}-*.arrow"):
+        if old.name not in keep:
+            old.unlink(missing_ok=True)
+    return pointer
+
+
+def build_all(force: bool = False) -> dict:
+    return {dataset_name(csv_name): build_dataset(csv_name, force) for csv_name in DATASETS}
+
+
+class SharedCache:
+    """Per-process view of the cache: memory-mapped tables, reopened on version swaps"""
+
+    def __init__(self):
+        self._open = {}
+
+    def lookup(self, name: str):
+        """(table, pointer) of the current version
+
+        None when the dataset is not cached or its CSV changed after the build.
+        """
+        try:
+            stat = pointer_path(name).stat()
+            source = source_path(name).stat()
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._open.get(name)
+        if entry is None or entry[0] != key:
+            pointer = read_pointer(name)
+            if pointer is None:
+                return None
+            table = None
+            if entry is not None and entry[2]["version"] == pointer["version"]:
+                table = entry[1]
+            entry = [key, table, pointer]
+            self._open[name] = entry
+        if entry[2].get("source") != source_key(source):
+            return None
+        if entry[1] is None:
+            mapped = pa.memory_map(str(CACHE_DIR / entry[2]["file"]), "r")
+            entry[1] = pa.ipc.open_file(mapped).read_all()
+        return entry[1], entry[2]
+
+    def frame(self, name: str):
+        """Dataset as a DataFrame backed by the mapped Arrow buffers, or None"""
+        found = self.lookup(name)
+        if found is None:
+            return None
+        return found[0].to_pandas(types_mapper=pd.ArrowDtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the shared Arrow cache of the API datasets")
+    parser.add_argument("--build", action="store_true", help="Convert changed analytics CSVs")
+    parser.add_argument("--force", action="store_true", help="Rebuild every dataset")
+    args = parser.parse_args()
+
+    if args.build or args.force:
+        for name, pointer in build_all(force=args.force).items():
+            if pointer is None:
+                print(f"   ⚠️  {name}: source CSV missing")
+            else:
+                print(f"   ✅ {name}: {pointer['rows']} rows ({pointer['file']})")
+    else:
+        cache = SharedCache()
+        for csv_name in DATASETS:
+            found = cache.lookup(dataset_name(csv_name))
+            status = f"{found[1]['rows']} rows, built {found[1]['built_at']}" if found else "not cached or stale"
+            print(f"   {dataset_name(csv_name):28} {status}")
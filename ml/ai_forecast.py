@@ -1,41 +1,93 @@
+import argparse
+import hashlib
 import pandas as pd
 from pathlib import Path
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 try:
     from statsmodels.tsa.statespace.sarimax import SARIMAX
 except Exception:
     SARIMAX = None
+try:
+    # Batched Holt-Winters, importable as ml.ets from the repo root
+    from ml.ets import forecast_frame
+except ImportError:
+    forecast_frame = None
+try:
+    from ml.order_selection import DEFAULT_ORDER, DEFAULT_SEASONAL_ORDER, get_orders
+except ImportError:
+    DEFAULT_ORDER, DEFAULT_SEASONAL_ORDER, get_orders = (1, 1, 1), (1, 0, 1, 7), None
+try:
+    # Available when run from the repo root (python -m ml.ai_forecast, API server)
+    from scripts.raw_reader import read_raw_csv
+except ImportError:
+    read_raw_csv = None
 
 DATA_RAW_DIR = Path("data/raw")
 OUTPUT_PATH = Path("data/processed/analytics/ai_forecast.csv")
+# Input version the current forecast was computed from
+VERSION_PATH = OUTPUT_PATH.with_suffix(".version.json")
 
-FORECAST_HORIZON = 30  # days
+FORECAST_HORIZON = 30  # steps at the sampling of the series (days or weeks)
 
 
-def load_latest_ai_series(keyword: str = "AI") -> pd.DataFrame:
-    # Load from the main trends file
+def latest_raw_file() -> Path:
     files = sorted(DATA_RAW_DIR.glob("google_trends_daily_*.csv"))
     if not files:
         raise FileNotFoundError("No daily raw file found")
-    latest = files[-1]
-    df = pd.read_csv(latest)
-    # Expect columns: date, keyword
-    if keyword not in df.columns:
-        raise ValueError(f"Keyword '{keyword}' not found in {latest}")
-    df['date'] = pd.to_datetime(df['date'])
+    return files[-1]
+
+
+def load_latest_series() -> pd.DataFrame:
+    # Every keyword of the latest raw file, wide format indexed by date
+    latest = latest_raw_file()
+    if read_raw_csv is not None:
+        df = read_raw_csv(latest)
+    else:
+        df = pd.read_csv(latest)
+        df['date'] = pd.to_datetime(df['date'])
+    df = df.drop(columns=['isPartial'], errors='ignore')
+    return df.sort_values('date').set_index('date')
+
+
+def load_latest_ai_series(keyword: str = "AI") -> pd.DataFrame:
+    # Load from the main trends file
+    latest = latest_raw_file()
+    if read_raw_csv is not None:
+        # Cached schema, fixed-format timestamps, only the two needed columns
+        try:
+            df = read_raw_csv(latest, columns=['date', keyword])
+        except KeyError:
+            raise ValueError(f"Keyword '{keyword}' not found in {latest}")
+    else:
+        df = pd.read_csv(latest)
+        # Expect columns: date, keyword
+        if keyword not in df.columns:
+            raise ValueError(f"Keyword '{keyword}' not found in {latest}")
+        df['date'] = pd.to_datetime(df['date'])
     df = df.sort_values('date')
     return df[['date', keyword]].rename(columns={keyword: 'value'})
 
 
+def sampling_step(dates: pd.Series) -> pd.Timedelta:
+    # Median spacing of the series, as ml.order_selection infers it (one day if unknown)
+    step = pd.to_datetime(pd.Series(dates)).sort_values().diff().median()
+    return pd.Timedelta(days=1) if pd.isna(step) else step
+
+
+def future_dates(dates: pd.Series, horizon: int = FORECAST_HORIZON) -> list:
+    # Continue the series at its median spacing
+    dates = pd.to_datetime(pd.Series(dates)).sort_values()
+    step = sampling_step(dates)
+    return [dates.iloc[-1] + step * i for i in range(1, horizon + 1)]
+
+
 def naive_forecast(df: pd.DataFrame) -> pd.DataFrame:
     # Seasonal naive weekly (repeat last 7) if length >= 7 else simple mean
     last_values = df['value'].tail(7).tolist()
     mean_val = df['value'].mean()
-    start_date = df['date'].max() + timedelta(days=1)
     rows = []
-    for i in range(FORECAST_HORIZON):
-        d = start_date + timedelta(days=i)
+    for i, d in enumerate(future_dates(df['date'])):
         if len(last_values) == 7:
             val = last_values[i % 7]
         else:
@@ -44,46 +96,113 @@ def naive_forecast(df: pd.DataFrame) -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
-def sarimax_forecast(df: pd.DataFrame) -> pd.DataFrame:
-    # Simple SARIMAX, fallback to naive if fails
+def sarimax_forecast(df: pd.DataFrame, order=DEFAULT_ORDER, seasonal_order=DEFAULT_SEASONAL_ORDER,
+                     fallback: bool = True) -> pd.DataFrame:
+    # SARIMAX with the given (or selected, see ml.order_selection) orders, fallback to naive if fails
+    # (fallback=False raises instead, so ml.backtest never scores the naive model as SARIMAX)
     try:
         if SARIMAX is None:
             raise RuntimeError("statsmodels not available")
         series = df.set_index('date')['value']
-        # Basic differencing to handle potential trend
-        model = SARIMAX(series, order=(1,1,1), seasonal_order=(1,0,1,7), enforce_stationarity=False, enforce_invertibility=False)
+        model = SARIMAX(series.to_numpy(dtype=float), order=order, seasonal_order=seasonal_order,
+                        enforce_stationarity=False, enforce_invertibility=False)
         res = model.fit(disp=False)
-        future_index = [series.index.max() + timedelta(days=i) for i in range(1, FORECAST_HORIZON+1)]
+        future_index = future_dates(df['date'])
         forecast = res.get_forecast(steps=FORECAST_HORIZON)
         mean = forecast.predicted_mean
         conf_int = forecast.conf_int(alpha=0.2)  # 80% interval
         out_rows = []
-        for d in future_index:
-            val = float(mean.loc[d])
-            lower = float(conf_int.loc[d][0])
-            upper = float(conf_int.loc[d][1])
-            out_rows.append({'date': d, 'forecast': val, 'lower80': lower, 'upper80': upper})
+        for i, d in enumerate(future_index):
+            out_rows.append({'date': d, 'forecast': float(mean[i]),
+                             'lower80': float(conf_int[i][0]), 'upper80': float(conf_int[i][1])})
         return pd.DataFrame(out_rows)
     except Exception:
-        nf = naive_forecast(df)
-        nf['lower80'] = nf['forecast'] * 0.9
-        nf['upper80'] = nf['forecast'] * 1.1
-        return nf
+        if not fallback:
+            raise
+        return banded_naive_forecast(df)
+
+
+def with_fixed_band(fc: pd.DataFrame) -> pd.DataFrame:
+    # Simple ±10% band for forecasters without a variance model
+    fc['lower80'] = fc['forecast'] * 0.9
+    fc['upper80'] = fc['forecast'] * 1.1
+    return fc
+
+
+def banded_naive_forecast(df: pd.DataFrame) -> pd.DataFrame:
+    return with_fixed_band(naive_forecast(df))
+
+
+def heuristic_forecast(df: pd.DataFrame) -> pd.DataFrame:
+    # Adapted from transform_to_postgres.generate_forecast: weekly pattern of
+    # the last 7 points plus the average slope of the last 12, dated at the
+    # series' own step (generate_forecast assumes daily points)
+    recent = df.tail(12)
+    if len(recent) < 7:
+        return banded_naive_forecast(df)
+    last_values = recent['value'].tail(7).values
+    trend = (recent['value'].iloc[-1] - recent['value'].iloc[0]) / len(recent)
+    rows = []
+    for i, d in enumerate(future_dates(df['date']), start=1):
+        rows.append({'date': d, 'forecast': float(last_values[i % 7] + trend * i)})
+    return with_fixed_band(pd.DataFrame(rows))
+
+
+def ets_forecast(df: pd.DataFrame) -> pd.DataFrame:
+    # Additive Holt-Winters with damped trend, season inferred from the sampling, 80% intervals
+    if forecast_frame is None or len(df) < 3:
+        return sarimax_forecast(df)
+    wide = df.set_index('date')[['value']]
+    fc = forecast_frame(wide, FORECAST_HORIZON)
+    return fc.drop(columns=['keyword'])
+
+
+FORECASTERS = {
+    'sarimax': sarimax_forecast,
+    'ets': ets_forecast,
+    'naive': banded_naive_forecast,
+    'heuristic': heuristic_forecast,
+}
+
+
+def series_version(df: pd.DataFrame, model: str = 'sarimax') -> str:
+    # Content hash of the input series plus the forecast settings
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(str(FORECAST_HORIZON).encode())
+    if model != 'sarimax':
+        digest.update(model.encode())
+    return digest.hexdigest()
 
 
-def build_and_save_forecast() -> str:
+def build_and_save_forecast(force: bool = False, model: str = 'sarimax') -> str:
     df = load_latest_ai_series()
-    fc = sarimax_forecast(df)
+    version = series_version(df, model)
+    if not force and OUTPUT_PATH.exists() and VERSION_PATH.exists():
+        if json.loads(VERSION_PATH.read_text()).get('input_version') == version:
+            print("Input series unchanged, keeping existing forecast")
+            return str(OUTPUT_PATH)
+    if model == 'sarimax' and SARIMAX is not None and get_orders is not None:
+        # Cached per-keyword order, searched again only when the series drifted
+        order, seasonal_order = get_orders({'AI': df})['AI']
+        fc = sarimax_forecast(df, order, seasonal_order)
+    else:
+        fc = FORECASTERS[model](df)
     fc.to_csv(OUTPUT_PATH, index=False)
+    VERSION_PATH.write_text(json.dumps({
+        'input_version': version,
+        'generated_at': datetime.utcnow().isoformat()
+    }))
     return str(OUTPUT_PATH)
 
 
-def as_json() -> str:
+def as_json(model: str = 'sarimax') -> str:
     df = load_latest_ai_series()
-    fc = sarimax_forecast(df)
+    fc = FORECASTERS[model](df)
     return json.dumps({
         'generated_at': datetime.utcnow().isoformat(),
-        'horizon_days': FORECAST_HORIZON,
+        # The horizon counts steps of the series (see future_dates), not days
+        'horizon_steps': FORECAST_HORIZON,
+        'step_days': sampling_step(df['date']) / pd.Timedelta(days=1),
         'points': [
             {
                 'date': r['date'].strftime('%Y-%m-%d'),
@@ -95,5 +214,11 @@ def as_json() -> str:
     })
 
 if __name__ == '__main__':
-    path = build_and_save_forecast()
+    parser = argparse.ArgumentParser(description="AI forecast from the latest raw trends file")
+    parser.add_argument('--force', action='store_true', help="Recompute even if the input series is unchanged")
+    parser.add_argument('--model', choices=sorted(FORECASTERS), default='sarimax',
+                        help="sarimax (per series, statsmodels), ets (batched Holt-Winters, NumPy only), "
+                             "naive or heuristic; compare them with python -m ml.backtest")
+    args = parser.parse_args()
+    path = build_and_save_forecast(force=args.force, model=args.model)
     print(f"Forecast saved to {path}")
@@ -0,0 +1,249 @@
+"""
+Rolling-origin backtest of the forecast models
+
+For every keyword of the latest raw file and every origin, each model is fit
+on the points up to the origin and scored on the next `horizon` points
+(MAPE, coverage of the 80% band, fit latency). SARIMAX orders are selected on
+each training window too, so no origin sees its future, and a failed SARIMAX
+fit is reported rather than scored as its naive fallback. Tasks run in a
+process pool; each (model, training window) result is pickled in
+data/processed/backtest_cache so reruns only fit new origins.
+
+    python -m ml.backtest --models sarimax ets naive heuristic --origins 6 --to-db
+"""
+import argparse
+import hashlib
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ml.ai_forecast import FORECASTERS, SARIMAX, load_latest_series
+from ml.order_selection import select_orders
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values
+except ImportError:
+    psycopg2 = None
+
+CACHE_DIR = Path("data/processed/backtest_cache")
+OUTPUT_PATH = Path("data/processed/analytics/forecast_backtest.csv")
+DETAIL_PATH = Path("data/processed/analytics/forecast_backtest_origins.csv")
+# Bump to invalidate cached results when a model implementation changes
+CACHE_VERSION = 4
+MIN_TRAIN_POINTS = 14
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+
+def cache_path(model: str, train: pd.DataFrame, params: dict) -> Path:
+    # Keyed on the model, its parameters and the exact training window, not on the keyword name
+    digest = hashlib.sha256(f"{CACHE_VERSION}|{model}|{sorted(params.items())}|".encode())
+    digest.update(pd.util.hash_pandas_object(train, index=False).values.tobytes())
+    return CACHE_DIR / model / f"{digest.hexdigest()[:32]}.pkl"
+
+
+def save_result(path: Path, result) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(result, f)
+    tmp.replace(path)
+
+
+def fit_forecast(model: str, train: pd.DataFrame, params: dict, path: Path) -> dict:
+    # Runs in a worker process: fit, time and cache one training window
+    start = time.perf_counter()
+    fc = FORECASTERS[model](train.copy(), **params)
+    result = {'forecast': fc, 'fit_seconds': time.perf_counter() - start}
+    save_result(path, result)
+    return result
+
+
+def load_cached(path: Path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def origin_positions(n_points: int, horizon: int, n_origins: int, step: int) -> list:
+    # Last origin leaves exactly `horizon` points to score, earlier ones go back by `step`
+    last = n_points - horizon
+    positions = [last - i * step for i in range(n_origins)]
+    return sorted(p for p in positions if p >= MIN_TRAIN_POINTS)
+
+
+def score(fc: pd.DataFrame, actual: pd.DataFrame) -> dict:
+    # Forecast steps are matched to the next points positionally (the models
+    # emit one row per step of the series' own sampling)
+    steps = min(len(fc), len(actual))
+    y = actual['value'].to_numpy(dtype=float)[:steps]
+    pred = fc['forecast'].to_numpy(dtype=float)[:steps]
+    lower = fc['lower80'].to_numpy(dtype=float)[:steps]
+    upper = fc['upper80'].to_numpy(dtype=float)[:steps]
+    nonzero = y != 0
+    mape = float(np.mean(np.abs((y[nonzero] - pred[nonzero]) / y[nonzero])) * 100) if nonzero.any() else np.nan
+    coverage = float(np.mean((y >= lower) & (y <= upper)) * 100)
+    return {'steps': steps, 'mape': mape, 'coverage80': coverage}
+
+
+def run_backtest(wide: pd.DataFrame, models: list, horizon: int, n_origins: int, step: int,
+                 workers: int) -> pd.DataFrame:
+    series_by_keyword = {}
+    for keyword in wide.columns:
+        series = wide[keyword].dropna().reset_index()
+        series.columns = ['date', 'value']
+        series_by_keyword[keyword] = series
+
+    tasks = []
+    for keyword, series in series_by_keyword.items():
+        for pos in origin_positions(len(series), horizon, n_origins, step):
+            train = series.iloc[:pos].reset_index(drop=True)
+            actual = series.iloc[pos:pos + horizon]
+            for model in models:
+                tasks.append((model, keyword, train, actual))
+
+    orders = {}
+    if 'sarimax' in models:
+        if SARIMAX is None:
+            raise RuntimeError("statsmodels is required to backtest sarimax")
+        orders = origin_orders([train for model, _, train, _ in tasks if model == 'sarimax'], workers)
+
+    rows = []
+    pending = {}
+    cached = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for model, keyword, train, actual in tasks:
+            params = {}
+            if model == 'sarimax':
+                # Without the naive fallback: a failed fit is reported, not scored
+                params = {**orders[cache_path('orders', train, {})], 'fallback': False}
+            path = cache_path(model, train, params)
+            result = load_cached(path)
+            if result is not None:
+                cached += 1
+                rows.append(make_row(model, keyword, train, actual, result, cached=True))
+            else:
+                future = pool.submit(fit_forecast, model, train, params, path)
+                pending[future] = (model, keyword, train, actual)
+        for future in as_completed(pending):
+            model, keyword, train, actual = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"   ❌ {model} / {keyword} @ {train['date'].max():%Y-%m-%d}: {str(e)}")
+                continue
+            rows.append(make_row(model, keyword, train, actual, result, cached=False))
+
+    print(f"   {len(tasks)} fits: {cached} from cache, {len(pending)} computed")
+    return pd.DataFrame(rows)
+
+
+def origin_orders(trains: list, workers: int) -> dict:
+    """SARIMAX orders selected on each training window only, keyed by its cache path"""
+    orders = {}
+    to_select = {}
+    for train in trains:
+        path = cache_path('orders', train, {})
+        choice = load_cached(path)
+        if choice is None:
+            to_select[path] = train
+        else:
+            orders[path] = choice
+    if to_select:
+        # All windows are searched in one pool, like keywords in ml.order_selection
+        for path, choice in select_orders(to_select, workers=workers).items():
+            orders[path] = {'order': tuple(choice['order']), 'seasonal_order': tuple(choice['seasonal_order'])}
+            save_result(path, orders[path])
+    print(f"   SARIMAX orders: {len(trains) - len(to_select)} from cache, {len(to_select)} selected")
+    return orders
+
+
+def make_row(model, keyword, train, actual, result, cached):
+    return {
+        'model': model,
+        'keyword': keyword,
+        'origin': train['date'].max(),
+        'train_points': len(train),
+        'fit_seconds': result['fit_seconds'],
+        'cached': cached,
+        **score(result['forecast'], actual),
+    }
+
+
+def summarize(detail: pd.DataFrame) -> pd.DataFrame:
+    summary = detail.groupby(['model', 'keyword']).agg(
+        origins=('origin', 'count'),
+        mape=('mape', 'mean'),
+        coverage80=('coverage80', 'mean'),
+        fit_seconds=('fit_seconds', 'mean'),
+    ).reset_index()
+    return summary.sort_values(['keyword', 'mape'])
+
+
+def save_to_db(summary: pd.DataFrame, horizon: int) -> None:
+    if psycopg2 is None:
+        raise RuntimeError("psycopg2 is required for --to-db")
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    records = [
+        (r.model, r.keyword, horizon, int(r.origins),
+         None if pd.isna(r.mape) else float(r.mape), float(r.coverage80), float(r.fit_seconds))
+        for r in summary.itertuples()
+    ]
+    execute_values(cursor, """
+        INSERT INTO forecast_backtest (model, keyword, horizon, origins, mape, coverage80, fit_seconds)
+        VALUES %s
+        ON CONFLICT (model, keyword, horizon)
+        DO UPDATE SET origins = EXCLUDED.origins,
+                     mape = EXCLUDED.mape,
+                     coverage80 = EXCLUDED.coverage80,
+                     fit_seconds = EXCLUDED.fit_seconds,
+                     evaluated_at = CURRENT_TIMESTAMP
+    """, records)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecast models")
+    parser.add_argument('--models', nargs='+', choices=sorted(FORECASTERS), default=sorted(FORECASTERS))
+    parser.add_argument('--keywords', nargs='+', help="Keywords to evaluate (default: all in the raw file)")
+    parser.add_argument('--horizon', type=int, default=8, help="Points scored after each origin")
+    parser.add_argument('--origins', type=int, default=6, help="Number of rolling origins")
+    parser.add_argument('--step', type=int, default=4, help="Points between consecutive origins")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--to-db', action='store_true', help="Upsert the summary into forecast_backtest")
+    args = parser.parse_args()
+
+    wide = load_latest_series()
+    if args.keywords:
+        wide = wide[args.keywords]
+    started = datetime.utcnow()
+    detail = run_backtest(wide, args.models, args.horizon, args.origins, args.step, args.workers)
+    if detail.empty:
+        raise SystemExit("Not enough data for any origin")
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    detail.to_csv(DETAIL_PATH, index=False)
+    summary = summarize(detail)
+    summary.to_csv(OUTPUT_PATH, index=False)
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"Backtest saved to {OUTPUT_PATH} ({(datetime.utcnow() - started).total_seconds():.1f}s)")
+    if args.to_db:
+        save_to_db(summary, args.horizon)
+        print("Summary upserted into forecast_backtest")
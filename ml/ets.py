@@ -0,0 +1,169 @@
+"""
+Batched additive Holt-Winters (ETS(A,Ad,A)) forecaster
+
+Fits many series at once: the smoothing recursions run over a
+(parameters x series) state array, so one pass over time evaluates every
+candidate (alpha, beta, gamma, phi) for every series. Each series keeps the
+candidate with the lowest one-step-ahead squared error, and 80% prediction
+intervals use the ETS(A,Ad,A) forecast variance
+
+    var(h) = sigma^2 * (1 + sum_{j<h} (alpha + beta * phi_j + gamma * [j % m == 0])^2)
+
+with phi_j = phi + ... + phi^j (Hyndman & Athanasopoulos, FPP3, ch. 8.7).
+
+forecast_frame() takes the season length and the forecast step from the
+sampling of the series (ml.order_selection.seasonal_period): weekly season
+for daily data, yearly season for weekly data with two years of history, and
+a non-seasonal damped trend (m = 1, gamma = 0) otherwise.
+"""
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from ml.order_selection import seasonal_period
+
+SEASON_LENGTH = 7  # weekly seasonality of daily data
+Z_80 = 1.2815515655446004  # standard normal quantile for an 80% interval
+
+# Candidate smoothing parameters, filtered by the usual admissibility rules
+ALPHAS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.7)
+BETA_RATIOS = (0.0, 0.05, 0.2)  # beta as a fraction of alpha
+GAMMAS = (0.0, 0.05, 0.15, 0.3)
+PHIS = (0.9, 0.98, 1.0)
+
+
+@dataclass
+class EtsFit:
+    """Selected parameters and final states for each series"""
+    alpha: np.ndarray
+    beta: np.ndarray
+    gamma: np.ndarray
+    phi: np.ndarray
+    level: np.ndarray
+    trend: np.ndarray
+    season: np.ndarray  # (series, m), season[:, k] applies k+1 steps ahead
+    sigma2: np.ndarray
+
+
+def parameter_grid(alphas=ALPHAS, beta_ratios=BETA_RATIOS, gammas=GAMMAS, phis=PHIS):
+    """(n_candidates, 4) array of admissible (alpha, beta, gamma, phi)"""
+    grid = [
+        (alpha, alpha * ratio, gamma, phi)
+        for alpha, ratio, gamma, phi in product(alphas, beta_ratios, gammas, phis)
+        if gamma < 1 - alpha and not (ratio == 0 and phi != 1.0)
+    ]
+    return np.array(grid, dtype=np.float64)
+
+
+def initial_states(y, m):
+    """Classical decomposition start values from the first two seasons (NaN aware)"""
+    first = np.nanmean(y[:, :m], axis=1)
+    if y.shape[1] >= 2 * m:
+        second = np.nanmean(y[:, m:2 * m], axis=1)
+        trend = (second - first) / m
+    else:
+        trend = np.zeros(len(y))
+    season = np.nan_to_num(y[:, :m] - first[:, None])
+    season -= season.mean(axis=1, keepdims=True)
+    return np.nan_to_num(first), np.nan_to_num(trend), season
+
+
+def fit_batch(y, m=SEASON_LENGTH, grid=None):
+    """Fit every series (rows of y, NaN = missing) on every candidate, keep the best
+
+    Missing points leave the states unchanged apart from the trend propagation.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    n_series, n_times = y.shape
+    if n_times < m + 2:
+        raise ValueError(f"Need at least {m + 2} points, got {n_times}")
+    grid = parameter_grid() if grid is None else grid
+    alpha, beta, gamma, phi = (grid[:, i, None] for i in range(4))
+
+    level0, trend0, season0 = initial_states(y, m)
+    n_params = len(grid)
+    level = np.broadcast_to(level0, (n_params, n_series)).copy()
+    trend = np.broadcast_to(trend0, (n_params, n_series)).copy()
+    # Ring buffer of the last m seasonal states, one contiguous block per slot
+    season = np.broadcast_to(season0.T[:, None, :], (m, n_params, n_series)).copy()
+    sse = np.zeros((n_params, n_series))
+    n_obs = np.zeros(n_series)
+    error = np.empty((n_params, n_series))
+
+    for t in range(n_times):
+        observed = ~np.isnan(y[:, t])
+        y_t = np.where(observed, y[:, t], 0.0)
+        trend *= phi
+        # One-step error; missing points get a zero error (states just propagate)
+        np.subtract(y_t, level, out=error)
+        error -= trend
+        error -= season[t % m]
+        error *= observed
+        sse += error * error
+        n_obs += observed
+        level += trend
+        level += alpha * error
+        trend += beta * error
+        season[t % m] += gamma * error
+
+    best = np.argmin(sse, axis=0)
+    cols = np.arange(n_series)
+    n_params_fitted = 4 + m
+    sigma2 = sse[best, cols] / np.maximum(n_obs - n_params_fitted, 1)
+
+    # Reorder the ring buffer so season[:, k] is the state used k+1 steps ahead
+    order = (n_times + np.arange(m)) % m
+    return EtsFit(
+        alpha=grid[best, 0], beta=grid[best, 1], gamma=grid[best, 2], phi=grid[best, 3],
+        level=level[best, cols], trend=trend[best, cols],
+        season=season[:, best, cols].T[:, order], sigma2=sigma2,
+    )
+
+
+def forecast_batch(fit, horizon, m=SEASON_LENGTH, z=Z_80):
+    """Point forecasts and prediction intervals, each of shape (series, horizon)"""
+    h = np.arange(1, horizon + 1)
+    # phi_h = phi + phi^2 + ... + phi^h
+    powers = fit.phi[:, None] ** h[None, :]
+    phi_h = np.cumsum(powers, axis=1)
+    mean = fit.level[:, None] + phi_h * fit.trend[:, None] + fit.season[:, (h - 1) % m]
+
+    # c_j for j = 1..h-1, variance multiplier 1 + cumulative sum of c_j^2
+    seasonal_hit = (h % m == 0).astype(np.float64)
+    c = fit.alpha[:, None] + fit.beta[:, None] * phi_h + fit.gamma[:, None] * seasonal_hit[None, :]
+    multiplier = 1 + np.concatenate([np.zeros((len(c), 1)), np.cumsum(c[:, :-1] ** 2, axis=1)], axis=1)
+    half_width = z * np.sqrt(fit.sigma2[:, None] * multiplier)
+    return mean, mean - half_width, mean + half_width
+
+
+def forecast_frame(wide, horizon, m=None):
+    """Forecast every column of a date-indexed frame, long output
+
+    Columns: keyword, date, forecast, lower80, upper80 (the ai_forecast format
+    plus the series name). Forecast dates continue the index at its median
+    spacing; m defaults to the season length inferred from that spacing.
+    """
+    wide = wide.sort_index()
+    dates = pd.Series(wide.index)
+    grid = None
+    if m is None:
+        m = seasonal_period(dates, len(wide))
+    if m is None:
+        # Too little history for a season: damped trend only
+        m, grid = 1, parameter_grid(gammas=(0.0,))
+    fit = fit_batch(wide.to_numpy(dtype=np.float64).T, m=m, grid=grid)
+    mean, lower, upper = forecast_batch(fit, horizon, m=m)
+    step = dates.diff().median()
+    if pd.isna(step):
+        step = pd.Timedelta(days=1)
+    start = wide.index.max()
+    dates = [start + step * i for i in range(1, horizon + 1)]
+    return pd.DataFrame({
+        'keyword': np.repeat(np.asarray(wide.columns, dtype=object), horizon),
+        'date': np.tile(np.asarray(dates, dtype='datetime64[ns]'), len(wide.columns)),
+        'forecast': mean.ravel(),
+        'lower80': lower.ravel(),
+        'upper80': upper.ravel(),
+    })
@@ -0,0 +1,251 @@
+"""
+SARIMAX order selection per keyword with a persisted choice cache
+
+The differencing order d is fixed first with a KPSS stationarity test (AIC
+values of models with different d are computed on different series and are
+not comparable). Candidate orders with that d are then evaluated by increasing
+complexity (p + q + P + Q), one level at a time for all keywords in a process
+pool. A keyword stops
+searching once `patience` consecutive levels fail to improve its best AIC.
+The chosen order is stored in data/processed/sarimax_orders.json together
+with a fingerprint of the series, and reused until a drift check (sampling
+change, level/scale shift, much longer history, age) asks for a new search.
+
+    python -m ml.order_selection --keywords AI "Data Science"
+"""
+import argparse
+import json
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    from statsmodels.tsa.stattools import kpss
+except Exception:
+    SARIMAX = kpss = None
+
+CACHE_PATH = Path("data/processed/sarimax_orders.json")
+
+DEFAULT_ORDER = (1, 1, 1)
+DEFAULT_SEASONAL_ORDER = (1, 0, 1, 7)
+
+MAX_P, MAX_D, MAX_Q = 2, 1, 2
+MAX_SEASONAL_P, MAX_SEASONAL_Q = 1, 1
+PATIENCE = 2  # complexity levels without AIC improvement before stopping
+KPSS_ALPHA = 0.05  # level-stationarity rejected below this p-value: difference once
+
+# Drift thresholds that trigger a new search
+MAX_AGE_DAYS = 30
+MAX_GROWTH = 0.25  # relative growth of the number of points
+MAX_MEAN_SHIFT = 1.0  # in units of the standard deviation at selection time
+MAX_STD_RATIO = 2.0
+
+
+def sampling_days(dates: pd.Series) -> float:
+    return float(pd.Series(pd.to_datetime(dates)).diff().median() / pd.Timedelta(days=1))
+
+
+def seasonal_period(dates: pd.Series, n_points: int):
+    # Weekly season for daily data, yearly season for weekly data only when at
+    # least two full years are available; None means non-seasonal
+    step = sampling_days(dates)
+    if step <= 1.5:
+        period = 7
+    elif 5 <= step <= 9:
+        period = 52
+    else:
+        return None
+    return period if n_points >= 2 * period + 2 else None
+
+
+def differencing_order(values: np.ndarray) -> int:
+    # Difference until KPSS no longer rejects level stationarity (as auto_arima
+    # does), at most MAX_D times; a series too short or constant to test stays at d=0
+    d = 0
+    while d < MAX_D:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                p_value = kpss(np.diff(values, n=d), regression='c', nlags='auto')[1]
+        except Exception:
+            break
+        if not p_value < KPSS_ALPHA:
+            break
+        d += 1
+    return d
+
+
+def candidate_orders(period, d: int):
+    # (level, order, seasonal_order) sorted by complexity, all with the same d
+    # so their AICs are comparable
+    seasonal = [(0, 0, 0, 0)]
+    if period:
+        seasonal = [(sp, 0, sq, period) for sp, sq in product(range(MAX_SEASONAL_P + 1), range(MAX_SEASONAL_Q + 1))]
+    candidates = []
+    for (p, q), s in product(product(range(MAX_P + 1), range(MAX_Q + 1)), seasonal):
+        candidates.append((p + q + s[0] + s[2], (p, d, q), s))
+    return sorted(candidates)
+
+
+def fit_aic(values: np.ndarray, order, seasonal_order) -> float:
+    # Runs in a worker process; a failed fit counts as +inf
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = SARIMAX(values, order=order, seasonal_order=seasonal_order,
+                            enforce_stationarity=False, enforce_invertibility=False)
+            return float(model.fit(disp=False).aic)
+    except Exception:
+        return float('inf')
+
+
+def fingerprint(df: pd.DataFrame) -> dict:
+    values = df['value'].astype(float)
+    return {
+        'n_points': int(len(df)),
+        'sampling_days': sampling_days(df['date']),
+        'mean': float(values.mean()),
+        'std': float(values.std() or 0.0),
+        'last_date': pd.to_datetime(df['date']).max().strftime('%Y-%m-%d'),
+    }
+
+
+def drift_reason(choice: dict, df: pd.DataFrame, now: datetime = None):
+    """Why the cached choice should be re-selected for this series (None if still valid)"""
+    now = now or datetime.utcnow()
+    old = choice['fingerprint']
+    new = fingerprint(df)
+    if 'd' not in choice:
+        return "selected without a differencing test"
+    if abs(new['sampling_days'] - old['sampling_days']) > 0.5:
+        return "sampling changed"
+    if now - datetime.fromisoformat(choice['selected_at']) > timedelta(days=MAX_AGE_DAYS):
+        return "selection too old"
+    if new['n_points'] > old['n_points'] * (1 + MAX_GROWTH):
+        return "history grew"
+    scale = old['std'] or 1.0
+    if abs(new['mean'] - old['mean']) > MAX_MEAN_SHIFT * scale:
+        return "level shift"
+    if old['std'] and not (1 / MAX_STD_RATIO <= (new['std'] or 0.0) / old['std'] <= MAX_STD_RATIO):
+        return "scale change"
+    return None
+
+
+def load_cache() -> dict:
+    if CACHE_PATH.exists():
+        return json.loads(CACHE_PATH.read_text())
+    return {}
+
+
+def save_cache(cache: dict) -> None:
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_PATH.with_suffix('.tmp')
+    tmp.write_text(json.dumps(cache, indent=2, sort_keys=True))
+    tmp.replace(CACHE_PATH)
+
+
+def select_orders(series: dict, workers: int = None, patience: int = PATIENCE) -> dict:
+    """Search orders for {keyword: df(date, value)}, all keywords in one pool"""
+    if SARIMAX is None:
+        raise RuntimeError("statsmodels is required for order selection")
+    state = {}
+    for keyword, df in series.items():
+        values = df['value'].to_numpy(dtype=float)
+        period = seasonal_period(df['date'], len(df))
+        d = differencing_order(values)
+        levels = {}
+        for level, order, seasonal in candidate_orders(period, d):
+            levels.setdefault(level, []).append((order, seasonal))
+        state[keyword] = {
+            'values': values,
+            'd': d,
+            'levels': [levels[k] for k in sorted(levels)],
+            'best': (float('inf'), DEFAULT_ORDER[:1] + (d,) + DEFAULT_ORDER[2:], (0, 0, 0, 0)),
+            'stale': 0,
+            'fits': 0,
+        }
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        level = 0
+        while True:
+            active = [k for k, s in state.items() if s['stale'] < patience and level < len(s['levels'])]
+            if not active:
+                break
+            futures = {
+                (keyword, order, seasonal): pool.submit(fit_aic, state[keyword]['values'], order, seasonal)
+                for keyword in active
+                for order, seasonal in state[keyword]['levels'][level]
+            }
+            for keyword in active:
+                s = state[keyword]
+                improved = False
+                for order, seasonal in s['levels'][level]:
+                    aic = futures[(keyword, order, seasonal)].result()
+                    s['fits'] += 1
+                    if aic < s['best'][0]:
+                        s['best'] = (aic, order, seasonal)
+                        improved = True
+                s['stale'] = 0 if improved else s['stale'] + 1
+            level += 1
+
+    now = datetime.utcnow().isoformat()
+    return {
+        keyword: {
+            'order': list(s['best'][1]),
+            'seasonal_order': list(s['best'][2]),
+            'd': s['d'],
+            'aic': s['best'][0],
+            'fits': s['fits'],
+            'selected_at': now,
+            'fingerprint': fingerprint(series[keyword]),
+        }
+        for keyword, s in state.items()
+    }
+
+
+def get_orders(series: dict, workers: int = None, force: bool = False) -> dict:
+    """Cached (order, seasonal_order) per keyword, searching only where needed"""
+    cache = load_cache()
+    to_select = {}
+    for keyword, df in series.items():
+        choice = cache.get(keyword)
+        reason = "forced" if force else ("no cached order" if choice is None else drift_reason(choice, df))
+        if reason:
+            print(f"   🔎 {keyword}: selecting order ({reason})")
+            to_select[keyword] = df
+    if to_select:
+        cache.update(select_orders(to_select, workers=workers))
+        save_cache(cache)
+    return {
+        keyword: (tuple(cache[keyword]['order']), tuple(cache[keyword]['seasonal_order']))
+        for keyword in series
+    }
+
+
+if __name__ == '__main__':
+    from ml.ai_forecast import load_latest_series
+
+    parser = argparse.ArgumentParser(description="Select SARIMAX orders per keyword")
+    parser.add_argument('--keywords', nargs='+', help="Keywords to select (default: all in the raw file)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Search again even without drift")
+    args = parser.parse_args()
+
+    wide = load_latest_series()
+    keywords = args.keywords or list(wide.columns)
+    series = {}
+    for keyword in keywords:
+        df = wide[keyword].dropna().reset_index()
+        df.columns = ['date', 'value']
+        series[keyword] = df
+    orders = get_orders(series, workers=args.workers, force=args.force)
+    cache = load_cache()
+    for keyword, (order, seasonal) in orders.items():
+        print(f"{keyword}: order={order} seasonal_order={seasonal} "
+              f"AIC={cache[keyword]['aic']:.1f} ({cache[keyword]['fits']} fits)")
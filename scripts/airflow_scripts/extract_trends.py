@@ -9,6 +9,8 @@ from pytrends.request import TrendReq
 from pytrends import exceptions as pytrends_exc
 import os
 
+from resampling import GRANULARITIES, ResampleCache, aggregate, bucket_labels
+
 KEYWORDS = [
     "ChatGPT",
     "AI",
@@ -70,13 +72,20 @@ def fetch_trends(keywords: List[str], timeframe: str = "today 12-m", verify: boo
     merged.index.name = "date"
     return merged
 
-def transform_granularity(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
-    if granularity == "daily":
-        return df
-    if granularity == "weekly":
-        # Moyenne par semaine (semaine se terminant le dimanche)
-        return df.resample("W").mean().dropna(how="all")
-    raise ValueError("Granularité non supportée. Choisir 'daily' ou 'weekly'.")
+def transform_granularity(df: pd.DataFrame, granularity: str, cache_dir: Path | None = None) -> pd.DataFrame:
+    """Agrège en daily/weekly/monthly/quarterly (buckets étiquetés par leur dernier jour).
+
+    Avec `cache_dir`, l'extrait est fusionné dans le cache partitionné et seuls les
+    buckets touchés sont recalculés ; l'agrégat renvoyé couvre la plage de l'extrait.
+    """
+    if cache_dir is None:
+        return aggregate(df, granularity)
+    cache = ResampleCache(cache_dir)
+    stats = cache.update(df)
+    print(f"[INFO] Cache agrégats mis à jour (buckets recalculés): {stats}")
+    start = pd.Timestamp(df.index.min()).normalize()
+    end = bucket_labels(pd.DatetimeIndex([df.index.max()]), granularity)[0]
+    return cache.load(granularity, start, end)
 
 def write_output(df: pd.DataFrame, out_dir: Path, granularity: str, formats: List[str]) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -98,13 +107,14 @@ def write_output(df: pd.DataFrame, out_dir: Path, granularity: str, formats: Lis
 
 def main():
     parser = argparse.ArgumentParser(description="Extraction Google Trends pour mots-clés data.")
-    parser.add_argument("--granularity", "-g", choices=["daily", "weekly"], default="daily", help="Granularité de sortie.")
+    parser.add_argument("--granularity", "-g", choices=list(GRANULARITIES), default="daily", help="Granularité de sortie.")
     parser.add_argument("--format", "-f", choices=["csv", "parquet", "both"], default="both", help="Format de sortie.")
     parser.add_argument("--out", "-o", default="data/raw", help="Répertoire de sortie.")
     parser.add_argument("--timeframe", "-t", default="today 12-m", help="Fenêtre temporelle Pytrends (ex: 'today 12-m').")
     parser.add_argument("--keywords", "-k", nargs="*", default=KEYWORDS, help="Liste de mots-clés à extraire.")
     parser.add_argument("--insecure", action="store_true", help="Désactive la vérification SSL (environnement avec proxy intercept).")
     parser.add_argument("--ca-bundle", dest="ca_bundle", help="Chemin fichier CA bundle à utiliser pour requests.")
+    parser.add_argument("--cache-dir", type=Path, help="Cache d'agrégats partitionné (mise à jour incrémentale).")
 
     args = parser.parse_args()
 
@@ -119,7 +129,7 @@ def main():
     else:
         verify = True
     df = fetch_trends(args.keywords, timeframe=args.timeframe, verify=verify)
-    df = transform_granularity(df, args.granularity)
+    df = transform_granularity(df, args.granularity, args.cache_dir)
 
     formats = ["csv", "parquet"] if args.format == "both" else [args.format]
     write_output(df, Path(args.out), args.granularity, formats)
@@ -0,0 +1,173 @@
+"""Moteur de rééchantillonnage multi-granularité avec cache partitionné.
+
+Les séries (format large : index date, une colonne par mot-clé) sont agrégées
+en daily/weekly/monthly/quarterly. Chaque granularité est stockée en partitions
+annuelles sur disque ; lorsqu'un nouvel extrait arrive, seuls les buckets
+contenant des points nouveaux ou modifiés sont recalculés.
+
+Les fenêtres glissantes sont exprimées en unités de temps ("28D") et converties
+en nombre de buckets selon la granularité.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+# Fréquence de période pandas par granularité. Les buckets sont étiquetés par
+# leur dernier jour (comme resample("W") : semaine se terminant le dimanche).
+GRANULARITIES: Dict[str, str] = {
+    "daily": "D",
+    "weekly": "W-SUN",
+    "monthly": "M",
+    "quarterly": "Q-DEC",
+}
+
+# Durée moyenne d'un bucket, pour convertir une fenêtre temporelle en périodes.
+BUCKET_LENGTH: Dict[str, pd.Timedelta] = {
+    "daily": pd.Timedelta(days=1),
+    "weekly": pd.Timedelta(days=7),
+    "monthly": pd.Timedelta(days=365.25 / 12),
+    "quarterly": pd.Timedelta(days=365.25 / 4),
+}
+
+
+def _check_granularity(granularity: str) -> None:
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularité non supportée: {granularity}. Choisir parmi {list(GRANULARITIES)}.")
+
+
+def bucket_labels(index: pd.DatetimeIndex, granularity: str) -> pd.DatetimeIndex:
+    """Étiquette (dernier jour du bucket) de chaque date."""
+    _check_granularity(granularity)
+    if granularity == "daily":
+        return index.normalize()
+    return index.to_period(GRANULARITIES[granularity]).end_time.normalize()
+
+
+def aggregate(df: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    """Moyenne par bucket ; 'daily' renvoie la série inchangée."""
+    _check_granularity(granularity)
+    if granularity == "daily":
+        return df
+    out = df.groupby(bucket_labels(df.index, granularity)).mean().dropna(how="all")
+    out.index.name = df.index.name or "date"
+    return out
+
+
+def periods_in_window(window: str | pd.Timedelta, step: str | pd.Timedelta) -> int:
+    """Nombre de buckets couverts par une fenêtre temporelle (au moins 1).
+
+    `step` est une granularité ('weekly'...) ou l'écart entre deux points.
+    """
+    length = BUCKET_LENGTH[step] if step in BUCKET_LENGTH else pd.Timedelta(step)
+    return max(1, int(round(pd.Timedelta(window) / length)))
+
+
+def rolling_mean(series: pd.Series, window: str = "28D", min_periods: int = 1) -> pd.Series:
+    """Moyenne glissante sur une fenêtre temporelle, quel que soit l'espacement des points."""
+    return series.rolling(window, min_periods=min_periods).mean()
+
+
+class ResampleCache:
+    """Agrégats daily/weekly/monthly/quarterly persistés par partitions annuelles.
+
+    Structure : <cache_dir>/<granularité>/year=<YYYY>.parquet (CSV si Parquet indisponible).
+    La granularité 'daily' contient les points bruts, base de tous les recalculs.
+    """
+
+    def __init__(self, cache_dir: Path | str, granularities: Iterable[str] = tuple(GRANULARITIES)):
+        self.cache_dir = Path(cache_dir)
+        self.granularities = [g for g in granularities if g != "daily"]
+        for g in self.granularities:
+            _check_granularity(g)
+
+    # --------------------- Partitions --------------------- #
+
+    def _partition_path(self, granularity: str, year: int, suffix: str) -> Path:
+        return self.cache_dir / granularity / f"year={year}{suffix}"
+
+    def _read_partition(self, granularity: str, year: int) -> pd.DataFrame:
+        parquet_path = self._partition_path(granularity, year, ".parquet")
+        if parquet_path.exists():
+            return pd.read_parquet(parquet_path)
+        csv_path = self._partition_path(granularity, year, ".csv")
+        if csv_path.exists():
+            return pd.read_csv(csv_path, index_col="date", parse_dates=["date"])
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+
+    def _write_partition(self, granularity: str, year: int, df: pd.DataFrame) -> None:
+        parquet_path = self._partition_path(granularity, year, ".parquet")
+        parquet_path.parent.mkdir(parents=True, exist_ok=True)
+        df = df.sort_index()
+        df.index.name = "date"
+        try:
+            df.to_parquet(parquet_path)
+        except Exception as e:
+            print(f"[WARN] Echec écriture Parquet ({e}), repli CSV")
+            df.to_csv(self._partition_path(granularity, year, ".csv"))
+
+    def _read_years(self, granularity: str, years: Iterable[int]) -> pd.DataFrame:
+        frames = [self._read_partition(granularity, y) for y in sorted(set(years))]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        return pd.concat(frames).sort_index()
+
+    # --------------------- API --------------------- #
+
+    def update(self, df: pd.DataFrame) -> Dict[str, int]:
+        """Intègre un nouvel extrait et recalcule uniquement les buckets touchés.
+
+        Renvoie le nombre de buckets réécrits par granularité.
+        """
+        new = df.copy()
+        new.index = pd.DatetimeIndex(new.index).normalize()
+        new = new.groupby(level=0).mean()
+        new.index.name = "date"
+
+        years = new.index.year.unique()
+        existing = self._read_years("daily", years)
+        merged = new.combine_first(existing)
+
+        # Dates dont au moins une valeur est nouvelle ou différente
+        before = existing.reindex(index=merged.index, columns=merged.columns)
+        diff = ~((merged == before) | (merged.isna() & before.isna()))
+        changed = merged.index[diff.any(axis=1)]
+
+        stats = {"daily": len(changed)}
+        if changed.empty:
+            return {**stats, **{g: 0 for g in self.granularities}}
+
+        for year in changed.year.unique():
+            self._write_partition("daily", year, merged[merged.index.year == year])
+
+        for granularity in self.granularities:
+            labels = bucket_labels(changed, granularity).unique()
+            periods = labels.to_period(GRANULARITIES[granularity])
+            # Un bucket (semaine) peut chevaucher deux années : relire toutes les années couvertes
+            span = set(periods.start_time.year) | set(periods.end_time.year)
+            base = self._read_years("daily", span)
+            base = base[bucket_labels(base.index, granularity).isin(labels)]
+            fresh = aggregate(base, granularity)
+
+            for year in labels.year.unique():
+                part = self._read_partition(granularity, year)
+                part = part[~part.index.isin(labels)]
+                part = pd.concat([part, fresh[fresh.index.year == year]])
+                self._write_partition(granularity, year, part)
+            stats[granularity] = len(labels)
+        return stats
+
+    def load(self, granularity: str, start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """Lit une granularité (toutes années ou plage [start, end])."""
+        _check_granularity(granularity)
+        directory = self.cache_dir / granularity
+        years: List[int] = sorted({int(p.stem.split("=")[1]) for p in directory.glob("year=*")})
+        if start is not None:
+            years = [y for y in years if y >= pd.Timestamp(start).year]
+        if end is not None:
+            years = [y for y in years if y <= pd.Timestamp(end).year]
+        df = self._read_years(granularity, years)
+        return df.loc[start:end] if (start or end) else df
@@ -16,11 +16,15 @@ from datetime import datetime
 from pathlib import Path
 from typing import List
 
+import numpy as np
 import pandas as pd
 from pytrends.request import TrendReq
 import argparse
 import statistics
 
+from resampling import periods_in_window
+from rolling_zscore import rolling_zscore
+
 OUTPUT_DIR = Path("data/processed/analytics")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 TIMEFRAME = "today 12-m"
@@ -46,11 +50,12 @@ def fetch_time_series(client: TrendReq, keyword: str, geo: str | None = None) ->
     df.index.name = "date"
     return df.rename(columns={keyword: "value"}).reset_index()
 
-def fetch_region(client: TrendReq, keyword: str, resolution: str = "COUNTRY") -> pd.DataFrame:
-    client.build_payload([keyword], timeframe=TIMEFRAME)
+def fetch_region(client: TrendReq, keyword: str, resolution: str = "COUNTRY", geo: str = "") -> pd.DataFrame:
+    """Intérêt par zone. `resolution` REGION/CITY s'utilise avec `geo` = code pays (ex: 'FR')."""
+    client.build_payload([keyword], timeframe=TIMEFRAME, geo=geo)
     df = client.interest_by_region(resolution=resolution, inc_low_vol=True, inc_geo_code=False)
     if df.empty:
-        raise ValueError(f"Aucune donnée région pour {keyword}.")
+        raise ValueError(f"Aucune donnée région pour {keyword} (resolution={resolution}, geo={geo or 'monde'}).")
     return df.sort_values(keyword, ascending=False).reset_index().rename(columns={"geoName": "region", keyword: "value"})
 
 # --------------------- Analytics --------------------- #
@@ -79,17 +84,24 @@ def airflow_evolution(df: pd.DataFrame, keyword: str = "airflow") -> pd.DataFram
     pd.merge(df_sorted, rolling_4w, on="date", how="left").to_csv(out_series, index=False)
     return summary
 
-def detect_peaks(df: pd.DataFrame, window: int = 4, z_threshold: float = 1.5) -> pd.DataFrame:
+def detect_peaks(df: pd.DataFrame, window: str = "28D", z_threshold: float = 1.5) -> pd.DataFrame:
+    """Pics par z-score sur une fenêtre temporelle, valable quelle que soit la granularité.
+
+    Comme l'ancienne fenêtre de 4 points, le z-score n'est calculé qu'une fois la
+    fenêtre complète (nombre de points attendu selon l'espacement de la série).
+    """
     s = df.sort_values("date").set_index("date")["value"]
-    roll_mean = s.rolling(window).mean()
-    roll_std = s.rolling(window).std()
-    z_scores = (s - roll_mean) / roll_std
-    peaks = s[(z_scores > z_threshold)].reset_index().rename(columns={"value": "peak_value"})
-    peaks["z_score"] = z_scores[peaks.index].values
+    step = s.index.to_series().diff().median()
+    min_periods = periods_in_window(window, step) if pd.notna(step) else 1
+    z_scores = rolling_zscore(s.to_numpy(dtype=float), s.index, window=window, min_periods=min_periods).z[0]
+    with np.errstate(invalid="ignore"):
+        is_peak = z_scores > z_threshold
+    peaks = s[is_peak].reset_index().rename(columns={"value": "peak_value"})
+    peaks["z_score"] = z_scores[is_peak]
     return peaks
 
 def databricks_peaks(df: pd.DataFrame, keyword: str = "databricks") -> pd.DataFrame:
-    peaks = detect_peaks(df, window=4, z_threshold=1.5)
+    peaks = detect_peaks(df, window="28D", z_threshold=1.5)
     top = peaks.sort_values("peak_value", ascending=False).head(10)
     out_file = OUTPUT_DIR / f"{keyword}_peaks.csv"
     top.to_csv(out_file, index=False)
@@ -111,7 +123,7 @@ def data_engineering_fr_vs_us(fr_df: pd.DataFrame, us_df: pd.DataFrame, keyword:
     return merged
 
 def data_quality_peaks(df: pd.DataFrame, keyword: str = "data_quality") -> pd.DataFrame:
-    peaks = detect_peaks(df, window=4, z_threshold=1.5)
+    peaks = detect_peaks(df, window="28D", z_threshold=1.5)
     out_file = OUTPUT_DIR / f"{keyword}_peaks.csv"
     peaks.to_csv(out_file, index=False)
     return peaks
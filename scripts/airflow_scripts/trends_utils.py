@@ -2,9 +2,17 @@
 from __future__ import annotations
 from datetime import datetime
 from pathlib import Path
+import uuid
 import pandas as pd
 from pytrends.request import TrendReq
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
 KEYWORDS = [
     "Airflow",
     "Databricks",
@@ -13,6 +21,13 @@ KEYWORDS = [
     "Data quality",
 ]
 
+PROCESSED_DIR = Path("data/processed")
+DATASET_NAME = "google_trends_all_daily"
+# Taille des blocs CSV lus en streaming (mémoire constante quelle que soit la taille des fichiers)
+CSV_BLOCK_SIZE = 4 << 20
+# Nombre de fichiers dans une partition au-delà duquel on compacte
+COMPACT_MIN_FILES = 8
+
 def extract_keyword(keyword: str) -> str:
     safe = keyword.lower().replace(" ", "_")
     pytrends = TrendReq(hl="en-US", tz=360, requests_args={"verify": False})
@@ -32,25 +47,100 @@ def extract_keyword(keyword: str) -> str:
     df.to_csv(out_path)
     return str(out_path)
 
+def _keyword_from_path(path: str) -> str:
+    return path.split("google_trends_")[1].split("_daily_")[0]
+
+def merged_schema() -> "pa.Schema":
+    """Schéma du dataset fusionné : keyword encodé en dictionnaire."""
+    return pa.schema([
+        ("date", pa.timestamp("us")),
+        ("value", pa.float64()),
+        ("keyword", pa.dictionary(pa.int32(), pa.string())),
+        ("ingestion_ts", pa.timestamp("us")),
+    ])
+
+def _keyword_batches(path: str, ingestion_ts: datetime):
+    """Lit un CSV mot-clé bloc par bloc et produit des record batches au schéma fusionné."""
+    keyword = _keyword_from_path(path)
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={"date": pa.timestamp("us")},
+            timestamp_parsers=[pa_csv.ISO8601],
+        ),
+    )
+    value_col = [name for name in reader.schema.names if name != "date"][0]
+    keyword_dict = pa.array([keyword], pa.string())
+    keyword_index = pa.scalar(0, pa.int32())
+    ts_scalar = pa.scalar(ingestion_ts, pa.timestamp("us"))
+    for batch in reader:
+        n = batch.num_rows
+        yield pa.RecordBatch.from_arrays(
+            [
+                batch.column("date"),
+                batch.column(value_col).cast(pa.float64()),
+                pa.DictionaryArray.from_arrays(pa.repeat(keyword_index, n), keyword_dict),
+                pa.repeat(ts_scalar, n),
+            ],
+            schema=merged_schema(),
+        )
+
+def compact_partition(partition_dir: Path, min_files: int = COMPACT_MIN_FILES) -> Path | None:
+    """Fusionne les petits fichiers d'une partition en un seul, en streaming.
+
+    Le nouveau fichier est écrit sous un nom temporaire puis renommé avant la
+    suppression des anciens : un lecteur voit toujours un jeu de données complet
+    (au pire des lignes en double pendant un instant, jamais de lignes manquantes).
+    """
+    parts = sorted(partition_dir.glob("part-*.parquet"))
+    if len(parts) < min_files:
+        return None
+    tmp_file = partition_dir / f".compact-{uuid.uuid4().hex}.parquet.tmp"
+    with pq.ParquetWriter(tmp_file, merged_schema(), compression="zstd", use_dictionary=["keyword"]) as writer:
+        for part in parts:
+            for batch in pq.ParquetFile(part).iter_batches():
+                writer.write_batch(batch)
+    out_file = partition_dir / f"part-compacted-{uuid.uuid4().hex}.parquet"
+    tmp_file.rename(out_file)
+    for part in parts:
+        part.unlink()
+    return out_file
+
 def merge_paths(paths: list[str], logical_date: str = None) -> str:
-    frames = []
-    for p in paths:
-        df_raw = pd.read_csv(p)
-        value_col = [c for c in df_raw.columns if c != "date"][0]
-        keyword = p.split("google_trends_")[1].split("_daily_")[0]
-        df_long = df_raw.rename(columns={value_col: "value"})
-        df_long["keyword"] = keyword
-        frames.append(df_long)
-    full = pd.concat(frames, ignore_index=True)
-    full["ingestion_ts"] = datetime.utcnow().isoformat()
-    processed_dir = Path("data/processed")
-    processed_dir.mkdir(parents=True, exist_ok=True)
-    logical_date = logical_date or datetime.utcnow().strftime("%Y%m%d")
-    out_file = processed_dir / f"google_trends_all_daily_{logical_date}.parquet"
-    try:
-        full.to_parquet(out_file)
-        return str(out_file)
-    except Exception:
-        csv_fallback = processed_dir / f"google_trends_all_daily_{logical_date}.csv"
-        full.to_csv(csv_fallback, index=False)
+    """Fusionne les CSV par mot-clé dans un dataset Parquet partitionné par date d'ingestion.
+
+    Chaque fichier est converti en record batches et ajouté via un ParquetWriter
+    incrémental : la mémoire reste constante quel que soit le nombre de mots-clés.
+    Sortie : data/processed/google_trends_all_daily/ingestion_date=YYYY-MM-DD/part-*.parquet
+    (append-only, compactée quand la partition accumule trop de petits fichiers).
+    Sans pyarrow, repli sur un CSV écrit fichier par fichier.
+    """
+    ingestion_ts = datetime.utcnow()
+    logical_date = logical_date or ingestion_ts.strftime("%Y%m%d")
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+
+    if pa is None:
+        csv_fallback = PROCESSED_DIR / f"{DATASET_NAME}_{logical_date}.csv"
+        for i, p in enumerate(paths):
+            df_raw = pd.read_csv(p)
+            value_col = [c for c in df_raw.columns if c != "date"][0]
+            df_long = df_raw.rename(columns={value_col: "value"})
+            df_long["keyword"] = _keyword_from_path(p)
+            df_long["ingestion_ts"] = ingestion_ts.isoformat()
+            df_long.to_csv(csv_fallback, index=False, mode="w" if i == 0 else "a", header=(i == 0))
         return str(csv_fallback)
+
+    partition_dir = PROCESSED_DIR / DATASET_NAME / f"ingestion_date={ingestion_ts:%Y-%m-%d}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    out_file = partition_dir / f"part-{logical_date}-{uuid.uuid4().hex[:8]}.parquet"
+    # Préfixe "." : ignoré par la découverte pyarrow.dataset tant qu'il est incomplet
+    tmp_file = partition_dir / f".{out_file.name}.tmp"
+    with pq.ParquetWriter(tmp_file, merged_schema(), compression="zstd", use_dictionary=["keyword"]) as writer:
+        for p in paths:
+            for batch in _keyword_batches(p, ingestion_ts):
+                writer.write_batch(batch)
+    tmp_file.rename(out_file)
+
+    compacted = compact_partition(partition_dir)
+    return str(compacted or out_file)
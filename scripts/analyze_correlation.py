@@ -3,6 +3,7 @@
 Analyse de corrélation entre ChatGPT et Data Engineering
 """
 import os
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -10,6 +11,9 @@ import psycopg2
 from scipy import stats
 import json
 
+from data_versions import input_version, is_up_to_date, record_version
+from correlation_significance import CACHE_VERSION, N_RESAMPLES, cached_test
+
 # Database connection
 DB_CONFIG = {
     'host': 'localhost',
@@ -49,7 +53,10 @@ def calculate_correlation_with_lags(series1, series2, max_lag=10):
     
     return best_corr, best_lag, correlations
 
-def analyze_chatgpt_dataeng_correlation():
+# Paramètres du test de significativité, inclus dans la version des entrées
+SIGNIFICANCE = {'max_lag': 10, 'method': 'permutation', 'n_resamples': N_RESAMPLES}
+
+def analyze_chatgpt_dataeng_correlation(force=False):
     """
     Analyze correlation between ChatGPT and Data Engineering trends
     """
@@ -59,11 +66,23 @@ def analyze_chatgpt_dataeng_correlation():
     
     conn = get_db_connection()
     
+    # Skip when neither series changed since the last analysis
+    computation = 'correlation:ChatGPT|Data Science'
+    cursor = conn.cursor()
+    version = input_version(cursor, [('ChatGPT', 'worldwide'), ('Data Science', 'worldwide')],
+                            params={**SIGNIFICANCE, 'cache_version': CACHE_VERSION})
+    up_to_date = not force and is_up_to_date(cursor, computation, version)
+    cursor.close()
+    if up_to_date:
+        print("\n⏭️  Données inchangées depuis la dernière analyse, rien à recalculer")
+        conn.close()
+        return
+    
     # Get ChatGPT data
     query_chatgpt = """
         SELECT date, value 
         FROM trends_raw 
-        WHERE keyword = 'ChatGPT' 
+        WHERE keyword = 'ChatGPT' AND region = 'worldwide'
         ORDER BY date
     """
     df_chatgpt = pd.read_sql(query_chatgpt, conn)
@@ -72,7 +91,7 @@ def analyze_chatgpt_dataeng_correlation():
     query_dataeng = """
         SELECT date, value 
         FROM trends_raw 
-        WHERE keyword = 'Data Science' 
+        WHERE keyword = 'Data Science' AND region = 'worldwide'
         ORDER BY date
     """
     df_dataeng = pd.read_sql(query_dataeng, conn)
@@ -101,7 +120,7 @@ def analyze_chatgpt_dataeng_correlation():
     best_corr, best_lag, all_correlations = calculate_correlation_with_lags(
         df_merged['value_chatgpt'].values,
         df_merged['value_dataeng'].values,
-        max_lag=10
+        max_lag=SIGNIFICANCE['max_lag']
     )
     
     print(f"   Meilleure corrélation: {best_corr:.3f}")
@@ -114,10 +133,18 @@ def analyze_chatgpt_dataeng_correlation():
     else:
         print(f"   → Évolution simultanée")
     
-    # Statistical significance
-    _, p_value = stats.pearsonr(df_merged['value_chatgpt'], df_merged['value_dataeng'])
-    print(f"\n📈 Significativité statistique:")
-    print(f"   p-value: {p_value:.4f}")
+    # Statistical significance: the lag was chosen among 21, so the test is on
+    # max |r| over all lags against block-permuted series (not pearsonr at lag 0)
+    _, p_value_zero_lag = stats.pearsonr(df_merged['value_chatgpt'], df_merged['value_dataeng'])
+    significance = cached_test(
+        'ChatGPT', 'Data Science',
+        df_merged['value_chatgpt'].values, df_merged['value_dataeng'].values,
+        **SIGNIFICANCE
+    )
+    p_value = significance['p_value']
+    print(f"\n📈 Significativité statistique (permutation par blocs, {significance['n_resamples']} tirages):")
+    print(f"   p-value (décalage optimal, corrigée): {p_value:.4f}")
+    print(f"   p-value pearsonr sans décalage: {p_value_zero_lag:.4f}")
     if p_value < 0.05:
         print(f"   ✅ Corrélation statistiquement significative (p < 0.05)")
     else:
@@ -171,6 +198,10 @@ def analyze_chatgpt_dataeng_correlation():
             "best": float(best_corr),
             "optimal_lag_weeks": int(best_lag),
             "p_value": float(p_value),
+            "p_value_method": "block_permutation_max_lag",
+            "p_value_zero_lag": float(p_value_zero_lag),
+            "block_length": int(significance['block_length']),
+            "n_resamples": int(significance['n_resamples']),
             "significant": bool(p_value < 0.05)
         },
         "growth_rates": {
@@ -215,11 +246,28 @@ def analyze_chatgpt_dataeng_correlation():
             analysis_date TIMESTAMP DEFAULT NOW()
         )
     """)
+    # One row per pair: drop the rows appended by earlier versions, keeping the latest
+    cursor.execute("SELECT to_regclass('keyword_correlations_pair') IS NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute("""
+            DELETE FROM keyword_correlations a
+            USING keyword_correlations b
+            WHERE a.keyword1 = b.keyword1 AND a.keyword2 = b.keyword2 AND a.id < b.id
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX keyword_correlations_pair ON keyword_correlations (keyword1, keyword2)
+        """)
     
     cursor.execute("""
         INSERT INTO keyword_correlations 
         (keyword1, keyword2, correlation_coefficient, optimal_lag_weeks, p_value, is_significant)
         VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (keyword1, keyword2)
+        DO UPDATE SET correlation_coefficient = EXCLUDED.correlation_coefficient,
+                     optimal_lag_weeks = EXCLUDED.optimal_lag_weeks,
+                     p_value = EXCLUDED.p_value,
+                     is_significant = EXCLUDED.is_significant,
+                     analysis_date = NOW()
     """, (
         'ChatGPT',
         'Data Science',
@@ -229,6 +277,7 @@ def analyze_chatgpt_dataeng_correlation():
         bool(p_value < 0.05)
     ))
     
+    record_version(cursor, computation, version)
     conn.commit()
     cursor.close()
     conn.close()
@@ -240,4 +289,7 @@ def analyze_chatgpt_dataeng_correlation():
     print(f"{'='*60}")
 
 if __name__ == "__main__":
-    analyze_chatgpt_dataeng_correlation()
+    parser = argparse.ArgumentParser(description="Analyse de corrélation ChatGPT vs Data Science")
+    parser.add_argument("--force", action="store_true", help="Recalculer même si les séries sont inchangées")
+    args = parser.parse_args()
+    analyze_chatgpt_dataeng_correlation(force=args.force)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark WAL volume of unconditional vs change-only upserts
+
+Loads a synthetic trends_raw-like table, then re-upserts the same window with
+only a small fraction of changed values, once with the historical
+unconditional ON CONFLICT DO UPDATE and once with the IS DISTINCT FROM guard
+used by the loaders. WAL is measured with pg_current_wal_lsn().
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import psycopg2
+
+from upsert import format_counts, upsert_rows
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+BENCH_TABLE = 'trends_raw_upsert_bench'
+
+UPSERT_QUERIES = {
+    'unconditional': f"""
+        INSERT INTO {BENCH_TABLE} (keyword, date, value, region)
+        VALUES %s
+        ON CONFLICT (keyword, date, region)
+        DO UPDATE SET value = EXCLUDED.value
+        RETURNING (xmax = 0)
+    """,
+    'changed-only': f"""
+        INSERT INTO {BENCH_TABLE} (keyword, date, value, region)
+        VALUES %s
+        ON CONFLICT (keyword, date, region)
+        DO UPDATE SET value = EXCLUDED.value
+        WHERE {BENCH_TABLE}.value IS DISTINCT FROM EXCLUDED.value
+        RETURNING (xmax = 0)
+    """,
+}
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def synthetic_records(keywords, days, seed=0):
+    """One year-like window of daily values per keyword"""
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=days)
+    return [(f"bench_{k}", start + timedelta(days=d), rng.randint(0, 100), 'worldwide')
+            for k in range(keywords) for d in range(days)]
+
+def changed_copy(records, fraction, seed=1):
+    """Same records with `fraction` of the values modified"""
+    rng = random.Random(seed)
+    return [(kw, d, (v + 1) % 101 if rng.random() < fraction else v, region)
+            for kw, d, v, region in records]
+
+def reset_table(cursor, records):
+    """Recreate the bench table (same indexes as trends_raw) loaded with `records`"""
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"CREATE TABLE {BENCH_TABLE} (LIKE trends_raw INCLUDING ALL)")
+    upsert_rows(cursor, UPSERT_QUERIES['unconditional'], records)
+    cursor.execute(f"VACUUM ANALYZE {BENCH_TABLE}")
+
+def run_mode(conn, mode, base, reload):
+    """Upsert `reload` over a fresh copy of `base`, return (counts, wal bytes, seconds)"""
+    cursor = conn.cursor()
+    reset_table(cursor, base)
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    start_lsn = cursor.fetchone()[0]
+    start = time.perf_counter()
+    counts = upsert_rows(cursor, UPSERT_QUERIES[mode], reload)
+    elapsed = time.perf_counter() - start
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (start_lsn,))
+    wal_bytes = int(cursor.fetchone()[0])
+
+    cursor.close()
+    return counts, wal_bytes, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare WAL generated by unconditional and change-only upserts')
+    parser.add_argument('--keywords', type=int, default=20,
+                       help='Number of synthetic series')
+    parser.add_argument('--days', type=int, default=365,
+                       help='Points per series (12-month daily window)')
+    parser.add_argument('--changed', type=float, default=0.02,
+                       help='Fraction of values that differ on reload')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🧪 Upsert WAL benchmark")
+    print("=" * 60)
+
+    base = synthetic_records(args.keywords, args.days)
+    reload = changed_copy(base, args.changed)
+    print(f"📊 {len(base)} rows, ~{args.changed:.0%} changed on reload\n")
+
+    conn = get_db_connection()
+    conn.autocommit = True
+    results = {}
+    try:
+        for mode in UPSERT_QUERIES:
+            counts, wal_bytes, elapsed = run_mode(conn, mode, base, reload)
+            results[mode] = wal_bytes
+            print(f"   {mode:15} {wal_bytes / 1024:10,.0f} KiB WAL  {elapsed:6.2f}s  ({format_counts(counts)})")
+    finally:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cursor.close()
+        conn.close()
+
+    if results.get('changed-only'):
+        ratio = results['unconditional'] / results['changed-only']
+        print(f"\n   ✅ Change-only upsert writes {ratio:.1f}x less WAL")
+
+if __name__ == '__main__':
+    main()
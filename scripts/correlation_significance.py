@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tests de significativité des corrélations décalées (permutation / bootstrap par blocs)
+
+Le décalage retenu par analyze_correlation.py maximise |r| sur ±max_lag : la
+p-value de pearsonr à décalage nul ne s'applique pas à ce choix. Ici la
+statistique testée est max |r| sur tous les décalages, recalculée sur des
+milliers de séries permutées par blocs (l'autocorrélation intra-bloc est
+conservée), ce qui corrige la sélection du décalage. Le bootstrap ne donne
+qu'un intervalle de confiance (décalage re-sélectionné dans chaque tirage),
+pas de p-value : il rééchantillonne sous l'alternative, pas sous H0.
+
+Les rééchantillonnages sont vectorisés (matrice permutations × temps), les
+paires sont réparties sur un pool de processus, et la graine est dérivée des
+noms de la paire : un même couple de séries donne toujours le même résultat,
+mis en cache dans data/processed/correlation_cache.
+"""
+import argparse
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+# Database connection
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+CACHE_DIR = Path('data/processed/correlation_cache')
+N_RESAMPLES = 5000
+CHUNK_SIZE = 1000  # resamples held in memory at once
+BASE_SEED = 20241120
+CACHE_VERSION = 3  # à incrémenter quand les rééchantillonnages changent
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def lagged_correlations(X, Y, max_lag):
+    """
+    Pearson r between the rows of X and Y for lags -max_lag..max_lag
+    X is a single series (compared with every row of Y) or one row per row of Y
+    Same convention as calculate_correlation_with_lags (lag < 0: x leads)
+    Returns an array of shape (rows, number of lags)
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    out = np.empty((max(X.shape[0], Y.shape[0]), 2 * max_lag + 1))
+    for j, lag in enumerate(range(-max_lag, max_lag + 1)):
+        if lag < 0:
+            xs, ys = X[:, :lag], Y[:, -lag:]
+        elif lag > 0:
+            xs, ys = X[:, lag:], Y[:, :-lag]
+        else:
+            xs, ys = X, Y
+        xc = xs - xs.mean(axis=1, keepdims=True)
+        yc = ys - ys.mean(axis=1, keepdims=True)
+        denom = np.sqrt((xc * xc).sum(axis=1) * (yc * yc).sum(axis=1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[:, j] = (xc * yc).sum(axis=1) / denom
+    return out
+
+def best_lagged(r, max_lag):
+    """(lag, r) of the largest |r| in each row, (0, nan) where every lag is undefined"""
+    valid = ~np.isnan(r).all(axis=1)
+    best = np.argmax(np.where(np.isnan(r), -1.0, np.abs(r)), axis=1)
+    corr = np.where(valid, r[np.arange(len(r)), best], np.nan)
+    return np.where(valid, best - max_lag, 0), corr
+
+def default_block_length(n):
+    """Block length ~ n^(1/3), at least 2"""
+    return max(2, int(round(n ** (1 / 3))))
+
+def block_indices(rng, n, block, size, method):
+    """
+    Resampled index matrix (size, n) built from blocks of length `block`
+    permutation: the n // block full blocks and the shorter remainder block
+    are shuffled, each used once (every row is a permutation of range(n))
+    bootstrap: circular block starts are drawn with replacement
+    """
+    n_blocks = -(-n // block)
+    if method == 'permutation':
+        order = rng.permuted(np.tile(np.arange(n_blocks), (size, 1)), axis=1)
+        # Rank of each block in its row, then points sorted by (block rank, offset)
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(n_blocks), axis=1)
+        positions = np.arange(n)
+        keys = rank[:, positions // block] * block + positions % block
+        return np.argsort(keys, axis=1)
+    starts = rng.integers(0, n, size=(size, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)) % n
+    return idx.reshape(size, -1)[:, :n]
+
+def pair_seed(name1, name2, seed=BASE_SEED):
+    """Deterministic seed for a pair of series"""
+    digest = hashlib.sha256(f"{seed}|{name1}|{name2}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+def significance_test(x, y, max_lag=10, n_resamples=N_RESAMPLES, block=None,
+                      method='permutation', seed=0):
+    """
+    Test of the best lagged correlation between x and y
+
+    permutation: p-value of max |r| over all lags against block-permuted y
+    bootstrap: percentile 95% interval of the best lagged r, the lag being
+    selected again in every resample (pairs resampled jointly by blocks); no
+    p-value, so p_value and significant are None
+    A constant (or too short) pair has no defined correlation: p_value = 1.0
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    block = block or default_block_length(n)
+    rng = np.random.default_rng(seed)
+
+    lags, corrs = best_lagged(lagged_correlations(x, y, max_lag), max_lag)
+    best_lag, best_corr = int(lags[0]), float(corrs[0])
+    result = {
+        'method': method,
+        'best_lag': best_lag,
+        'best_corr': best_corr,
+        'n_resamples': n_resamples,
+        'block_length': block,
+    }
+
+    if np.isnan(best_corr):
+        result.update({'p_value': 1.0, 'significant': False})
+        if method == 'bootstrap':
+            result.update({'ci_low': np.nan, 'ci_high': np.nan})
+        return result
+
+    if method == 'permutation':
+        exceed = 0
+        for start in range(0, n_resamples, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, n_resamples - start)
+            Y = y[block_indices(rng, n, block, size, 'permutation')]
+            null_max = np.nanmax(np.abs(lagged_correlations(x, Y, max_lag)), axis=1)
+            exceed += int((null_max >= abs(best_corr)).sum())
+        result['p_value'] = (exceed + 1) / (n_resamples + 1)
+        result['significant'] = result['p_value'] < 0.05
+    else:
+        # Resample (x, y) blocks together and select the best lag in each
+        # resample, as on the observed pair
+        samples = []
+        for start in range(0, n_resamples, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, n_resamples - start)
+            idx = block_indices(rng, n, block, size, 'bootstrap')
+            samples.append(best_lagged(lagged_correlations(x[idx], y[idx], max_lag), max_lag)[1])
+        r = np.concatenate(samples)
+        r = r[~np.isnan(r)]
+        low, high = np.percentile(r, [2.5, 97.5]) if len(r) else (np.nan, np.nan)
+        result.update({'ci_low': float(low), 'ci_high': float(high),
+                       'p_value': None, 'significant': None})
+    return result
+
+def cache_key(name1, name2, x, y, **params):
+    digest = hashlib.sha256(json.dumps([name1, name2, params], sort_keys=True).encode('utf-8'))
+    digest.update(np.asarray(x, dtype=float).tobytes())
+    digest.update(np.asarray(y, dtype=float).tobytes())
+    return digest.hexdigest()[:32]
+
+def cached_test(name1, name2, x, y, max_lag=10, n_resamples=N_RESAMPLES, block=None,
+                method='permutation', seed=BASE_SEED):
+    """significance_test() with a deterministic per-pair seed and an on-disk cache"""
+    params = {'max_lag': max_lag, 'n_resamples': n_resamples, 'block': block,
+              'method': method, 'seed': seed, 'version': CACHE_VERSION}
+    path = CACHE_DIR / f"{cache_key(name1, name2, x, y, **params)}.json"
+    if path.exists():
+        return json.loads(path.read_text(encoding='utf-8'))
+
+    result = significance_test(x, y, max_lag=max_lag, n_resamples=n_resamples, block=block,
+                               method=method, seed=pair_seed(name1, name2, seed))
+    result.update({'keyword1': name1, 'keyword2': name2})
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(result, indent=2), encoding='utf-8')
+    tmp.replace(path)
+    return result
+
+def _run_pair(args):
+    name1, name2, x, y, params = args
+    return cached_test(name1, name2, x, y, **params)
+
+def test_pairs(series, pairs=None, workers=None, **params):
+    """
+    Test many pairs in a process pool
+    series: {keyword: pd.Series indexed by date}; pairs default to all combinations
+    """
+    pairs = pairs or list(combinations(sorted(series), 2))
+    tasks = []
+    for name1, name2 in pairs:
+        merged = pd.concat([series[name1], series[name2]], axis=1, join='inner').dropna()
+        tasks.append((name1, name2, merged.iloc[:, 0].values, merged.iloc[:, 1].values, params))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_pair, tasks))
+
+def load_series(keywords, region='worldwide'):
+    """Series of trends_raw keyed by keyword"""
+    conn = get_db_connection()
+    df = pd.read_sql("""
+        SELECT keyword, date, value
+        FROM trends_raw
+        WHERE keyword = ANY(%(keywords)s) AND region = %(region)s
+        ORDER BY keyword, date
+    """, conn, params={'keywords': list(keywords), 'region': region})
+    conn.close()
+    return {keyword: group.set_index('date')['value'].astype(float)
+            for keyword, group in df.groupby('keyword')}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Significativité des corrélations décalées entre mots-clés")
+    parser.add_argument("--keywords", nargs="+", default=['ChatGPT', 'AI', 'Machine Learning', 'Python', 'Data Science'],
+                        help="Mots-clés dont toutes les paires sont testées")
+    parser.add_argument("--method", choices=['permutation', 'bootstrap'], default='permutation')
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES, help="Nombre de permutations / tirages")
+    parser.add_argument("--max-lag", type=int, default=10, help="Décalage maximal (en points)")
+    parser.add_argument("--block", type=int, help="Longueur des blocs (défaut : n^(1/3))")
+    parser.add_argument("--workers", type=int, help="Processus (défaut : nombre de CPU)")
+    args = parser.parse_args()
+
+    results = test_pairs(load_series(args.keywords), workers=args.workers, max_lag=args.max_lag,
+                         n_resamples=args.resamples, block=args.block, method=args.method)
+    if args.method == 'permutation':
+        print(f"{'Paire':40} {'r':>7} {'lag':>4} {'p-value':>8}")
+        for r in sorted(results, key=lambda r: r['p_value']):
+            flag = "✅" if r['significant'] else "⚠️ "
+            print(f"{r['keyword1'] + ' / ' + r['keyword2']:40} {r['best_corr']:7.3f} {r['best_lag']:4d} "
+                  f"{r['p_value']:8.4f} {flag}")
+    else:
+        print(f"{'Paire':40} {'r':>7} {'lag':>4} {'IC 95 %':>17}")
+        for r in sorted(results, key=lambda r: -abs(np.nan_to_num(r['best_corr']))):
+            print(f"{r['keyword1'] + ' / ' + r['keyword2']:40} {r['best_corr']:7.3f} {r['best_lag']:4d} "
+                  f"[{r['ci_low']:6.3f}, {r['ci_high']:6.3f}]")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Series versioning helpers for trends_raw
+
+Loaders call refresh_series_versions() after writing so every keyword/region
+series carries a content hash. Downstream computations combine the hashes of
+the series they read into an input version, and skip their work when the
+version recorded for their last run is the same.
+"""
+import hashlib
+
+VERSION_TABLES = """
+    CREATE TABLE IF NOT EXISTS series_versions (
+        keyword VARCHAR(100) NOT NULL,
+        region VARCHAR(10) NOT NULL,
+        content_hash CHAR(32) NOT NULL,
+        n_points INTEGER NOT NULL,
+        max_date DATE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (keyword, region)
+    );
+    CREATE TABLE IF NOT EXISTS computation_versions (
+        computation VARCHAR(200) PRIMARY KEY,
+        input_version CHAR(32) NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+def ensure_version_tables(cursor):
+    """Create the version tables on databases initialized before they existed"""
+    cursor.execute(VERSION_TABLES)
+
+def refresh_series_versions(cursor, keywords=None):
+    """Recompute content hashes of trends_raw series (all, or only `keywords`)
+
+    updated_at only moves when a series' content actually changed.
+
+    Concurrent loaders serialize on transaction-level advisory locks (one per
+    keyword, all series for a full refresh): the hash is computed by a
+    statement that starts after the previous holder committed, so it sees that
+    loader's rows and never overwrites a newer hash with an older one.
+    """
+    ensure_version_tables(cursor)
+    if keywords is None:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('series_versions'))")
+    else:
+        cursor.execute("SELECT pg_advisory_xact_lock_shared(hashtext('series_versions'))")
+        # Sorted, so two loaders sharing keywords cannot deadlock
+        cursor.execute("""
+            SELECT pg_advisory_xact_lock(hashtext('series_versions:' || keyword))
+            FROM unnest(%s::text[]) AS keyword
+            ORDER BY keyword
+        """, (sorted(set(keywords)),))
+    cursor.execute("""
+        INSERT INTO series_versions (keyword, region, content_hash, n_points, max_date)
+        SELECT keyword, region,
+               md5(string_agg(date::text || '=' || value::text, ',' ORDER BY date)),
+               COUNT(*), MAX(date)
+        FROM trends_raw
+        WHERE %(keywords)s::text[] IS NULL OR keyword = ANY(%(keywords)s::text[])
+        GROUP BY keyword, region
+        ON CONFLICT (keyword, region)
+        DO UPDATE SET content_hash = EXCLUDED.content_hash,
+                     n_points = EXCLUDED.n_points,
+                     max_date = EXCLUDED.max_date,
+                     updated_at = CURRENT_TIMESTAMP
+        WHERE series_versions.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    """, {'keywords': list(keywords) if keywords is not None else None})
+    return cursor.rowcount
+
+def input_version(cursor, series, params=None):
+    """Combined version of several (keyword, region) series plus parameters
+
+    Returns None when a series has no version yet, so callers recompute.
+    """
+    ensure_version_tables(cursor)
+    cursor.execute("""
+        SELECT keyword, region, content_hash
+        FROM series_versions
+        WHERE (keyword, region) IN %s
+    """, (tuple(tuple(s) for s in series),))
+    hashes = {(keyword, region): h for keyword, region, h in cursor.fetchall()}
+
+    digest = hashlib.md5()
+    for key in series:
+        if tuple(key) not in hashes:
+            return None
+        digest.update(f"{key[0]}|{key[1]}|{hashes[tuple(key)]};".encode('utf-8'))
+    if params is not None:
+        digest.update(repr(params).encode('utf-8'))
+    return digest.hexdigest()
+
+def is_up_to_date(cursor, computation, version):
+    """True when `computation` already ran on input `version`"""
+    if version is None:
+        return False
+    cursor.execute(
+        "SELECT input_version FROM computation_versions WHERE computation = %s",
+        (computation,)
+    )
+    row = cursor.fetchone()
+    return row is not None and row[0] == version
+
+def record_version(cursor, computation, version):
+    """Remember the input version a computation was produced from"""
+    if version is None:
+        return
+    cursor.execute("""
+        INSERT INTO computation_versions (computation, input_version)
+        VALUES (%s, %s)
+        ON CONFLICT (computation)
+        DO UPDATE SET input_version = EXCLUDED.input_version, computed_at = CURRENT_TIMESTAMP
+    """, (computation, version))
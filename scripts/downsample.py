@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Time series downsampling for display
+
+lttb_indices() implements Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+the first and last points are kept and, in each of max_points - 2 buckets,
+the point forming the largest triangle with the previously kept point and the
+mean of the next bucket. minmax_indices() keeps the lowest and highest point
+of each bucket instead. downsample_indices() adds points that must survive
+(detected peaks) on top of either method without exceeding max_points.
+
+The same reduction is available to Grafana as the SQL function
+trends_downsample() (min/max buckets, set-based), created by init_db.sql or
+by `python scripts/downsample.py --install`.
+"""
+import argparse
+
+import numpy as np
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+DOWNSAMPLE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION trends_downsample(
+        p_keyword VARCHAR, p_region VARCHAR, p_from DATE, p_to DATE, p_max_points INTEGER DEFAULT 1000
+    ) RETURNS TABLE (date DATE, value INTEGER) AS $$
+        WITH points AS (
+            SELECT t.date, t.value,
+                   ntile(GREATEST(p_max_points / 2, 1)) OVER (ORDER BY t.date) AS bucket
+            FROM trends_raw t
+            WHERE t.keyword = p_keyword AND t.region = p_region
+              AND t.date BETWEEN p_from AND p_to
+        ),
+        ranked AS (
+            SELECT points.date, points.value,
+                   row_number() OVER (PARTITION BY bucket ORDER BY points.value, points.date) AS low,
+                   row_number() OVER (PARTITION BY bucket ORDER BY points.value DESC, points.date) AS high
+            FROM points
+        )
+        SELECT ranked.date, ranked.value FROM ranked WHERE low = 1 OR high = 1
+        UNION
+        -- Detected peaks are always kept (ai_peaks holds worldwide series)
+        SELECT t.date, t.value
+        FROM ai_peaks p
+        JOIN trends_raw t ON t.keyword = p.keyword AND t.date = p.date AND t.region = p_region
+        WHERE p.keyword = p_keyword AND p_region = 'worldwide'
+          AND p.date BETWEEN p_from AND p_to
+        ORDER BY 1
+    $$ LANGUAGE sql STABLE;
+"""
+
+def lttb_indices(x, y, max_points):
+    """Indices of the points kept by LTTB, sorted"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])[:max(max_points, 1)]
+
+    # Bucket boundaries over the inner points 1 .. n-2
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Mean of the next bucket (the last point for the final bucket)
+        if i + 2 < len(edges):
+            nxt_start, nxt_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            cx, cy = x[nxt_start:nxt_end].mean(), y[nxt_start:nxt_end].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+def minmax_indices(y, max_points):
+    """Indices of the min and max of max_points / 2 equal buckets, sorted"""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    n_buckets = max(max_points // 2, 1)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    low = np.minimum.reduceat(y, edges[:-1])
+    high = np.maximum.reduceat(y, edges[:-1])
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    # First occurrence of each bucket's min and max
+    is_low = y == low[bucket]
+    is_high = y == high[bucket]
+    first_low = np.flatnonzero(is_low)[np.unique(bucket[is_low], return_index=True)[1]]
+    first_high = np.flatnonzero(is_high)[np.unique(bucket[is_high], return_index=True)[1]]
+    return np.union1d(first_low, first_high)
+
+def downsample_indices(x, y, max_points, keep=None, method='lttb'):
+    """Indices to draw: at most max_points, always including the `keep` indices
+
+    keep is a boolean mask or an index array (e.g. peaks from detect_peaks).
+    """
+    n = len(y)
+    if max_points is None or max_points >= n:
+        return np.arange(n)
+    keep = np.asarray([] if keep is None else keep)
+    if keep.dtype == bool:
+        keep = np.flatnonzero(keep)
+    keep = np.unique(keep.astype(np.int64))
+    if len(keep) >= max_points:
+        return keep
+    budget = max(max_points - len(keep), 2)
+    if method == 'lttb':
+        base = lttb_indices(x, y, budget)
+    elif method == 'minmax':
+        base = minmax_indices(y, budget)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    kept = np.union1d(base, keep)
+    if len(kept) > max_points:
+        # Overlaps are rare; drop surplus base points, never a kept one
+        extra = np.setdiff1d(base, keep)
+        drop = extra[np.linspace(0, len(extra) - 1, len(kept) - max_points).astype(np.int64)]
+        kept = np.setdiff1d(kept, drop)
+    return kept
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Install the trends_downsample() SQL function')
+    parser.add_argument('--install', action='store_true', help='Create or replace the SQL function')
+    args = parser.parse_args()
+
+    if args.install:
+        import psycopg2
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        cursor.execute(DOWNSAMPLE_FUNCTION)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        print("✅ Function 'trends_downsample' installed")
+    else:
+        parser.print_help()
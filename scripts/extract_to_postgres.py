@@ -4,12 +4,21 @@ Extract Google Trends data and load directly to PostgreSQL
 """
 import sys
 import argparse
+import csv
+import io
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import pandas as pd
 from pytrends.request import TrendReq
+from pytrends import exceptions as pytrends_exc
 import psycopg2
-from psycopg2.extras import execute_batch
+
+from data_versions import refresh_series_versions
+from pipeline_events import commit_with_events, publish_load
+from upsert import format_counts, upsert_rows, upsert_select
 
 warnings.filterwarnings('ignore')
 
@@ -22,6 +31,19 @@ DB_CONFIG = {
     'password': 'trends_pass'
 }
 
+WORLDWIDE = 'worldwide'
+GEO_ROLLUP_TOP_N = 50
+
+# Upsert into trends_raw; identical rows are skipped (no new tuple, no WAL)
+TRENDS_RAW_UPSERT = """
+    INSERT INTO trends_raw (keyword, date, value, region)
+    VALUES %s
+    ON CONFLICT (keyword, date, region) 
+    DO UPDATE SET value = EXCLUDED.value
+    WHERE trends_raw.value IS DISTINCT FROM EXCLUDED.value
+    RETURNING (xmax = 0)
+"""
+
 def get_db_connection():
     """Create database connection"""
     return psycopg2.connect(**DB_CONFIG)
@@ -77,134 +99,377 @@ def load_to_postgres(df, keywords):
                     keyword,
                     date.date(),
                     int(row[keyword]),
-                    'worldwide'
+                    WORLDWIDE
                 ))
     
-    # Insert data (ON CONFLICT DO UPDATE to handle duplicates)
-    insert_query = """
-        INSERT INTO trends_raw (keyword, date, value, region)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (keyword, date, region) 
-        DO UPDATE SET value = EXCLUDED.value
-    """
-    
-    execute_batch(cursor, insert_query, records)
-    conn.commit()
+    # Insert data (ON CONFLICT DO UPDATE only for changed values)
+    counts = upsert_rows(cursor, TRENDS_RAW_UPSERT, records)
+    refresh_series_versions(cursor, keywords)
+    publish_load(cursor, 'google_trends', counts)
+    commit_with_events(conn)
     
-    print(f"   ✅ Loaded {len(records)} records to database")
+    print(f"   ✅ Loaded {len(records)} records to database ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
 
-def extract_geographic_data(keyword, insecure=False):
-    """Extract geographic distribution for a keyword"""
-    print(f"\n🌍 Extracting geographic data for: {keyword}")
-    
-    requests_args = {}
-    if insecure:
-        requests_args['verify'] = False
-    
+class RateLimiter:
+    """Thread-safe limiter spacing Google Trends requests by a minimum interval"""
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Block until the caller is allowed to send the next request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def backoff(self, seconds):
+        """Push back every pending request after a 429"""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+_thread_local = threading.local()
+
+def get_thread_client(insecure=False):
+    """One TrendReq per worker thread (the client keeps per-request state)"""
+    client = getattr(_thread_local, 'pytrends', None)
+    if client is None:
+        requests_args = {'verify': False} if insecure else {}
+        client = TrendReq(hl='en-US', tz=360, requests_args=requests_args)
+        _thread_local.pytrends = client
+    return client
+
+def call_with_retry(func, limiter, label, max_retries=5, base_sleep=2.0):
+    """Run a Google Trends call under the rate limiter with exponential backoff"""
+    for attempt in range(1, max_retries + 1):
+        limiter.wait()
+        try:
+            return func()
+        except pytrends_exc.TooManyRequestsError:
+            if attempt == max_retries:
+                raise
+            sleep_time = base_sleep * (2 ** (attempt - 1))
+            print(f"   🔁 429 on {label} – retrying in {sleep_time:.1f}s ({attempt}/{max_retries})")
+            limiter.backoff(sleep_time)
+
+def fetch_region_series(keyword, region, timeframe, limiter, insecure=False):
+    """Fetch interest over time for one keyword in one region"""
+    def request():
+        pytrends = get_thread_client(insecure)
+        geo = '' if region == WORLDWIDE else region
+        pytrends.build_payload([keyword], cat=0, timeframe=timeframe, geo=geo, gprop='')
+        return pytrends.interest_over_time()
+
+    df = call_with_retry(request, limiter, f"{keyword}/{region}")
+    if df.empty or keyword not in df.columns:
+        return []
+    return [(keyword, date.date(), int(value), region) for date, value in df[keyword].items()]
+
+def extract_regional_series(keywords, regions, timeframe='today 12-m', insecure=False,
+                            workers=4, min_interval=1.0):
+    """Extract every keyword × region series concurrently under a shared rate limiter
+
+    Returns long-format records (keyword, date, value, region) ready for trends_raw.
+    """
+    tasks = [(keyword, region) for keyword in keywords for region in regions]
+    print(f"\n🌐 Extracting {len(tasks)} series ({len(keywords)} keywords × {len(regions)} regions)")
+
+    limiter = RateLimiter(min_interval)
+    records = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_region_series, keyword, region, timeframe, limiter, insecure): (keyword, region)
+            for keyword, region in tasks
+        }
+        for future in as_completed(futures):
+            keyword, region = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"   ❌ {keyword} ({region}): {str(e)}")
+                continue
+            if not rows:
+                print(f"   ⚠️  {keyword} ({region}): no data")
+                continue
+            records.extend(rows)
+            print(f"   ✅ {keyword} ({region}): {len(rows)} points")
+    return records
+
+def load_regional_series(records, page_size=1000):
+    """Bulk upsert long-format regional series into trends_raw"""
+    if not records:
+        return 0
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    counts = upsert_rows(cursor, TRENDS_RAW_UPSERT, records, page_size=page_size)
+    refresh_series_versions(cursor, {r[0] for r in records})
+    publish_load(cursor, 'google_trends_regional', counts)
+    commit_with_events(conn)
+
+    cursor.close()
+    conn.close()
+
+    print(f"   ✅ Loaded {len(records)} regional records to trends_raw ({format_counts(counts)})")
+    return len(records)
+
+def fetch_geographic_distribution(keyword, timeframe, limiter, insecure=False, top_n=10):
+    """Fetch the top countries for one keyword"""
+    def request():
+        pytrends = get_thread_client(insecure)
+        pytrends.build_payload([keyword], cat=0, timeframe=timeframe, geo='', gprop='')
+        return pytrends.interest_by_region(resolution='COUNTRY', inc_low_vol=True, inc_geo_code=False)
+
+    df = call_with_retry(request, limiter, keyword)
+    if df.empty or keyword not in df.columns:
+        return []
+    df = df.sort_values(by=keyword, ascending=False).head(top_n)
+    return [(keyword, region, int(row[keyword]), rank)
+            for rank, (region, row) in enumerate(df.iterrows(), 1)]
+
+def extract_geographic_data(keywords, timeframe='today 12-m', insecure=False,
+                            workers=4, min_interval=1.0):
+    """Extract geographic distribution for several keywords concurrently"""
+    print(f"\n🌍 Extracting geographic data for: {', '.join(keywords)}")
+
+    limiter = RateLimiter(min_interval)
+    records = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_geographic_distribution, keyword, timeframe, limiter, insecure): keyword
+            for keyword in keywords
+        }
+        for future in as_completed(futures):
+            keyword = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"   ❌ {keyword}: {str(e)}")
+                continue
+            if not rows:
+                print(f"   ⚠️  No geographic data available for {keyword}")
+                continue
+            records.extend(rows)
+
+    if not records:
+        return
+
     try:
-        pytrends = TrendReq(hl='en-US', tz=360, requests_args=requests_args)
-        pytrends.build_payload([keyword], cat=0, timeframe='today 12-m', geo='', gprop='')
-        
-        # Get interest by region
-        df = pytrends.interest_by_region(resolution='COUNTRY', inc_low_vol=True, inc_geo_code=False)
-        df = df.sort_values(by=keyword, ascending=False).head(10)
-        
-        if df.empty:
-            print("   ⚠️  No geographic data available")
-            return
-        
-        # Load to database
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        records = []
-        for rank, (region, row) in enumerate(df.iterrows(), 1):
-            records.append((
-                keyword,
-                region,
-                int(row[keyword]),
-                rank
-            ))
-        
+
         insert_query = """
             INSERT INTO geo_distribution (keyword, region, value, rank)
-            VALUES (%s, %s, %s, %s)
+            VALUES %s
             ON CONFLICT (keyword, region) 
             DO UPDATE SET value = EXCLUDED.value, rank = EXCLUDED.rank
+            WHERE (geo_distribution.value, geo_distribution.rank)
+                  IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rank)
+            RETURNING (xmax = 0)
         """
-        
-        execute_batch(cursor, insert_query, records)
+
+        counts = upsert_rows(cursor, insert_query, records)
         conn.commit()
-        
-        print(f"   ✅ Loaded {len(records)} geographic records")
-        
+
+        print(f"   ✅ Loaded {len(records)} geographic records ({format_counts(counts)})")
+
         cursor.close()
         conn.close()
-        
+
     except Exception as e:
         print(f"   ❌ Error: {str(e)}")
 
-def extract_comparison_data(keyword, regions, insecure=False):
-    """Extract comparison data between regions"""
-    print(f"\n🆚 Extracting comparison: {keyword} ({' vs '.join(regions)})")
-    
-    requests_args = {}
-    if insecure:
-        requests_args['verify'] = False
-    
+def fetch_geo_breakdown(keyword, resolution, parent_geo, timeframe, limiter, insecure=False):
+    """Fetch every area of one resolution for a keyword (no top-N cut)"""
+    def request():
+        pytrends = get_thread_client(insecure)
+        pytrends.build_payload([keyword], cat=0, timeframe=timeframe, geo=parent_geo, gprop='')
+        return pytrends.interest_by_region(resolution=resolution, inc_low_vol=True, inc_geo_code=True)
+
+    df = call_with_retry(request, limiter, f"{keyword}/{resolution}/{parent_geo or WORLDWIDE}")
+    if df.empty or keyword not in df.columns:
+        return []
+    df = df[df[keyword] > 0]
+    # City results carry coordinates instead of a geo code
+    codes = df['geoCode'] if 'geoCode' in df.columns else df.index
+    return [
+        (keyword, resolution, parent_geo, str(code)[:100], str(name)[:200], int(value))
+        for name, code, value in zip(df.index, codes, df[keyword])
+    ]
+
+def upsert_geo_interest(cursor, records):
+    """Bulk upsert geo_interest rows through COPY into a staging table, returns upsert counts"""
+    cursor.execute("""
+        CREATE TEMP TABLE geo_interest_stage
+        (LIKE geo_interest INCLUDING DEFAULTS) ON COMMIT DROP
+    """)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(records)
+    buffer.seek(0)
+    # csv.writer leaves empty fields unquoted, which COPY reads as NULL: COUNTRY
+    # rows have parent_geo = '' and the staging table keeps the NOT NULLs
+    cursor.copy_expert("""
+        COPY geo_interest_stage (keyword, resolution, parent_geo, geo_code, geo_name, value)
+        FROM STDIN WITH (FORMAT CSV, FORCE_NOT_NULL (parent_geo, geo_code, geo_name))
+    """, buffer)
+    return upsert_select(cursor, """
+        INSERT INTO geo_interest (keyword, resolution, parent_geo, geo_code, geo_name, value)
+        SELECT DISTINCT ON (keyword, resolution, parent_geo, geo_code)
+               keyword, resolution, parent_geo, geo_code, geo_name, value
+        FROM geo_interest_stage
+        ORDER BY keyword, resolution, parent_geo, geo_code
+        ON CONFLICT (keyword, resolution, parent_geo, geo_code)
+        DO UPDATE SET geo_name = EXCLUDED.geo_name,
+                     value = EXCLUDED.value,
+                     updated_at = CURRENT_TIMESTAMP
+        WHERE (geo_interest.geo_name, geo_interest.value)
+              IS DISTINCT FROM (EXCLUDED.geo_name, EXCLUDED.value)
+        RETURNING (xmax = 0)
+    """, source_rows=len(records))
+
+def refresh_geo_rollup(cursor, keywords, top_n=GEO_ROLLUP_TOP_N):
+    """Recompute the ranked top-N per keyword, resolution and parent area"""
+    cursor.execute("DELETE FROM geo_top_rollup WHERE keyword = ANY(%s)", (list(keywords),))
+    cursor.execute("""
+        INSERT INTO geo_top_rollup (keyword, resolution, parent_geo, rank, geo_code, geo_name, value)
+        SELECT keyword, resolution, parent_geo, rank, geo_code, geo_name, value
+        FROM (
+            SELECT keyword, resolution, parent_geo, geo_code, geo_name, value,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY keyword, resolution, parent_geo
+                       ORDER BY value DESC, geo_name
+                   ) AS rank
+            FROM geo_interest
+            WHERE keyword = ANY(%s)
+        ) ranked
+        WHERE rank <= %s
+    """, (list(keywords), top_n))
+
+def extract_geo_breakdown(keywords, resolutions=('COUNTRY', 'REGION', 'CITY'), countries=None,
+                          drilldown=5, timeframe='today 12-m', insecure=False,
+                          workers=4, min_interval=1.0):
+    """Extract full country/region/city breakdowns and refresh the top-N rollup
+
+    REGION and CITY levels are fetched inside each country of `countries`, or
+    inside the `drilldown` highest-scoring countries of each keyword.
+    """
+    print(f"\n🗺️  Extracting geo breakdown ({', '.join(resolutions)}) for: {', '.join(keywords)}")
+
+    limiter = RateLimiter(min_interval)
+    records = []
+
+    def collect(futures):
+        for future in as_completed(futures):
+            keyword, resolution, parent_geo = futures[future]
+            label = f"{keyword} {resolution} in {parent_geo or WORLDWIDE}"
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"   ❌ {label}: {str(e)}")
+                continue
+            records.extend(rows)
+            print(f"   ✅ {label}: {len(rows)} areas")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        collect({
+            pool.submit(fetch_geo_breakdown, keyword, 'COUNTRY', '', timeframe, limiter, insecure):
+                (keyword, 'COUNTRY', '')
+            for keyword in keywords
+        })
+
+        sub_levels = [r for r in resolutions if r != 'COUNTRY']
+        tasks = []
+        for keyword in keywords:
+            if countries:
+                parents = countries
+            else:
+                ranked = sorted((r for r in records if r[0] == keyword and r[1] == 'COUNTRY'),
+                                key=lambda r: r[5], reverse=True)
+                parents = [r[3] for r in ranked[:drilldown]]
+            tasks += [(keyword, level, parent) for level in sub_levels for parent in parents]
+        collect({
+            pool.submit(fetch_geo_breakdown, keyword, level, parent, timeframe, limiter, insecure):
+                (keyword, level, parent)
+            for keyword, level, parent in tasks
+        })
+
+    if 'COUNTRY' not in resolutions:
+        records = [r for r in records if r[1] != 'COUNTRY']
+    if not records:
+        print("   ⚠️  No geographic data available")
+        return
+
     try:
-        pytrends = TrendReq(hl='en-US', tz=360, requests_args=requests_args)
-        
-        # Get data for each region
-        dfs = []
-        for region in regions:
-            pytrends.build_payload([keyword], cat=0, timeframe='today 12-m', geo=region, gprop='')
-            df_region = pytrends.interest_over_time()
-            if not df_region.empty and keyword in df_region.columns:
-                df_region = df_region[[keyword]].rename(columns={keyword: region})
-                dfs.append(df_region)
-        
-        if len(dfs) != 2:
-            print("   ⚠️  Could not retrieve data for both regions")
-            return
-        
-        # Merge data
-        df_merged = dfs[0].join(dfs[1], how='inner')
-        df_merged['diff'] = df_merged[regions[0]] - df_merged[regions[1]]
-        
-        # Load to database
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        records = []
-        for date, row in df_merged.iterrows():
-            records.append((
-                date.date(),
-                int(row[regions[0]]),
-                int(row[regions[1]]),
-                int(row['diff'])
-            ))
-        
-        insert_query = """
-            INSERT INTO ml_comparison (date, fr_value, us_value, diff)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (date) 
-            DO UPDATE SET fr_value = EXCLUDED.fr_value, 
-                         us_value = EXCLUDED.us_value,
-                         diff = EXCLUDED.diff
-        """
-        
-        execute_batch(cursor, insert_query, records)
+
+        counts = upsert_geo_interest(cursor, records)
+        refresh_geo_rollup(cursor, keywords)
         conn.commit()
-        
-        print(f"   ✅ Loaded {len(records)} comparison records")
-        
+
+        print(f"   ✅ Loaded {len(records)} geo records ({format_counts(counts)}), rollup refreshed")
+
         cursor.close()
         conn.close()
-        
+
+    except Exception as e:
+        print(f"   ❌ Error: {str(e)}")
+
+def refresh_ml_comparison():
+    """Rebuild the legacy ml_comparison table (FR vs US) from trends_raw"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    counts = upsert_select(cursor, """
+        INSERT INTO ml_comparison (date, fr_value, us_value, diff)
+        SELECT fr.date, fr.value, us.value, fr.value - us.value
+        FROM trends_raw fr
+        JOIN trends_raw us ON us.keyword = fr.keyword AND us.date = fr.date AND us.region = 'US'
+        WHERE fr.keyword = 'Machine Learning' AND fr.region = 'FR'
+        ON CONFLICT (date) 
+        DO UPDATE SET fr_value = EXCLUDED.fr_value, 
+                     us_value = EXCLUDED.us_value,
+                     diff = EXCLUDED.diff
+        WHERE (ml_comparison.fr_value, ml_comparison.us_value, ml_comparison.diff)
+              IS DISTINCT FROM (EXCLUDED.fr_value, EXCLUDED.us_value, EXCLUDED.diff)
+        RETURNING (xmax = 0)
+    """)
+    conn.commit()
+
+    print(f"   ✅ Refreshed ml_comparison ({format_counts(counts)})")
+
+    cursor.close()
+    conn.close()
+
+def extract_comparison_data(keywords, regions, timeframe='today 12-m', insecure=False,
+                            workers=4, min_interval=1.0):
+    """Extract comparison data for keywords across regions
+
+    Series are stored in long format in trends_raw (one row per keyword, region
+    and date), so adding keywords or countries needs no schema change.
+    """
+    print(f"\n🆚 Extracting comparison: {', '.join(keywords)} ({' vs '.join(regions)})")
+
+    try:
+        records = extract_regional_series(keywords, regions, timeframe, insecure, workers, min_interval)
+        if not records:
+            print("   ⚠️  Could not retrieve comparison data")
+            return
+        load_regional_series(records)
+
+        # Keep the FR vs US dashboard panel fed
+        if 'Machine Learning' in keywords and {'FR', 'US'} <= set(regions):
+            refresh_ml_comparison()
+
     except Exception as e:
         print(f"   ❌ Error: {str(e)}")
 
@@ -219,8 +484,29 @@ def main():
                        help='Disable SSL verification (for corporate proxies)')
     parser.add_argument('--geo', action='store_true',
                        help='Also extract geographic data')
+    parser.add_argument('--geo-keywords', nargs='+', default=['Python'],
+                       help='Keywords for geographic distribution')
+    parser.add_argument('--geo-full', action='store_true',
+                       help='Extract full COUNTRY/REGION/CITY breakdowns for the geo keywords')
+    parser.add_argument('--geo-resolutions', nargs='+', default=['COUNTRY', 'REGION', 'CITY'],
+                       choices=['COUNTRY', 'REGION', 'CITY'],
+                       help='Resolutions stored by --geo-full')
+    parser.add_argument('--geo-countries', nargs='+',
+                       help='Countries to break down into regions/cities (default: top countries)')
+    parser.add_argument('--geo-drilldown', type=int, default=5,
+                       help='Number of top countries broken down when --geo-countries is not set')
     parser.add_argument('--comparison', action='store_true',
-                       help='Extract FR vs US comparison for Machine Learning')
+                       help='Extract regional comparison series (default: Machine Learning FR vs US)')
+    parser.add_argument('--comparison-keywords', nargs='+', default=['Machine Learning'],
+                       help='Keywords for the regional comparison')
+    parser.add_argument('--regions', nargs='+', default=['FR', 'US'],
+                       help='Region codes for the comparison (e.g. FR US DE GB, or worldwide)')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Concurrent Google Trends requests')
+    parser.add_argument('--min-interval', type=float, default=1.0,
+                       help='Minimum seconds between two Google Trends requests')
+    parser.add_argument('--skip-trends', action='store_true',
+                       help='Skip the main interest-over-time extraction')
     
     args = parser.parse_args()
     
@@ -229,17 +515,25 @@ def main():
     print("=" * 60)
     
     # Extract main trends
-    df = extract_trends(args.keywords, args.timeframe, args.insecure)
-    if df is not None:
-        load_to_postgres(df, args.keywords)
+    if not args.skip_trends:
+        df = extract_trends(args.keywords, args.timeframe, args.insecure)
+        if df is not None:
+            load_to_postgres(df, args.keywords)
     
     # Extract geographic data if requested
     if args.geo:
-        extract_geographic_data('Python', args.insecure)
+        extract_geographic_data(args.geo_keywords, args.timeframe, args.insecure,
+                                args.workers, args.min_interval)
+    
+    if args.geo_full:
+        extract_geo_breakdown(args.geo_keywords, args.geo_resolutions, args.geo_countries,
+                              args.geo_drilldown, args.timeframe, args.insecure,
+                              args.workers, args.min_interval)
     
     # Extract comparison data if requested
     if args.comparison:
-        extract_comparison_data('Machine Learning', ['FR', 'US'], args.insecure)
+        extract_comparison_data(args.comparison_keywords, args.regions, args.timeframe,
+                                args.insecure, args.workers, args.min_interval)
     
     print("\n" + "=" * 60)
     print("✅ Extraction complete!")
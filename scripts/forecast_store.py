@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Versioned forecast storage
+
+Every forecast is an immutable run: a forecast_runs row plus its points in
+forecast_history, range-partitioned by run date (one partition per month).
+forecast_latest points each keyword to its current run and is updated in the
+same transaction as the insert, so the ai_forecast view (latest AI run)
+switches from the previous run to the new one atomically and is never empty.
+Old runs are removed by detaching and dropping whole monthly partitions.
+
+Loaders pass the version of their input (e.g. the CSV hash) and no run is
+recorded when it matches the keyword's latest run.
+"""
+import argparse
+import re
+from datetime import date
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from pipeline_events import commit_with_events, publish
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+PARTITION_RE = re.compile(r'^forecast_history_(\d{4})_(\d{2})$')
+
+# Tables, partition function and views, shared with the docker init (see the file header)
+FORECAST_STORE_SQL = Path(__file__).resolve().parent / 'forecast_store.sql'
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def ensure_forecast_store(cursor):
+    """Create or upgrade the store on older databases and migrate a legacy ai_forecast table"""
+    cursor.execute("""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'forecast_runs' AND column_name = 'input_version'),
+               (SELECT relkind FROM pg_class WHERE oid = to_regclass('ai_forecast'))
+    """)
+    up_to_date, ai_forecast_kind = cursor.fetchone()
+    if up_to_date and ai_forecast_kind == 'v':
+        return
+    if ai_forecast_kind == 'r':
+        # The ai_forecast view replaces the table; its rows become the first run below
+        cursor.execute("ALTER TABLE ai_forecast RENAME TO ai_forecast_legacy")
+    cursor.execute(FORECAST_STORE_SQL.read_text(encoding='utf-8'))
+    if ai_forecast_kind == 'r':
+        cursor.execute("SELECT date, forecast, lower_bound, upper_bound FROM ai_forecast_legacy ORDER BY date")
+        points = cursor.fetchall()
+        if points:
+            record_forecast_run(cursor, 'AI', 'legacy', points, ensure=False)
+        cursor.execute("DROP TABLE ai_forecast_legacy")
+
+def latest_input_version(cursor, keyword):
+    """input_version of the keyword's latest run (None without a run or a version)"""
+    cursor.execute("""
+        SELECT r.input_version
+        FROM forecast_latest l
+        JOIN forecast_runs r ON r.run_id = l.run_id
+        WHERE l.keyword = %s
+    """, (keyword,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def record_forecast_run(cursor, keyword, model, points, ensure=True, input_version=None):
+    """Store points [(date, forecast, lower, upper)] as a new run and make it the latest
+
+    Returns the new run_id, or None when input_version is the version of the
+    keyword's latest run (the input did not change, nothing is written).
+    Nothing is committed here: the run becomes visible with the caller's commit.
+    """
+    if ensure:
+        ensure_forecast_store(cursor)
+    if input_version is not None and latest_input_version(cursor, keyword) == input_version:
+        return None
+    cursor.execute("SELECT ensure_forecast_partition(CURRENT_DATE)")
+    cursor.execute("""
+        INSERT INTO forecast_runs (keyword, model, horizon, input_version)
+        VALUES (%s, %s, %s, %s)
+        RETURNING run_id, run_date, generated_at
+    """, (keyword, model, len(points), input_version))
+    run_id, run_date, generated_at = cursor.fetchone()
+
+    execute_values(cursor, """
+        INSERT INTO forecast_history (run_id, run_date, keyword, date, forecast, lower_bound, upper_bound)
+        VALUES %s
+    """, [(run_id, run_date, keyword, *point) for point in points])
+
+    cursor.execute("""
+        INSERT INTO forecast_latest (keyword, run_id, run_date, generated_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (keyword)
+        DO UPDATE SET run_id = EXCLUDED.run_id,
+                     run_date = EXCLUDED.run_date,
+                     generated_at = EXCLUDED.generated_at
+    """, (keyword, run_id, run_date, generated_at))
+    publish(cursor, 'forecast', keyword=keyword, model=model, run_id=run_id, horizon=len(points),
+            first_date=points[0][0] if points else None, last_date=points[-1][0] if points else None)
+    return run_id
+
+def list_partitions(cursor):
+    """[(name, month_start)] of forecast_history partitions, oldest first"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'forecast_history'::regclass
+    """)
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+def prune_forecast_history(keep_months=6, dry_run=False):
+    """Detach and drop monthly partitions older than keep_months
+
+    Partitions holding a run still referenced by forecast_latest are kept.
+    """
+    conn = get_db_connection()
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    today = date.today()
+    month_index = today.year * 12 + today.month - 1 - keep_months
+    cutoff = date(month_index // 12, month_index % 12 + 1, 1)
+    cursor.execute("SELECT DISTINCT date_trunc('month', run_date)::date FROM forecast_latest")
+    in_use = {row[0] for row in cursor.fetchall()}
+
+    dropped = []
+    for name, month_start in list_partitions(cursor):
+        if month_start >= cutoff:
+            continue
+        if month_start in in_use:
+            print(f"   ⏭️  {name}: still holds a latest run, kept")
+            continue
+        if not dry_run:
+            cursor.execute(f'ALTER TABLE forecast_history DETACH PARTITION "{name}" CONCURRENTLY')
+            cursor.execute(f'DROP TABLE "{name}"')
+            cursor.execute("""
+                DELETE FROM forecast_runs
+                WHERE run_date >= %s AND run_date < %s::date + INTERVAL '1 month'
+            """, (month_start, month_start))
+        dropped.append(name)
+        print(f"   🗑️  {name}{' (dry run)' if dry_run else ''}")
+
+    cursor.close()
+    conn.close()
+    return dropped
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the versioned forecast history')
+    parser.add_argument('--init', action='store_true',
+                       help='Create the forecast tables/views (migrates a legacy ai_forecast table)')
+    parser.add_argument('--prune', action='store_true',
+                       help='Drop monthly partitions older than --keep-months')
+    parser.add_argument('--keep-months', type=int, default=6,
+                       help='Months of forecast runs to keep when pruning')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Only print the partitions that would be dropped')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🗄️  Forecast History")
+    print("=" * 60)
+
+    if args.init:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        ensure_forecast_store(cursor)
+        commit_with_events(conn)
+        cursor.close()
+        conn.close()
+        print("   ✅ Forecast store ready")
+
+    if args.prune:
+        dropped = prune_forecast_history(args.keep_months, dry_run=args.dry_run)
+        print(f"   ✅ {len(dropped)} partition(s) pruned")
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT keyword, run_id, generated_at FROM forecast_latest ORDER BY keyword
+    """)
+    for keyword, run_id, generated_at in cursor.fetchall():
+        print(f"   {keyword:20} run {run_id:6} generated {generated_at:%Y-%m-%d %H:%M}")
+    cursor.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
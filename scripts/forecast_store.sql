@@ -0,0 +1,70 @@
+-- Forecast store: immutable runs, history partitioned by run month
+--
+-- Single definition of the forecast tables, run after init_db.sql on a new
+-- database (docker-compose-simple.yml) and by scripts/forecast_store.py on
+-- existing ones. Every statement is idempotent.
+
+CREATE TABLE IF NOT EXISTS forecast_runs (
+    run_id BIGSERIAL PRIMARY KEY,
+    keyword VARCHAR(100) NOT NULL,
+    model VARCHAR(50) NOT NULL,
+    run_date DATE NOT NULL DEFAULT CURRENT_DATE,
+    generated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    horizon INTEGER NOT NULL,
+    -- Version of the input the run was computed from; loaders skip unchanged inputs
+    input_version CHAR(32)
+);
+
+-- Stores created before input_version existed
+ALTER TABLE forecast_runs ADD COLUMN IF NOT EXISTS input_version CHAR(32);
+
+CREATE TABLE IF NOT EXISTS forecast_history (
+    run_id BIGINT NOT NULL,
+    run_date DATE NOT NULL,
+    keyword VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    forecast DECIMAL(10,2) NOT NULL,
+    lower_bound DECIMAL(10,2),
+    upper_bound DECIMAL(10,2),
+    PRIMARY KEY (run_date, run_id, date)
+) PARTITION BY RANGE (run_date);
+
+-- Current run of each keyword, swapped in the transaction that writes a run
+CREATE TABLE IF NOT EXISTS forecast_latest (
+    keyword VARCHAR(100) PRIMARY KEY,
+    run_id BIGINT NOT NULL,
+    run_date DATE NOT NULL,
+    generated_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION ensure_forecast_partition(day DATE) RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day)::date;
+    name TEXT := 'forecast_history_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF forecast_history FOR VALUES FROM (%L) TO (%L)',
+        name, month_start, (month_start + INTERVAL '1 month')::date
+    );
+    RETURN name;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE VIEW forecast_latest_points AS
+    SELECT l.keyword, l.run_id, l.generated_at, h.date, h.forecast, h.lower_bound, h.upper_bound
+    FROM forecast_latest l
+    JOIN forecast_history h ON h.run_date = l.run_date AND h.run_id = l.run_id;
+
+-- Past runs next to the values observed since, for accuracy tracking
+CREATE OR REPLACE VIEW forecast_errors AS
+    SELECT h.keyword, h.run_id, r.model, r.generated_at, h.date, h.forecast,
+           h.lower_bound, h.upper_bound, t.value AS actual
+    FROM forecast_history h
+    JOIN forecast_runs r ON r.run_id = h.run_id
+    JOIN trends_raw t ON t.keyword = h.keyword AND t.date = h.date AND t.region = 'worldwide';
+
+-- Latest AI forecast, same columns as the former ai_forecast table
+CREATE OR REPLACE VIEW ai_forecast AS
+    SELECT date, forecast, lower_bound, upper_bound, generated_at AS created_at
+    FROM forecast_latest_points
+    WHERE keyword = 'AI';
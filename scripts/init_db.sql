@@ -20,6 +20,16 @@ CREATE TABLE IF NOT EXISTS chatgpt_evolution (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Table for rolling evolution of any keyword (chatgpt_evolution mirrors ChatGPT)
+CREATE TABLE IF NOT EXISTS keyword_evolution (
+    keyword VARCHAR(100) NOT NULL,
+    region VARCHAR(10) NOT NULL DEFAULT 'worldwide',
+    date DATE NOT NULL,
+    value INTEGER NOT NULL,
+    rolling_28d_mean DECIMAL(10,2),
+    PRIMARY KEY (keyword, region, date)
+);
+
 -- Table for detected peaks
 CREATE TABLE IF NOT EXISTS ai_peaks (
     id SERIAL PRIMARY KEY,
@@ -41,6 +51,30 @@ CREATE TABLE IF NOT EXISTS geo_distribution (
     UNIQUE(keyword, region)
 );
 
+-- Table for full geographic breakdown (country, region and city levels)
+CREATE TABLE IF NOT EXISTS geo_interest (
+    keyword VARCHAR(100) NOT NULL,
+    resolution VARCHAR(10) NOT NULL,
+    parent_geo VARCHAR(10) NOT NULL DEFAULT '',
+    geo_code VARCHAR(100) NOT NULL,
+    geo_name VARCHAR(200) NOT NULL,
+    value SMALLINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (keyword, resolution, parent_geo, geo_code)
+);
+
+-- Precomputed top-N per keyword and level (read by the Grafana geo panel)
+CREATE TABLE IF NOT EXISTS geo_top_rollup (
+    keyword VARCHAR(100) NOT NULL,
+    resolution VARCHAR(10) NOT NULL,
+    parent_geo VARCHAR(10) NOT NULL DEFAULT '',
+    rank SMALLINT NOT NULL,
+    geo_code VARCHAR(100) NOT NULL,
+    geo_name VARCHAR(200) NOT NULL,
+    value SMALLINT NOT NULL,
+    PRIMARY KEY (keyword, resolution, parent_geo, rank)
+);
+
 -- Table for ML France vs USA comparison
 CREATE TABLE IF NOT EXISTS ml_comparison (
     id SERIAL PRIMARY KEY,
@@ -51,15 +85,152 @@ CREATE TABLE IF NOT EXISTS ml_comparison (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Table for forecasts
-CREATE TABLE IF NOT EXISTS ai_forecast (
+-- Forecast tables and views: scripts/forecast_store.sql, run right after this file
+
+-- Content hash of every keyword/region series, maintained by the loaders
+CREATE TABLE IF NOT EXISTS series_versions (
+    keyword VARCHAR(100) NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    content_hash CHAR(32) NOT NULL,
+    n_points INTEGER NOT NULL,
+    max_date DATE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (keyword, region)
+);
+
+-- Input version each transform/correlation/forecast was last computed from
+CREATE TABLE IF NOT EXISTS computation_versions (
+    computation VARCHAR(200) PRIMARY KEY,
+    input_version CHAR(32) NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Rolling-origin backtest summary per model and keyword (ml/backtest.py)
+CREATE TABLE IF NOT EXISTS forecast_backtest (
+    model VARCHAR(50) NOT NULL,
+    keyword VARCHAR(100) NOT NULL,
+    horizon INTEGER NOT NULL,
+    origins INTEGER NOT NULL,
+    mape DOUBLE PRECISION,
+    coverage80 DOUBLE PRECISION,
+    fit_seconds DOUBLE PRECISION,
+    evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, keyword, horizon)
+);
+
+-- Latest lagged correlation per keyword pair (scripts/analyze_correlation.py)
+CREATE TABLE IF NOT EXISTS keyword_correlations (
     id SERIAL PRIMARY KEY,
-    date DATE NOT NULL UNIQUE,
-    forecast DECIMAL(10,2) NOT NULL,
-    lower_bound DECIMAL(10,2),
-    upper_bound DECIMAL(10,2),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    keyword1 VARCHAR(100),
+    keyword2 VARCHAR(100),
+    correlation_coefficient DECIMAL,
+    optimal_lag_weeks INTEGER,
+    p_value DECIMAL,
+    is_significant BOOLEAN,
+    analysis_date TIMESTAMP DEFAULT NOW()
 );
+CREATE UNIQUE INDEX keyword_correlations_pair ON keyword_correlations (keyword1, keyword2);
+
+-- Rolling correlations per pair and window, and the running sums they are
+-- extended from (scripts/rolling_correlation.py)
+CREATE TABLE IF NOT EXISTS correlation_rolling (
+    keyword1 VARCHAR(100) NOT NULL,
+    keyword2 VARCHAR(100) NOT NULL,
+    window_weeks SMALLINT NOT NULL,
+    date DATE NOT NULL,
+    correlation DOUBLE PRECISION,
+    n_points INTEGER NOT NULL,
+    PRIMARY KEY (keyword1, keyword2, window_weeks, date)
+);
+
+CREATE TABLE IF NOT EXISTS correlation_rolling_state (
+    keyword1 VARCHAR(100) NOT NULL,
+    keyword2 VARCHAR(100) NOT NULL,
+    window_weeks SMALLINT NOT NULL,
+    last_date DATE NOT NULL,
+    n INTEGER NOT NULL,
+    sum_x DOUBLE PRECISION NOT NULL,
+    sum_y DOUBLE PRECISION NOT NULL,
+    sum_xx DOUBLE PRECISION NOT NULL,
+    sum_yy DOUBLE PRECISION NOT NULL,
+    sum_xy DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (keyword1, keyword2, window_weeks)
+);
+
+-- Granger lead/lag screening of keyword pairs (scripts/lead_lag_screening.py)
+CREATE TABLE IF NOT EXISTS lead_lag_pairs (
+    leader VARCHAR(100) NOT NULL,
+    follower VARCHAR(100) NOT NULL,
+    best_lag INTEGER NOT NULL,
+    f_stat DOUBLE PRECISION,
+    p_value DOUBLE PRECISION,
+    q_value DOUBLE PRECISION,
+    screened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (leader, follower)
+);
+
+-- Keywords ranked by significant pairs led minus followed
+CREATE OR REPLACE VIEW lead_lag_ranking AS
+    SELECT keyword,
+           COUNT(*) FILTER (WHERE role = 'leader') AS leads,
+           COUNT(*) FILTER (WHERE role = 'follower') AS follows,
+           COUNT(*) FILTER (WHERE role = 'leader') - COUNT(*) FILTER (WHERE role = 'follower') AS net_lead
+    FROM (
+        SELECT leader AS keyword, 'leader' AS role FROM lead_lag_pairs WHERE q_value < 0.05
+        UNION ALL
+        SELECT follower, 'follower' FROM lead_lag_pairs WHERE q_value < 0.05
+    ) roles
+    GROUP BY keyword;
+
+-- Period-over-period movers of every series (scripts/top_movers.py)
+CREATE TABLE IF NOT EXISTS top_movers (
+    period VARCHAR(10) NOT NULL,
+    keyword VARCHAR(100) NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    as_of DATE NOT NULL,
+    last_mean DOUBLE PRECISION NOT NULL,
+    prev_mean DOUBLE PRECISION NOT NULL,
+    change DOUBLE PRECISION NOT NULL,
+    pct_change DOUBLE PRECISION,
+    acceleration DOUBLE PRECISION,
+    z_score DOUBLE PRECISION,
+    content_hash CHAR(32) NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, keyword, region)
+);
+CREATE INDEX idx_top_movers_change ON top_movers (period, change);
+CREATE INDEX idx_top_movers_pct_change ON top_movers (period, pct_change);
+CREATE INDEX idx_top_movers_z_score ON top_movers (period, z_score);
+
+-- Min/max bucket downsampling of a series for long Grafana ranges, detected
+-- peaks always kept (scripts/downsample.py)
+CREATE OR REPLACE FUNCTION trends_downsample(
+    p_keyword VARCHAR, p_region VARCHAR, p_from DATE, p_to DATE, p_max_points INTEGER DEFAULT 1000
+) RETURNS TABLE (date DATE, value INTEGER) AS $$
+    WITH points AS (
+        SELECT t.date, t.value,
+               ntile(GREATEST(p_max_points / 2, 1)) OVER (ORDER BY t.date) AS bucket
+        FROM trends_raw t
+        WHERE t.keyword = p_keyword AND t.region = p_region
+          AND t.date BETWEEN p_from AND p_to
+    ),
+    ranked AS (
+        SELECT points.date, points.value,
+               row_number() OVER (PARTITION BY bucket ORDER BY points.value, points.date) AS low,
+               row_number() OVER (PARTITION BY bucket ORDER BY points.value DESC, points.date) AS high
+        FROM points
+    )
+    SELECT ranked.date, ranked.value FROM ranked WHERE low = 1 OR high = 1
+    UNION
+    -- Detected peaks are always kept (ai_peaks holds worldwide series)
+    SELECT t.date, t.value
+    FROM ai_peaks p
+    JOIN trends_raw t ON t.keyword = p.keyword AND t.date = p.date AND t.region = p_region
+    WHERE p.keyword = p_keyword AND p_region = 'worldwide'
+      AND p.date BETWEEN p_from AND p_to
+    ORDER BY 1
+$$ LANGUAGE sql STABLE;
 
 -- Create indexes for better query performance
 CREATE INDEX idx_trends_raw_keyword_date ON trends_raw(keyword, date);
@@ -67,7 +238,6 @@ CREATE INDEX idx_trends_raw_date ON trends_raw(date);
 CREATE INDEX idx_chatgpt_evolution_date ON chatgpt_evolution(date);
 CREATE INDEX idx_ai_peaks_date ON ai_peaks(date);
 CREATE INDEX idx_ml_comparison_date ON ml_comparison(date);
-CREATE INDEX idx_ai_forecast_date ON ai_forecast(date);
 
 -- Grant permissions
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO trends_user;
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Criblage meneur/suiveur (tests de Granger) sur toutes les paires de mots-clés
+
+Pour chaque paire ordonnée (x, y) et chaque ordre p = 1..max_lag, on teste si
+les p valeurs passées de x améliorent la prévision de y au-delà de ses
+propres p valeurs passées (test F de Granger, sur les différences premières
+standardisées, car les séries Google Trends ne sont pas stationnaires).
+
+Les matrices de décalages de chaque série sont calculées une seule fois et
+partagées par tous les tests : pour une cible y, la régression restreinte est
+factorisée (QR) une fois, puis toutes les sources sont testées ensemble par
+Frisch-Waugh (projection batchée). Les cibles sont réparties sur un pool de
+processus et chaque paire est mise en cache avec la version de ses deux
+séries (series_versions), si bien qu'un nouveau criblage ne recalcule que les
+paires dont une série a changé.
+"""
+import argparse
+import hashlib
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from scipy import stats
+
+from data_versions import ensure_version_tables
+
+# Database connection
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+CACHE_PATH = Path('data/processed/lead_lag_cache.pkl')
+OUTPUT_FILE = Path('data/processed/analytics/lead_lag_screening.csv')
+MAX_LAG = 4
+Q_THRESHOLD = 0.05
+
+LEAD_LAG_TABLES = """
+    CREATE TABLE IF NOT EXISTS lead_lag_pairs (
+        leader VARCHAR(100) NOT NULL,
+        follower VARCHAR(100) NOT NULL,
+        best_lag INTEGER NOT NULL,
+        f_stat DOUBLE PRECISION,
+        p_value DOUBLE PRECISION,
+        q_value DOUBLE PRECISION,
+        screened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (leader, follower)
+    );
+    CREATE OR REPLACE VIEW lead_lag_ranking AS
+        SELECT keyword,
+               COUNT(*) FILTER (WHERE role = 'leader') AS leads,
+               COUNT(*) FILTER (WHERE role = 'follower') AS follows,
+               COUNT(*) FILTER (WHERE role = 'leader') - COUNT(*) FILTER (WHERE role = 'follower') AS net_lead
+        FROM (
+            SELECT leader AS keyword, 'leader' AS role FROM lead_lag_pairs WHERE q_value < 0.05
+            UNION ALL
+            SELECT follower, 'follower' FROM lead_lag_pairs WHERE q_value < 0.05
+        ) roles
+        GROUP BY keyword;
+"""
+
+# Lag matrices shared with the worker processes (set by init_worker)
+_LAGS = None
+_TARGETS = None
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def lag_matrices(values, max_lag):
+    """
+    values: (keywords, times) -> lags (keywords, T, max_lag), targets (keywords, T)
+    with T = times - max_lag; lags[k, t, j] is the value j+1 steps before targets[k, t]
+    """
+    n = values.shape[1]
+    targets = values[:, max_lag:]
+    lags = np.stack([values[:, max_lag - j - 1:n - j - 1] for j in range(max_lag)], axis=2)
+    return lags, targets
+
+def init_worker(lags, targets):
+    global _LAGS, _TARGETS
+    _LAGS, _TARGETS = lags, targets
+
+def granger_target(target, sources, max_lag):
+    """
+    F statistics and p-values of every source -> target for lags 1..max_lag
+    Returns (f, p) arrays of shape (len(sources), max_lag)
+    """
+    y = _TARGETS[target]
+    T = len(y)
+    L = _LAGS[sources]
+    f_stats = np.full((len(sources), max_lag), np.nan)
+    p_values = np.full((len(sources), max_lag), np.nan)
+    for p in range(1, max_lag + 1):
+        # Restricted model: constant + p own lags, factorized once for all sources
+        Z = np.column_stack([np.ones(T), _LAGS[target, :, :p]])
+        Q, _ = np.linalg.qr(Z)
+        resid = y - Q @ (Q.T @ y)
+        rss_r = resid @ resid
+        # Frisch-Waugh: source lags residualized on the restricted design
+        X = L[:, :, :p]
+        M = X - np.einsum('ti,kip->ktp', Q, np.einsum('ti,ktp->kip', Q, X))
+        b = np.einsum('ktp,t->kp', M, resid)
+        G = np.einsum('ktp,ktq->kpq', M, M)
+        explained = np.einsum('kp,kp->k', b, np.einsum('kpq,kq->kp', np.linalg.pinv(G), b))
+        rss_u = rss_r - explained
+        df2 = T - 2 * p - 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            f = (explained / p) / (rss_u / df2)
+        f_stats[:, p - 1] = f
+        p_values[:, p - 1] = stats.f.sf(f, p, df2)
+    return target, sources, f_stats, p_values
+
+def benjamini_hochberg(p_values):
+    """q-values of an array of p-values (NaN kept as NaN)"""
+    p = np.asarray(p_values, dtype=float)
+    q = np.full(p.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    order = valid[np.argsort(p[valid])]
+    m = len(order)
+    ranked = p[order] * m / np.arange(1, m + 1)
+    q[order] = np.minimum(1.0, np.minimum.accumulate(ranked[::-1])[::-1])
+    return q
+
+def load_series(keywords=None, region='worldwide'):
+    """Wide frame (date x keyword) of trends_raw and the content hash of each series"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    ensure_version_tables(cursor)
+    conn.commit()
+    cursor.close()
+    params = {'keywords': list(keywords) if keywords else None, 'region': region}
+    df = pd.read_sql("""
+        SELECT keyword, date, value
+        FROM trends_raw
+        WHERE region = %(region)s AND (%(keywords)s::text[] IS NULL OR keyword = ANY(%(keywords)s::text[]))
+    """, conn, params=params)
+    versions = pd.read_sql("""
+        SELECT keyword, content_hash
+        FROM series_versions
+        WHERE region = %(region)s AND (%(keywords)s::text[] IS NULL OR keyword = ANY(%(keywords)s::text[]))
+    """, conn, params=params)
+    conn.close()
+    wide = df.pivot(index='date', columns='keyword', values='value').sort_index()
+    return wide, dict(zip(versions['keyword'], versions['content_hash']))
+
+def prepare(wide):
+    """Standardized first differences on the dates common to all keywords"""
+    common = wide.dropna()
+    diffs = common.diff().iloc[1:]
+    std = diffs.std().replace(0, np.nan)
+    z = ((diffs - diffs.mean()) / std).dropna(axis=1)
+    return z, common.index
+
+def pair_key(leader, follower, versions, index_key, max_lag):
+    return (leader, follower, versions.get(leader), versions.get(follower), index_key, max_lag)
+
+def screen(wide, versions, max_lag=MAX_LAG, workers=None, use_cache=True):
+    """Granger screening of every ordered pair, results as a ranked DataFrame"""
+    z, dates = prepare(wide)
+    keywords = list(z.columns)
+    if len(z) < 3 * max_lag + 2:
+        raise ValueError(f"Pas assez de dates communes ({len(z)}) pour max_lag={max_lag}")
+    # The common date index is part of the key: adding a shorter series changes every test
+    index_key = hashlib.md5(f"{dates.min()}|{dates.max()}|{len(dates)}".encode('utf-8')).hexdigest()
+
+    cache = {}
+    if use_cache and CACHE_PATH.exists():
+        with open(CACHE_PATH, 'rb') as f:
+            cache = pickle.load(f)
+
+    lags, targets = lag_matrices(z.to_numpy(dtype=float).T, max_lag)
+    tasks = []
+    for t, follower in enumerate(keywords):
+        sources = [s for s, leader in enumerate(keywords)
+                   if s != t and pair_key(leader, follower, versions, index_key, max_lag) not in cache]
+        if sources:
+            tasks.append((t, sources))
+
+    computed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(lags, targets)) as pool:
+            futures = [pool.submit(granger_target, t, sources, max_lag) for t, sources in tasks]
+            for future in futures:
+                t, sources, f_stats, p_values = future.result()
+                for i, s in enumerate(sources):
+                    key = pair_key(keywords[s], keywords[t], versions, index_key, max_lag)
+                    cache[key] = (f_stats[i], p_values[i])
+                    computed += 1
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_PATH.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(cache, f)
+        tmp.replace(CACHE_PATH)
+
+    total = len(keywords) * (len(keywords) - 1)
+    print(f"   {total} paires : {total - computed} en cache, {computed} calculées")
+
+    rows = []
+    for leader in keywords:
+        for follower in keywords:
+            if leader == follower:
+                continue
+            f_stats, p_values = cache[pair_key(leader, follower, versions, index_key, max_lag)]
+            if np.all(np.isnan(p_values)):
+                continue
+            best = int(np.nanargmin(p_values))
+            # Bonferroni over the lag orders tried, the pair keeps its best order
+            rows.append({'leader': leader, 'follower': follower, 'best_lag': best + 1,
+                         'f_stat': float(f_stats[best]),
+                         'p_value': float(min(1.0, p_values[best] * max_lag))})
+    result = pd.DataFrame(rows, columns=['leader', 'follower', 'best_lag', 'f_stat', 'p_value'])
+    result['q_value'] = benjamini_hochberg(result['p_value'].to_numpy())
+    return result.sort_values(['q_value', 'f_stat'], ascending=[True, False]).reset_index(drop=True)
+
+def ranking(pairs, threshold=Q_THRESHOLD):
+    """Leaders/followers: significant pairs counted per keyword"""
+    significant = pairs[pairs['q_value'] < threshold]
+    leads = significant['leader'].value_counts().rename('leads')
+    follows = significant['follower'].value_counts().rename('follows')
+    table = pd.concat([leads, follows], axis=1).fillna(0).astype(int)
+    table['net_lead'] = table['leads'] - table['follows']
+    return table.sort_values(['net_lead', 'leads'], ascending=False)
+
+def save_to_db(pairs):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(LEAD_LAG_TABLES)
+    cursor.execute("DELETE FROM lead_lag_pairs")
+    execute_values(cursor, """
+        INSERT INTO lead_lag_pairs (leader, follower, best_lag, f_stat, p_value, q_value)
+        VALUES %s
+    """, [(r.leader, r.follower, int(r.best_lag), r.f_stat, r.p_value, r.q_value)
+          for r in pairs.itertuples()])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Criblage meneur/suiveur (Granger) entre mots-clés")
+    parser.add_argument("--keywords", nargs="+", help="Mots-clés à cribler (défaut : tous ceux de trends_raw)")
+    parser.add_argument("--max-lag", type=int, default=MAX_LAG, help="Ordre maximal testé (en points)")
+    parser.add_argument("--workers", type=int, help="Processus (défaut : nombre de CPU)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignorer les résultats en cache")
+    parser.add_argument("--to-db", action="store_true", help="Écrire lead_lag_pairs (et la vue lead_lag_ranking)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🧭 Criblage meneur/suiveur (Granger)")
+    print("=" * 60)
+    wide, versions = load_series(args.keywords)
+    pairs = screen(wide, versions, max_lag=args.max_lag, workers=args.workers, use_cache=not args.no_cache)
+
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    pairs.to_csv(OUTPUT_FILE, index=False)
+    print(f"\n🏆 Meneurs / suiveurs (q < {Q_THRESHOLD}):")
+    print(ranking(pairs).head(20).to_string())
+    print(f"\n🔝 Paires les plus significatives:")
+    for r in pairs.head(10).itertuples():
+        print(f"   {r.leader} → {r.follower} ({r.best_lag} pts) F={r.f_stat:.2f} q={r.q_value:.4f}")
+    print(f"\n💾 Résultats sauvegardés: {OUTPUT_FILE}")
+    if args.to_db:
+        save_to_db(pairs)
+        print("✅ Table 'lead_lag_pairs' à jour")
@@ -2,11 +2,18 @@
 """
 Load existing CSV data from data/ folder into PostgreSQL
 """
+import hashlib
 import os
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_batch
 
+from data_versions import refresh_series_versions
+from forecast_store import record_forecast_run
+from pipeline_events import commit_with_events, publish_load
+from raw_reader import read_raw_csv
+from upsert import format_counts, upsert_rows
+
 # Database connection parameters
 DB_CONFIG = {
     'host': 'localhost',
@@ -30,7 +37,7 @@ def load_raw_trends():
         print(f"   ⚠️  File not found: {csv_path}")
         return
     
-    df = pd.read_csv(csv_path)
+    df = read_raw_csv(csv_path)
     print(f"   Found {len(df)} rows in raw data")
     
     conn = get_db_connection()
@@ -39,7 +46,7 @@ def load_raw_trends():
     # Prepare records for insertion
     records = []
     for _, row in df.iterrows():
-        date = pd.to_datetime(row['date']).date()
+        date = row['date'].date()
         
         # Insert each keyword as a separate record
         for col in df.columns:
@@ -48,18 +55,22 @@ def load_raw_trends():
                 value = int(row[col]) if pd.notna(row[col]) else 0
                 records.append((keyword, date, value, 'worldwide'))
     
-    # Insert with conflict handling
+    # Insert with conflict handling, unchanged rows are left untouched
     insert_query = """
         INSERT INTO trends_raw (keyword, date, value, region)
-        VALUES (%s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (keyword, date, region) 
         DO UPDATE SET value = EXCLUDED.value
+        WHERE trends_raw.value IS DISTINCT FROM EXCLUDED.value
+        RETURNING (xmax = 0)
     """
     
-    execute_batch(cursor, insert_query, records)
-    conn.commit()
+    counts = upsert_rows(cursor, insert_query, records)
+    refresh_series_versions(cursor, [c for c in df.columns if c != 'date'])
+    publish_load(cursor, 'csv', counts)
+    commit_with_events(conn)
     
-    print(f"   ✅ Loaded {len(records)} records to trends_raw")
+    print(f"   ✅ Loaded {len(records)} records to trends_raw ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
@@ -85,15 +96,18 @@ def load_chatgpt_evolution():
     
     insert_query = """
         INSERT INTO chatgpt_evolution (date, value, rolling_28d_mean)
-        VALUES (%s, %s, %s)
+        VALUES %s
         ON CONFLICT (date) 
         DO UPDATE SET value = EXCLUDED.value, rolling_28d_mean = EXCLUDED.rolling_28d_mean
+        WHERE (chatgpt_evolution.value, chatgpt_evolution.rolling_28d_mean)
+              IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rolling_28d_mean)
+        RETURNING (xmax = 0)
     """
     
-    execute_batch(cursor, insert_query, records)
+    counts = upsert_rows(cursor, insert_query, records)
     conn.commit()
     
-    print(f"   ✅ Loaded {len(records)} records to chatgpt_evolution")
+    print(f"   ✅ Loaded {len(records)} records to chatgpt_evolution ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
@@ -156,15 +170,18 @@ def load_geo_distribution():
     
     insert_query = """
         INSERT INTO geo_distribution (keyword, region, value, rank)
-        VALUES (%s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (keyword, region) 
         DO UPDATE SET value = EXCLUDED.value, rank = EXCLUDED.rank
+        WHERE (geo_distribution.value, geo_distribution.rank)
+              IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rank)
+        RETURNING (xmax = 0)
     """
     
-    execute_batch(cursor, insert_query, records)
+    counts = upsert_rows(cursor, insert_query, records)
     conn.commit()
     
-    print(f"   ✅ Loaded {len(records)} records to geo_distribution")
+    print(f"   ✅ Loaded {len(records)} records to geo_distribution ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
@@ -190,15 +207,18 @@ def load_ml_comparison():
     
     insert_query = """
         INSERT INTO ml_comparison (date, fr_value, us_value, diff)
-        VALUES (%s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (date) 
         DO UPDATE SET fr_value = EXCLUDED.fr_value, us_value = EXCLUDED.us_value, diff = EXCLUDED.diff
+        WHERE (ml_comparison.fr_value, ml_comparison.us_value, ml_comparison.diff)
+              IS DISTINCT FROM (EXCLUDED.fr_value, EXCLUDED.us_value, EXCLUDED.diff)
+        RETURNING (xmax = 0)
     """
     
-    execute_batch(cursor, insert_query, records)
+    counts = upsert_rows(cursor, insert_query, records)
     conn.commit()
     
-    print(f"   ✅ Loaded {len(records)} records to ml_comparison")
+    print(f"   ✅ Loaded {len(records)} records to ml_comparison ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
@@ -222,18 +242,17 @@ def load_ai_forecast():
     records = [(row['date'].date(), float(row['forecast']), float(row['lower80']), float(row['upper80'])) 
                for _, row in df.iterrows()]
     
-    insert_query = """
-        INSERT INTO ai_forecast (date, forecast, lower_bound, upper_bound)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (date) 
-        DO UPDATE SET forecast = EXCLUDED.forecast, lower_bound = EXCLUDED.lower_bound, upper_bound = EXCLUDED.upper_bound
-    """
-    
-    cursor.execute("DELETE FROM ai_forecast")
-    execute_batch(cursor, insert_query, records)
-    conn.commit()
-    
-    print(f"   ✅ Loaded {len(records)} records to ai_forecast")
+    # New forecast run unless the CSV is the one the latest run was loaded from
+    # (load_data.sql hashes the file the same way)
+    with open(csv_path, 'rb') as f:
+        version = hashlib.md5(f.read()).hexdigest()
+    run_id = record_forecast_run(cursor, 'AI', 'csv', records, input_version=version)
+    commit_with_events(conn)
+    
+    if run_id is None:
+        print("   ⏭️  Forecast CSV unchanged, latest run kept")
+    else:
+        print(f"   ✅ Loaded {len(records)} records to ai_forecast (run {run_id})")
     
     cursor.close()
     conn.close()
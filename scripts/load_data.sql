@@ -36,8 +36,41 @@ UPDATE geo_distribution SET keyword = 'Python';
 -- Load ML comparison
 \COPY ml_comparison (date, fr_value, us_value, diff) FROM '/tmp/data/processed/analytics/machine_learning_fr_us.csv' WITH (FORMAT CSV, HEADER) ON CONFLICT (date) DO UPDATE SET fr_value = EXCLUDED.fr_value, us_value = EXCLUDED.us_value, diff = EXCLUDED.diff;
 
--- Load AI forecast
-\COPY ai_forecast (date, forecast, lower_bound, upper_bound) FROM '/tmp/data/processed/analytics/ai_forecast.csv' WITH (FORMAT CSV, HEADER) ON CONFLICT (date) DO UPDATE SET forecast = EXCLUDED.forecast, lower_bound = EXCLUDED.lower_bound, upper_bound = EXCLUDED.upper_bound;
+-- Load AI forecast as a new forecast run (ai_forecast is a view on the latest run)
+CREATE TEMP TABLE temp_forecast (
+    date DATE,
+    forecast DECIMAL(10,2),
+    lower_bound DECIMAL(10,2),
+    upper_bound DECIMAL(10,2)
+);
+
+\COPY temp_forecast FROM '/tmp/data/processed/analytics/ai_forecast.csv' WITH (FORMAT CSV, HEADER);
+
+-- Same version as load_csv_to_postgres.py (md5 of the file): no new run for an unchanged CSV
+\set forecast_version `md5sum /tmp/data/processed/analytics/ai_forecast.csv | cut -c1-32`
+
+BEGIN;
+SELECT ensure_forecast_partition(CURRENT_DATE);
+WITH latest AS (
+    SELECT r.input_version
+    FROM forecast_latest l
+    JOIN forecast_runs r ON r.run_id = l.run_id
+    WHERE l.keyword = 'AI'
+), run AS (
+    INSERT INTO forecast_runs (keyword, model, horizon, input_version)
+    SELECT 'AI', 'csv', COUNT(*), :'forecast_version' FROM temp_forecast
+    HAVING NOT EXISTS (SELECT 1 FROM latest WHERE input_version = :'forecast_version')
+    RETURNING run_id, run_date, generated_at
+), points AS (
+    INSERT INTO forecast_history (run_id, run_date, keyword, date, forecast, lower_bound, upper_bound)
+    SELECT run.run_id, run.run_date, 'AI', f.date, f.forecast, f.lower_bound, f.upper_bound
+    FROM temp_forecast f CROSS JOIN run
+)
+INSERT INTO forecast_latest (keyword, run_id, run_date, generated_at)
+SELECT 'AI', run_id, run_date, generated_at FROM run
+ON CONFLICT (keyword)
+DO UPDATE SET run_id = EXCLUDED.run_id, run_date = EXCLUDED.run_date, generated_at = EXCLUDED.generated_at;
+COMMIT;
 
 -- Show summary
 SELECT 'trends_raw' as table_name, COUNT(*) as records FROM trends_raw
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Bulk load Parquet trends data into PostgreSQL with binary COPY
+
+Reads the output of trends_utils.merge_paths() (long format: date, value,
+keyword, ingestion_ts) or extract_trends.write_output() (wide format: date
+plus one column per keyword) as Arrow record batches. Each batch is encoded
+straight into PostgreSQL's binary COPY format with NumPy, so no Python object
+is created per row. Rows go to a staging table, then one INSERT ... SELECT
+upserts them into trends_raw, leaving rows whose value did not change untouched.
+"""
+import argparse
+import io
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import psycopg2
+from psycopg2.extras import execute_values
+
+from data_versions import refresh_series_versions
+from pipeline_events import commit_with_events, publish_load
+from upsert import format_counts, upsert_select
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+# PostgreSQL dates count days from 2000-01-01, Arrow date32 from 1970-01-01
+PG_EPOCH_DAYS = 10957
+
+# One fixed-width binary COPY tuple of the staging table
+STAGE_ROW = np.dtype([
+    ('nfields', '>i2'),
+    ('keyword_len', '>i4'), ('keyword_id', '>i4'),
+    ('date_len', '>i4'), ('date', '>i4'),
+    ('value_len', '>i4'), ('value', '>f8'),
+    ('ingestion_len', '>i4'), ('ingestion_ts', '>i8'),
+])
+
+IGNORED_COLUMNS = {'date', 'isPartial', 'ingestion_ts', 'ingestion_date', '__index_level_0__'}
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def list_parquet_files(paths):
+    """Expand files and dataset directories into a sorted list of Parquet files"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob('*.parquet')))
+        elif path.exists():
+            files.append(path)
+        else:
+            print(f"   ⚠️  File not found: {path}")
+    return files
+
+class KeywordIds:
+    """Maps keyword strings to integer ids (one lookup per dictionary entry, not per row)"""
+
+    def __init__(self):
+        self.ids = {}
+
+    def lookup(self, keywords):
+        for keyword in keywords:
+            self.ids.setdefault(keyword, len(self.ids))
+        return np.array([self.ids[k] for k in keywords], dtype=np.int32)
+
+def to_pg_days(column):
+    """Arrow date/timestamp/string column -> int32 days since 2000-01-01"""
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        column = pc.cast(column, pa.timestamp('us'))
+    if pa.types.is_timestamp(column.type):
+        column = pc.cast(column, pa.date32())
+    days = column.cast(pa.int32()).to_numpy(zero_copy_only=False)
+    return days - PG_EPOCH_DAYS
+
+def encode_rows(keyword_ids, days, values, ingestion_us):
+    """Encode aligned NumPy arrays as binary COPY tuples"""
+    rows = np.empty(len(days), dtype=STAGE_ROW)
+    rows['nfields'] = 4
+    rows['keyword_len'] = 4
+    rows['keyword_id'] = keyword_ids
+    rows['date_len'] = 4
+    rows['date'] = days
+    rows['value_len'] = 8
+    rows['value'] = values
+    rows['ingestion_len'] = 8
+    rows['ingestion_ts'] = ingestion_us
+    return rows.tobytes()
+
+def numeric(column):
+    """Float64 NumPy view of an Arrow column, nulls as 0 like the CSV loaders"""
+    return pc.fill_null(column.cast(pa.float64()), 0.0).to_numpy(zero_copy_only=False)
+
+def encode_batch(batch, keywords):
+    """Encode one record batch (long or wide layout) into binary COPY bytes"""
+    names = batch.schema.names
+    days = to_pg_days(batch.column('date'))
+    if 'ingestion_ts' in names:
+        ingestion = pc.fill_null(batch.column('ingestion_ts').cast(pa.timestamp('us')).cast(pa.int64()), 0)
+        ingestion_us = ingestion.to_numpy(zero_copy_only=False)
+    else:
+        ingestion_us = 0
+
+    if 'keyword' in names:
+        column = batch.column('keyword')
+        if not pa.types.is_dictionary(column.type):
+            column = pc.dictionary_encode(column)
+        ids = keywords.lookup(column.dictionary.to_pylist())
+        indices = column.indices.to_numpy(zero_copy_only=False)
+        return encode_rows(ids[indices], days, numeric(batch.column('value')), ingestion_us)
+
+    # Wide layout: one column per keyword
+    chunks = []
+    for name in names:
+        if name in IGNORED_COLUMNS:
+            continue
+        keyword_id = keywords.lookup([name])[0]
+        chunks.append(encode_rows(keyword_id, days, numeric(batch.column(name)), ingestion_us))
+    return b''.join(chunks)
+
+class CopyStream(io.RawIOBase):
+    """File-like object feeding generated chunks to cursor.copy_expert()"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def copy_chunks(files, keywords, batch_size):
+    yield PGCOPY_HEADER
+    for path in files:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield encode_batch(batch, keywords)
+    yield PGCOPY_TRAILER
+
+def load_files(files, region='worldwide', batch_size=65536):
+    """Load Parquet files over one connection in a single transaction"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TEMP TABLE trends_stage (
+            keyword_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            value DOUBLE PRECISION NOT NULL,
+            ingestion_ts BIGINT NOT NULL
+        ) ON COMMIT DROP
+    """)
+    keywords = KeywordIds()
+    cursor.copy_expert(
+        "COPY trends_stage FROM STDIN WITH (FORMAT BINARY)",
+        CopyStream(copy_chunks(files, keywords, batch_size)),
+        size=1 << 20
+    )
+    staged = cursor.rowcount
+
+    cursor.execute("""
+        CREATE TEMP TABLE keyword_stage (
+            keyword_id INTEGER PRIMARY KEY,
+            keyword VARCHAR(100) NOT NULL
+        ) ON COMMIT DROP
+    """)
+    execute_values(cursor, "INSERT INTO keyword_stage (keyword, keyword_id) VALUES %s",
+                   list(keywords.ids.items()))
+
+    cursor.execute("SELECT COUNT(*) FROM (SELECT DISTINCT keyword_id, date FROM trends_stage) points")
+    points = cursor.fetchone()[0]
+
+    # Latest ingestion wins when a point appears in several files of this call;
+    # rows are written in key order so parallel loaders lock them in the same order
+    counts = upsert_select(cursor, """
+        INSERT INTO trends_raw (keyword, date, value, region)
+        SELECT keyword, date, value, %s
+        FROM (
+            SELECT DISTINCT ON (k.keyword, s.date)
+                   k.keyword, s.date, trunc(s.value)::integer AS value
+            FROM trends_stage s
+            JOIN keyword_stage k USING (keyword_id)
+            ORDER BY k.keyword, s.date, s.ingestion_ts DESC
+        ) latest
+        ORDER BY keyword, date
+        ON CONFLICT (keyword, date, region)
+        DO UPDATE SET value = EXCLUDED.value
+        WHERE trends_raw.value IS DISTINCT FROM EXCLUDED.value
+        RETURNING (xmax = 0)
+    """, (region,), source_rows=points)
+
+    refresh_series_versions(cursor, list(keywords.ids))
+    publish_load(cursor, 'parquet', counts)
+    commit_with_events(conn)
+
+    cursor.close()
+    conn.close()
+    return staged, counts
+
+def ingestion_order(path):
+    # ingestion_date=YYYY-MM-DD partitions sort by date, then by file name
+    partition = next((part for part in path.parts if part.startswith('ingestion_date=')), '')
+    return partition, path.name
+
+def load_parallel(files, workers, region='worldwide', batch_size=65536):
+    """Load each Parquet file over its own connection
+
+    Files are submitted oldest first, but they commit in any order: a point
+    present in several files keeps the value of the last file to commit, not
+    necessarily the latest ingestion. Load overlapping files without --parallel.
+    """
+    staged = 0
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(load_files, [path], region, batch_size): path
+                   for path in sorted(files, key=ingestion_order)}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                file_staged, file_counts = future.result()
+            except Exception as e:
+                print(f"   ❌ {path}: {str(e)}")
+                continue
+            staged += file_staged
+            for key in counts:
+                counts[key] += file_counts[key]
+            print(f"   ✅ {path.name}: {file_staged} rows ({format_counts(file_counts)})")
+    return staged, counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk load Parquet trends data into PostgreSQL')
+    parser.add_argument('paths', nargs='+',
+                       help='Parquet files or dataset directories (e.g. data/processed/google_trends_all_daily)')
+    parser.add_argument('--region', default='worldwide',
+                       help='Region stored with the loaded series')
+    parser.add_argument('--parallel', type=int, default=1,
+                       help='Load files over N connections in parallel (for files that do '
+                            'not overlap: across files the last commit wins)')
+    parser.add_argument('--batch-size', type=int, default=65536,
+                       help='Rows per Arrow record batch')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📦 Load Parquet Data to PostgreSQL (binary COPY)")
+    print("=" * 60)
+
+    files = list_parquet_files(args.paths)
+    if not files:
+        print("   ⚠️  No Parquet file to load")
+        return
+    print(f"📂 {len(files)} Parquet file(s)")
+
+    start = time.perf_counter()
+    if args.parallel > 1 and len(files) > 1:
+        staged, counts = load_parallel(files, args.parallel, args.region, args.batch_size)
+    else:
+        staged, counts = load_files(files, args.region, args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n   ✅ Staged {staged} rows into trends_raw ({format_counts(counts)}) in {elapsed:.2f}s")
+    print(f"   ⚡ {staged / max(elapsed, 1e-9):,.0f} rows/s")
+
+if __name__ == '__main__':
+    main()
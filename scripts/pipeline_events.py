@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Pipeline events for push subscribers
+
+Stages publish small JSON events (which series a load changed, peaks found,
+a new forecast run, a stage finished) on the PostgreSQL channel
+pipeline_events and append them to data/processed/pipeline_events.jsonl
+(under the repo root, rotated to .jsonl.1 past MAX_EVENTS_BYTES).
+The API forwards them to its /events subscribers: through LISTEN when it can
+reach the database, by following the file otherwise.
+
+An event published with a cursor is a NOTIFY inside the caller's transaction,
+so subscribers only hear about data once it is committed. Its line in the
+events file is written by commit_with_events() after that commit succeeds;
+events of a transaction that is rolled back (or never committed) are dropped.
+"""
+import atexit
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+CHANNEL = 'pipeline_events'
+ROOT_DIR = Path(__file__).resolve().parent.parent
+EVENTS_FILE = ROOT_DIR / 'data' / 'processed' / 'pipeline_events.jsonl'
+MAX_EVENTS_BYTES = 10 << 20  # the events file is rotated (one previous file kept) beyond this
+MAX_PAYLOAD = 7900  # NOTIFY payloads are limited to 8000 bytes
+CONNECT_TIMEOUT = 2  # seconds; standalone events fall back to the file alone
+
+# Events published in a connection's open transaction: id(conn) -> (conn, [texts])
+_pending = {}
+
+# Connection reused by publish_standalone() for the whole run (False: database unreachable)
+_standalone = {'conn': None}
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+def event_payload(event, data):
+    """JSON text of an event, list fields dropped if it would not fit in a NOTIFY"""
+    # Microsecond times keep equal events published in the same second apart
+    # (the API derives event ids from the payload)
+    message = {'event': event, 'time': datetime.utcnow().isoformat(timespec='microseconds'), **data}
+    text = json.dumps(message, default=str, separators=(',', ':'))
+    if len(text.encode('utf-8')) > MAX_PAYLOAD:
+        message = {k: v for k, v in message.items() if not isinstance(v, (list, dict))}
+        message['truncated'] = True
+        text = json.dumps(message, default=str, separators=(',', ':'))
+    return text
+
+def append_event(text):
+    EVENTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    if EVENTS_FILE.exists() and EVENTS_FILE.stat().st_size > MAX_EVENTS_BYTES:
+        os.replace(EVENTS_FILE, EVENTS_FILE.with_name(EVENTS_FILE.name + '.1'))
+    with open(EVENTS_FILE, 'a', encoding='utf-8') as f:
+        f.write(text + '\n')
+
+def publish(cursor, event, **data):
+    """Notify `event` when the cursor's transaction commits
+
+    The caller commits with commit_with_events() so the event also reaches the
+    events file, once committed.
+    """
+    text = event_payload(event, data)
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, text))
+    conn = cursor.connection
+    entry = _pending.get(id(conn))
+    if entry is None or entry[0] is not conn:
+        # A previous connection with this id was closed without committing
+        entry = _pending[id(conn)] = (conn, [])
+    entry[1].append(text)
+
+def commit_with_events(conn):
+    """Commit, then append the events published in the transaction to the events file"""
+    conn.commit()
+    entry = _pending.pop(id(conn), None)
+    if entry is not None and entry[0] is conn:
+        for text in entry[1]:
+            append_event(text)
+
+def standalone_connection():
+    """Autocommit connection shared by standalone events, None once the database proved unreachable"""
+    if _standalone['conn'] is None:
+        try:
+            import psycopg2
+            conn = psycopg2.connect(**DB_CONFIG, connect_timeout=CONNECT_TIMEOUT)
+        except ImportError:
+            conn = False
+        except psycopg2.Error as e:
+            print(f"   ⚠️  Pipeline events go to the file only: {str(e).strip()}")
+            conn = False
+        else:
+            conn.autocommit = True
+            atexit.register(conn.close)
+        _standalone['conn'] = conn
+    return _standalone['conn'] or None
+
+def publish_standalone(event, **data):
+    """Publish outside any transaction (e.g. from the pipeline runner); the database is optional"""
+    text = event_payload(event, data)
+    conn = standalone_connection()
+    if conn is not None:
+        import psycopg2
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, text))
+        except psycopg2.Error as e:
+            print(f"   ⚠️  Pipeline events go to the file only: {str(e).strip()}")
+            conn.close()
+            _standalone['conn'] = False
+    append_event(text)
+
+def publish_load(cursor, source, counts):
+    """'load' event listing the series the current transaction changed, if any"""
+    if counts['inserted'] or counts['updated']:
+        publish(cursor, 'load', source=source, counts=counts, series=changed_series(cursor))
+
+def changed_series(cursor):
+    """Series (keyword, region, max_date, n_points) whose version changed in the current transaction"""
+    # refresh_series_versions() sets updated_at = CURRENT_TIMESTAMP, the transaction start time
+    cursor.execute("""
+        SELECT keyword, region, max_date, n_points
+        FROM series_versions
+        WHERE updated_at = CURRENT_TIMESTAMP
+        ORDER BY keyword, region
+    """)
+    return [
+        {'keyword': keyword, 'region': region, 'max_date': max_date, 'n_points': n_points}
+        for keyword, region, max_date, n_points in cursor.fetchall()
+    ]
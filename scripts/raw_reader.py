@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Fast reader for raw and analytics CSV files
+
+Column types are inferred once from a sample and cached next to the file
+(<name>.csv.schema.json). Later reads pass the explicit schema to Arrow's
+multi-threaded CSV engine, parse timestamps with a fixed parser instead of
+per-value format inference, and only decode the requested columns.
+"""
+import csv
+import json
+import re
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+SAMPLE_ROWS = 1000
+SCHEMA_SUFFIX = '.schema.json'
+
+# Formats recognised when sniffing date columns. ISO dates (with optional time
+# and fractional seconds, e.g. '2024-11-17 15:30:37.214991') use Arrow's
+# dedicated ISO8601 parser, the others an explicit strptime format.
+ISO8601 = 'ISO8601'
+DATE_PATTERNS = [
+    (re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?)?$'), ISO8601),
+    (re.compile(r'^\d{2}/\d{2}/\d{4}$'), '%d/%m/%Y'),
+]
+INT_RE = re.compile(r'^[+-]?\d+$')
+FLOAT_RE = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$|^(nan|NaN|inf|-inf)$')
+
+
+def schema_path(path):
+    path = Path(path)
+    return path.with_name(path.name + SCHEMA_SUFFIX)
+
+
+def _column_type(values):
+    values = [v for v in values if v != '']
+    if not values:
+        return 'float64'
+    for pattern, fmt in DATE_PATTERNS:
+        if all(pattern.match(v) for v in values):
+            return f'timestamp:{fmt}'
+    if all(INT_RE.match(v) for v in values):
+        return 'int64'
+    if all(FLOAT_RE.match(v) for v in values):
+        return 'float64'
+    return 'string'
+
+
+def infer_schema(path, sample_rows=SAMPLE_ROWS):
+    """Infer column types from the header and the first rows of a CSV"""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        sample = list(islice(reader, sample_rows))
+    columns = {}
+    for i, name in enumerate(header):
+        columns[name] = _column_type([row[i] for row in sample if i < len(row)])
+    return {'header': header, 'columns': columns}
+
+
+def load_schema(path, refresh=False):
+    """Cached schema of a CSV, re-inferred when missing or when the header changed"""
+    cache = schema_path(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    if cache.exists() and not refresh:
+        schema = json.loads(cache.read_text(encoding='utf-8'))
+        if schema.get('header') == header:
+            return schema
+    return save_schema(path, infer_schema(path))
+
+
+def save_schema(path, schema):
+    try:
+        schema_path(path).write_text(json.dumps(schema, indent=2), encoding='utf-8')
+    except OSError:
+        # Read-only data directory: keep the schema in memory only
+        pass
+    return schema
+
+
+def _arrow_type(kind):
+    if kind.startswith('timestamp:'):
+        return pa.timestamp('us')
+    return {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string()}[kind]
+
+
+def _read_arrow(path, schema, columns, parse_dates):
+    column_types = {}
+    formats = set()
+    for name in columns:
+        kind = schema['columns'][name]
+        if kind.startswith('timestamp:') and not parse_dates:
+            column_types[name] = pa.string()
+            continue
+        column_types[name] = _arrow_type(kind)
+        if kind.startswith('timestamp:'):
+            formats.add(kind.split(':', 1)[1])
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=columns,
+            timestamp_parsers=[pa_csv.ISO8601 if f == ISO8601 else f for f in sorted(formats)] or None,
+        ),
+    )
+    return table.to_pandas()
+
+
+def _read_pandas(path, schema, columns, parse_dates):
+    dtypes = {}
+    dates = {}
+    for name in columns:
+        kind = schema['columns'][name]
+        if kind.startswith('timestamp:'):
+            dtypes[name] = str
+            if parse_dates:
+                dates[name] = kind.split(':', 1)[1]
+        else:
+            dtypes[name] = {'int64': 'Int64', 'float64': 'float64', 'string': str}[kind]
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+    for name, fmt in dates.items():
+        df[name] = pd.to_datetime(df[name], format=fmt)
+    return df[columns]
+
+
+def read_raw_csv(path, columns=None, parse_dates=True):
+    """Read a CSV with its cached schema, optionally projecting `columns`
+
+    Timestamps are parsed with the cached fixed format (or kept as strings when
+    parse_dates is False). Raises KeyError for a column missing from the file.
+    """
+    schema = load_schema(path)
+    if columns is None:
+        columns = list(schema['header'])
+    missing = [c for c in columns if c not in schema['columns']]
+    if missing:
+        raise KeyError(f"Columns {missing} not found in {path}")
+
+    reader = _read_arrow if pa is not None else _read_pandas
+    try:
+        return reader(path, schema, list(columns), parse_dates)
+    except ValueError:
+        # Values past the sample do not match the cached types (ArrowInvalid is
+        # a ValueError): infer from the whole file and retry once
+        schema = save_schema(path, infer_schema(path, sample_rows=None))
+        return reader(path, schema, list(columns), parse_dates)
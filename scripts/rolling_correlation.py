@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Corrélations glissantes (fenêtres de 12 et 26 semaines) maintenues incrémentalement
+
+Pour chaque paire et chaque fenêtre, correlation_rolling_state conserve les
+sommes courantes (n, Σx, Σy, Σx², Σy², Σxy) des points de la fenêtre se
+terminant à last_date. Une exécution ne lit que les nouveaux points et ceux
+qui sortent de la fenêtre, et ajoute une ligne par nouvelle date dans
+correlation_rolling (une série temporelle compacte par paire, lue par Grafana).
+
+Les valeurs de trends_raw sont entières : les sommes restent exactes en
+double précision, sans dérive au fil des ajouts/retraits. Si l'historique a
+été réécrit (ré-extraction renormalisée par Google Trends), les sommes de la
+dernière fenêtre ne correspondent plus à la base et la paire est recalculée.
+"""
+import argparse
+import math
+from datetime import timedelta
+from itertools import combinations
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+# Database connection
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+WINDOWS_WEEKS = (12, 26)
+MIN_POINTS = 8  # no correlation is emitted for windows with fewer common points
+
+ROLLING_TABLES = """
+    CREATE TABLE IF NOT EXISTS correlation_rolling (
+        keyword1 VARCHAR(100) NOT NULL,
+        keyword2 VARCHAR(100) NOT NULL,
+        window_weeks SMALLINT NOT NULL,
+        date DATE NOT NULL,
+        correlation DOUBLE PRECISION,
+        n_points INTEGER NOT NULL,
+        PRIMARY KEY (keyword1, keyword2, window_weeks, date)
+    );
+    CREATE TABLE IF NOT EXISTS correlation_rolling_state (
+        keyword1 VARCHAR(100) NOT NULL,
+        keyword2 VARCHAR(100) NOT NULL,
+        window_weeks SMALLINT NOT NULL,
+        last_date DATE NOT NULL,
+        n INTEGER NOT NULL,
+        sum_x DOUBLE PRECISION NOT NULL,
+        sum_y DOUBLE PRECISION NOT NULL,
+        sum_xx DOUBLE PRECISION NOT NULL,
+        sum_yy DOUBLE PRECISION NOT NULL,
+        sum_xy DOUBLE PRECISION NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (keyword1, keyword2, window_weeks)
+    );
+"""
+
+# Common points of both series, worldwide, within (start, end]
+PAIR_POINTS = """
+    SELECT a.date, a.value, b.value
+    FROM trends_raw a
+    JOIN trends_raw b ON b.date = a.date AND b.region = a.region AND b.keyword = %(keyword2)s
+    WHERE a.keyword = %(keyword1)s AND a.region = 'worldwide'
+      AND (%(start)s::date IS NULL OR a.date > %(start)s::date)
+      AND (%(end)s::date IS NULL OR a.date <= %(end)s::date)
+    ORDER BY a.date
+"""
+
+PAIR_SUMS = """
+    SELECT COUNT(*), COALESCE(SUM(a.value), 0), COALESCE(SUM(b.value), 0),
+           COALESCE(SUM(a.value * a.value), 0), COALESCE(SUM(b.value * b.value), 0),
+           COALESCE(SUM(a.value * b.value), 0)
+    FROM trends_raw a
+    JOIN trends_raw b ON b.date = a.date AND b.region = a.region AND b.keyword = %(keyword2)s
+    WHERE a.keyword = %(keyword1)s AND a.region = 'worldwide'
+      AND a.date > %(start)s AND a.date <= %(end)s
+"""
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def ensure_rolling_tables(cursor):
+    """Create the rolling correlation tables on databases initialized before they existed"""
+    cursor.execute(ROLLING_TABLES)
+
+class RunningSums:
+    """Pearson correlation sums over a sliding window"""
+
+    def __init__(self, n=0, sx=0.0, sy=0.0, sxx=0.0, syy=0.0, sxy=0.0):
+        self.n, self.sx, self.sy, self.sxx, self.syy, self.sxy = n, sx, sy, sxx, syy, sxy
+
+    def add(self, x, y, sign=1):
+        self.n += sign
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxx += sign * x * x
+        self.syy += sign * y * y
+        self.sxy += sign * x * y
+
+    def as_tuple(self):
+        return (self.n, self.sx, self.sy, self.sxx, self.syy, self.sxy)
+
+    def correlation(self):
+        """Pearson r, None for short or constant windows"""
+        if self.n < MIN_POINTS:
+            return None
+        var_x = self.n * self.sxx - self.sx * self.sx
+        var_y = self.n * self.syy - self.sy * self.sy
+        if var_x <= 0 or var_y <= 0:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / math.sqrt(var_x * var_y)
+
+def load_state(cursor, keyword1, keyword2, window_weeks):
+    cursor.execute("""
+        SELECT last_date, n, sum_x, sum_y, sum_xx, sum_yy, sum_xy
+        FROM correlation_rolling_state
+        WHERE keyword1 = %s AND keyword2 = %s AND window_weeks = %s
+    """, (keyword1, keyword2, window_weeks))
+    row = cursor.fetchone()
+    if row is None:
+        return None, RunningSums()
+    return row[0], RunningSums(*row[1:])
+
+def state_matches(cursor, keyword1, keyword2, window, last_date, sums):
+    """True when the stored sums still describe the database's last window"""
+    cursor.execute(PAIR_SUMS, {'keyword1': keyword1, 'keyword2': keyword2,
+                               'start': last_date - window, 'end': last_date})
+    stored = sums.as_tuple()
+    return all(math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-6)
+               for a, b in zip(cursor.fetchone(), stored))
+
+def update_pair(cursor, keyword1, keyword2, window_weeks, rebuild=False):
+    """Extend the rolling correlation of one pair/window; returns the number of new dates"""
+    window = timedelta(weeks=window_weeks)
+    last_date, sums = (None, RunningSums()) if rebuild else load_state(cursor, keyword1, keyword2, window_weeks)
+
+    if last_date is not None and not state_matches(cursor, keyword1, keyword2, window, last_date, sums):
+        print(f"   🔄 {keyword1} / {keyword2} ({window_weeks} sem.): historique modifié, recalcul complet")
+        last_date, sums = None, RunningSums()
+    if last_date is None:
+        cursor.execute("""
+            DELETE FROM correlation_rolling
+            WHERE keyword1 = %s AND keyword2 = %s AND window_weeks = %s
+        """, (keyword1, keyword2, window_weeks))
+
+    params = {'keyword1': keyword1, 'keyword2': keyword2}
+    cursor.execute(PAIR_POINTS, {**params, 'start': last_date, 'end': None})
+    new_points = cursor.fetchall()
+    if not new_points:
+        return 0
+
+    # Points leaving the window while the new ones are added. From scratch they
+    # are part of new_points themselves, so they are taken from that list.
+    if last_date is None:
+        leaving = new_points
+    else:
+        cursor.execute(PAIR_POINTS, {**params, 'start': last_date - window,
+                                     'end': new_points[-1][0] - window})
+        leaving = cursor.fetchall()
+
+    rows = []
+    out = 0
+    for day, x, y in new_points:
+        sums.add(x, y)
+        while out < len(leaving) and leaving[out][0] <= day - window:
+            sums.add(leaving[out][1], leaving[out][2], sign=-1)
+            out += 1
+        rows.append((keyword1, keyword2, window_weeks, day, sums.correlation(), sums.n))
+
+    execute_values(cursor, """
+        INSERT INTO correlation_rolling (keyword1, keyword2, window_weeks, date, correlation, n_points)
+        VALUES %s
+        ON CONFLICT (keyword1, keyword2, window_weeks, date)
+        DO UPDATE SET correlation = EXCLUDED.correlation,
+                     n_points = EXCLUDED.n_points
+    """, rows)
+    cursor.execute("""
+        INSERT INTO correlation_rolling_state
+            (keyword1, keyword2, window_weeks, last_date, n, sum_x, sum_y, sum_xx, sum_yy, sum_xy)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (keyword1, keyword2, window_weeks)
+        DO UPDATE SET last_date = EXCLUDED.last_date,
+                     n = EXCLUDED.n,
+                     sum_x = EXCLUDED.sum_x,
+                     sum_y = EXCLUDED.sum_y,
+                     sum_xx = EXCLUDED.sum_xx,
+                     sum_yy = EXCLUDED.sum_yy,
+                     sum_xy = EXCLUDED.sum_xy,
+                     updated_at = CURRENT_TIMESTAMP
+    """, (keyword1, keyword2, window_weeks, new_points[-1][0], *sums.as_tuple()))
+    return len(rows)
+
+def update_rolling_correlations(pairs, windows=WINDOWS_WEEKS, rebuild=False):
+    """Update every (pair, window), one transaction per pair"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    ensure_rolling_tables(cursor)
+    conn.commit()
+
+    for keyword1, keyword2 in pairs:
+        for window_weeks in windows:
+            added = update_pair(cursor, keyword1, keyword2, window_weeks, rebuild=rebuild)
+            print(f"   {keyword1} / {keyword2} ({window_weeks} sem.): {added} nouvelle(s) date(s)")
+        conn.commit()
+
+    cursor.close()
+    conn.close()
+
+def parse_pair(text):
+    keyword1, sep, keyword2 = text.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Paire attendue sous la forme 'A:B', reçu {text!r}")
+    return keyword1, keyword2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corrélations glissantes incrémentales entre mots-clés")
+    parser.add_argument("--pairs", nargs="+", type=parse_pair, default=[('ChatGPT', 'Data Science')],
+                        help="Paires 'A:B' (défaut : ChatGPT:Data Science)")
+    parser.add_argument("--keywords", nargs="+", help="Toutes les paires de ces mots-clés (remplace --pairs)")
+    parser.add_argument("--windows", nargs="+", type=int, default=list(WINDOWS_WEEKS),
+                        help="Fenêtres en semaines")
+    parser.add_argument("--rebuild", action="store_true", help="Recalculer depuis le début de l'historique")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📈 Corrélations glissantes")
+    print("=" * 60)
+    pairs = list(combinations(args.keywords, 2)) if args.keywords else args.pairs
+    update_rolling_correlations(pairs, windows=args.windows, rebuild=args.rebuild)
+    print("✅ Table 'correlation_rolling' à jour")
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Run the Google Trends pipeline as a DAG of stages
+
+Each stage declares its dependencies and the files it reads. Independent
+stages run concurrently (bounded by --jobs), stages whose inputs are
+unchanged since their last successful run are skipped, and a timing report
+with the critical path is printed at the end.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pipeline_events import publish_standalone
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+STATE_FILE = ROOT_DIR / 'data' / 'processed' / '.pipeline_state.json'
+
+PEAK_KEYWORDS = ['AI', 'Data Science']
+
+
+@dataclass
+class Stage:
+    """A pipeline step: a command plus its dependencies and file inputs"""
+    name: str
+    command: list
+    deps: tuple = ()
+    # Glob patterns (relative to the repo root) hashed to decide whether to skip.
+    # A stage without inputs reads external state (Google Trends) and always runs;
+    # one with inputs also reruns when a dependency ran.
+    inputs: tuple = ()
+    status: str = 'pending'
+    start: float = 0.0
+    end: float = 0.0
+    output: str = ''
+    input_hash: str = field(default='', repr=False)
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def python_script(path, *args):
+    """Command running a repo script with the current interpreter"""
+    return [sys.executable, str(ROOT_DIR / path), *args]
+
+
+def python_module(module, *args):
+    """Command running a repo module (python -m) from the repo root"""
+    return [sys.executable, '-m', module, *args]
+
+
+def build_stages(args):
+    """Declare the pipeline stages and their dependencies"""
+    extract_args = ['--insecure'] if args.insecure else []
+    engine_args = ['--engine', args.engine]
+    stages = []
+
+    if args.from_csv:
+        stages.append(Stage(
+            'load', python_script('scripts/load_csv_to_postgres.py'),
+            inputs=('scripts/load_csv_to_postgres.py', 'data/raw/*.csv', 'data/processed/analytics/*.csv'),
+        ))
+    else:
+        stages.append(Stage('load', python_script('scripts/extract_to_postgres.py', *extract_args)))
+
+    if args.full_extract:
+        # Stages calling Google Trends run one after another: the rate limiter is
+        # per process, so concurrent extracts would add up their request rates
+        stages.append(Stage('geo', python_script(
+            'scripts/extract_to_postgres.py', *extract_args, '--skip-trends', '--geo'), deps=('load',)))
+        stages.append(Stage('comparison', python_script(
+            'scripts/extract_to_postgres.py', *extract_args, '--skip-trends', '--comparison'), deps=('geo',)))
+
+    # Database stages read what 'load' wrote: their inputs are their own code, and
+    # they rerun whenever 'load' ran (see run_pipeline)
+    transform_inputs = ('scripts/transform_to_postgres.py', 'scripts/airflow_scripts/rolling_zscore.py',
+                        'scripts/data_versions.py', 'scripts/forecast_store.py', 'scripts/upsert.py')
+    stages.append(Stage('evolution', python_script(
+        'scripts/transform_to_postgres.py', '--steps', 'evolution', *engine_args), deps=('load',),
+        inputs=transform_inputs))
+    for keyword in PEAK_KEYWORDS:
+        stages.append(Stage(f'peaks:{keyword}', python_script(
+            'scripts/transform_to_postgres.py', '--steps', 'peaks', '--keywords', keyword, *engine_args),
+            deps=('load',), inputs=transform_inputs))
+    stages.append(Stage('forecast_db', python_script(
+        'scripts/transform_to_postgres.py', '--steps', 'forecast'), deps=('load',), inputs=transform_inputs))
+    stages.append(Stage('correlation', python_script('scripts/analyze_correlation.py'), deps=('load',),
+                        inputs=('scripts/analyze_correlation.py', 'scripts/correlation_significance.py',
+                                'scripts/data_versions.py')))
+    stages.append(Stage('rolling_correlation', python_script('scripts/rolling_correlation.py'), deps=('load',),
+                        inputs=('scripts/rolling_correlation.py',)))
+    stages.append(Stage('similarity', python_script('scripts/similarity_index.py'), deps=('load',),
+                        inputs=('scripts/similarity_index.py',)))
+    stages.append(Stage('movers', python_script('scripts/top_movers.py'), deps=('load',),
+                        inputs=('scripts/top_movers.py', 'scripts/data_versions.py')))
+    stages.append(Stage(
+        'forecast_ml', python_module('ml.ai_forecast'),
+        inputs=('ml/ai_forecast.py', 'ml/ets.py', 'ml/order_selection.py', 'data/raw/google_trends_daily_*.csv'),
+    ))
+    stages.append(Stage(
+        'shared_cache', python_module('dashboards.shared_cache', '--build'), deps=('forecast_ml',),
+        inputs=('dashboards/shared_cache.py', 'data/processed/analytics/*.csv'),
+    ))
+    return stages
+
+
+def hash_inputs(stage):
+    """Content hash of the stage command and every file matched by its inputs"""
+    digest = hashlib.sha256(json.dumps(stage.command[1:]).encode('utf-8'))
+    for pattern in stage.inputs:
+        for path in sorted(glob.glob(str(ROOT_DIR / pattern))):
+            digest.update(Path(path).relative_to(ROOT_DIR).as_posix().encode('utf-8'))
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_state():
+    if STATE_FILE.exists():
+        return json.loads(STATE_FILE.read_text(encoding='utf-8'))
+    return {}
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding='utf-8')
+    tmp.replace(STATE_FILE)
+
+
+def run_stage(stage):
+    """Run one stage in a subprocess, capturing its output"""
+    stage.start = time.perf_counter()
+    proc = subprocess.run(stage.command, cwd=ROOT_DIR, capture_output=True, text=True)
+    stage.end = time.perf_counter()
+    stage.output = proc.stdout + proc.stderr
+    stage.status = 'done' if proc.returncode == 0 else 'failed'
+    return stage
+
+
+def run_pipeline(stages, jobs=4, force=False, dry_run=False):
+    """Execute stages in dependency order with at most `jobs` running at once"""
+    by_name = {s.name: s for s in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    state = load_state()
+    t0 = time.perf_counter()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            progressed = False
+            for stage in stages:
+                if stage.status != 'pending' or len(running) >= jobs:
+                    continue
+                dep_states = [by_name[d].status for d in stage.deps]
+                if any(st in ('failed', 'blocked') for st in dep_states):
+                    stage.status = 'blocked'
+                    progressed = True
+                    continue
+                if any(st in ('pending', 'running') for st in dep_states):
+                    continue
+
+                progressed = True
+                deps_ran = any(st == 'done' for st in dep_states)
+                if stage.inputs:
+                    stage.input_hash = hash_inputs(stage)
+                unchanged = stage.inputs and state.get(stage.name) == stage.input_hash
+                if unchanged and not deps_ran and not force:
+                    stage.status = 'skipped'
+                    stage.start = stage.end = time.perf_counter()
+                    print(f"⏭️  {stage.name}: inputs unchanged, skipped")
+                    continue
+                if dry_run:
+                    stage.status = 'done'
+                    stage.start = stage.end = time.perf_counter()
+                    print(f"📝 {stage.name}: {' '.join(stage.command)}")
+                    continue
+
+                stage.status = 'running'
+                print(f"▶️  {stage.name}")
+                running[pool.submit(run_stage, stage)] = stage
+
+            if not running:
+                if all(s.status != 'pending' for s in stages):
+                    break
+                if not progressed:
+                    raise ValueError("Dependency cycle between pending stages")
+                # Newly resolved stages (skips) may have unblocked others
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                future.result()
+                icon = '✅' if stage.status == 'done' else '❌'
+                print(f"{icon} {stage.name} ({stage.duration:.1f}s)")
+                publish_standalone('stage', name=stage.name, status=stage.status,
+                                   duration=round(stage.duration, 3))
+                if stage.status == 'failed':
+                    print('\n'.join(f"   | {line}" for line in stage.output.rstrip().splitlines()))
+                elif stage.inputs:
+                    state[stage.name] = stage.input_hash
+                    save_state(state)
+
+    for stage in stages:
+        if stage.end:
+            stage.start -= t0
+            stage.end -= t0
+    return time.perf_counter() - t0
+
+
+def critical_path(stages):
+    """Chain of stages ending last, following the latest-finishing dependency"""
+    by_name = {s.name: s for s in stages}
+    executed = [s for s in stages if s.status in ('done', 'failed', 'skipped')]
+    if not executed:
+        return []
+    stage = max(executed, key=lambda s: s.end)
+    path = [stage]
+    while stage.deps:
+        stage = max((by_name[d] for d in stage.deps), key=lambda s: s.end)
+        path.append(stage)
+    return list(reversed(path))
+
+
+def print_report(stages, wall_time):
+    print("\n" + "=" * 60)
+    print("⏱️  Timing report")
+    print("=" * 60)
+    print(f"   {'stage':25} {'status':8} {'start':>8} {'duration':>9}")
+    for stage in sorted(stages, key=lambda s: s.start):
+        print(f"   {stage.name:25} {stage.status:8} {stage.start:7.1f}s {stage.duration:8.1f}s")
+
+    path = critical_path(stages)
+    busy = sum(s.duration for s in stages)
+    print(f"\n   Critical path: {' → '.join(s.name for s in path)}")
+    print(f"   Critical path time: {sum(s.duration for s in path):.1f}s")
+    print(f"   Wall time: {wall_time:.1f}s (sequential would be {busy:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Google Trends pipeline with parallel stages')
+    parser.add_argument('--jobs', '-j', type=int, default=4,
+                       help='Maximum number of stages running at once')
+    parser.add_argument('--from-csv', action='store_true',
+                       help='Load the CSV files in data/ instead of calling Google Trends')
+    parser.add_argument('--full-extract', action='store_true',
+                       help='Also extract geographic and comparison data')
+    parser.add_argument('--insecure', action='store_true',
+                       help='Disable SSL verification (for corporate proxies)')
+    parser.add_argument('--engine', choices=['auto', 'sql', 'python', 'both'], default='auto',
+                       help='Engine of the evolution/peaks transforms (see transform_to_postgres.py)')
+    parser.add_argument('--only', nargs='+',
+                       help='Run only these stages (dependencies are not added)')
+    parser.add_argument('--force', action='store_true',
+                       help='Run every stage even if its inputs are unchanged')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Print the commands without running them')
+
+    args = parser.parse_args()
+
+    stages = build_stages(args)
+    if args.only:
+        stages = [s for s in stages if s.name in args.only]
+        kept = {s.name for s in stages}
+        for stage in stages:
+            stage.deps = tuple(d for d in stage.deps if d in kept)
+
+    print("=" * 60)
+    print("🚀 Google Trends Analytics Pipeline")
+    print("=" * 60)
+
+    wall_time = run_pipeline(stages, jobs=max(1, args.jobs), force=args.force, dry_run=args.dry_run)
+    print_report(stages, wall_time)
+
+    failed = [s.name for s in stages if s.status in ('failed', 'blocked')]
+    if failed:
+        print(f"\n❌ Pipeline failed: {', '.join(failed)}")
+        sys.exit(1)
+    print("\n✅ Pipeline complete!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Similarity index over trends_raw series
+
+Every keyword/region series is reduced to the shape of its last year: weekly
+means over SPAN_WEEKS weeks, z-normalized, then averaged into SEGMENTS
+equal segments (PAA). The embeddings are stored in
+data/processed/similarity_index.npz with the series content hash they were
+computed from, so an update only re-embeds the series whose hash changed in
+series_versions since the last build.
+
+Queries are an exact brute-force scan of the (series x SEGMENTS) float32
+matrix: one matrix-vector product and an argpartition, a few milliseconds
+for 100k series. The PAA distance lower-bounds the Euclidean distance between
+the z-normalized weekly series.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+INDEX_PATH = Path('data/processed/similarity_index.npz')
+SPAN_WEEKS = 52
+SEGMENTS = 13
+MIN_WEEKS = 26  # series with less history are left out of the index
+BATCH_SIZE = 5000  # series fetched per query when embedding
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def series_key(keyword, region):
+    return f"{keyword}|{region}"
+
+def embed(dates, values):
+    """PAA embedding of one series, None when it is too short or flat"""
+    weekly = pd.Series(np.asarray(values, dtype=np.float64), index=pd.DatetimeIndex(dates)).resample('W').mean()
+    weekly = weekly.iloc[-SPAN_WEEKS:].interpolate(limit_direction='both')
+    if len(weekly) < MIN_WEEKS or weekly.isna().any():
+        return None
+    std = weekly.std(ddof=0)
+    if not std:
+        return None
+    z = ((weekly - weekly.mean()) / std).to_numpy()
+    # Shorter series are stretched onto the same number of segments
+    segments = np.array_split(z, SEGMENTS)
+    return np.array([s.mean() for s in segments], dtype=np.float32)
+
+class SimilarityIndex:
+    """Embeddings of every series plus their content hashes"""
+
+    def __init__(self, keys=None, hashes=None, embeddings=None):
+        self.keys = np.asarray(keys if keys is not None else [], dtype=object)
+        self.hashes = np.asarray(hashes if hashes is not None else [], dtype=object)
+        self.embeddings = (np.asarray(embeddings, dtype=np.float32) if embeddings is not None
+                           else np.empty((0, SEGMENTS), dtype=np.float32))
+        self._reindex()
+
+    def _reindex(self):
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.sq_norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        if not Path(path).exists():
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['keys'].astype(object), data['hashes'].astype(object), data['embeddings'])
+
+    def save(self, path=INDEX_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        np.savez(tmp, keys=self.keys.astype(str), hashes=self.hashes.astype(str), embeddings=self.embeddings)
+        tmp.replace(path)
+
+    def upsert(self, keys, hashes, embeddings):
+        """Replace or append embeddings by key"""
+        keys = list(keys)
+        existing = [self.positions.get(k) for k in keys]
+        update = [(i, pos) for i, pos in enumerate(existing) if pos is not None]
+        if update:
+            src, dst = zip(*update)
+            self.embeddings[list(dst)] = np.asarray(embeddings, dtype=np.float32)[list(src)]
+            self.hashes[list(dst)] = np.asarray(hashes, dtype=object)[list(src)]
+        new = [i for i, pos in enumerate(existing) if pos is None]
+        if new:
+            self.keys = np.concatenate([self.keys, np.asarray(keys, dtype=object)[new]])
+            self.hashes = np.concatenate([self.hashes, np.asarray(hashes, dtype=object)[new]])
+            self.embeddings = np.vstack([self.embeddings, np.asarray(embeddings, dtype=np.float32)[new]])
+        self._reindex()
+
+    def remove(self, keys):
+        drop = [self.positions[k] for k in keys if k in self.positions]
+        if drop:
+            keep = np.setdiff1d(np.arange(len(self.keys)), drop)
+            self.keys, self.hashes, self.embeddings = self.keys[keep], self.hashes[keep], self.embeddings[keep]
+            self._reindex()
+
+    def query(self, keyword, region='worldwide', k=10):
+        """The k series closest to keyword/region: [(keyword, region, distance)]"""
+        key = series_key(keyword, region)
+        if key not in self.positions:
+            raise KeyError(key)
+        i = self.positions[key]
+        q = self.embeddings[i]
+        # ||a - q||^2 = ||a||^2 - 2 a.q + ||q||^2, the query itself excluded
+        d2 = self.sq_norms - 2 * (self.embeddings @ q) + self.sq_norms[i]
+        d2[i] = np.inf
+        k = min(k, len(d2) - 1)
+        if k <= 0:
+            return []
+        nearest = np.argpartition(d2, k - 1)[:k]
+        nearest = nearest[np.argsort(d2[nearest])]
+        # Scaled back to the distance between the weekly z-normalized series
+        scale = np.sqrt(SPAN_WEEKS / SEGMENTS)
+        return [(*self.keys[j].split('|', 1), float(np.sqrt(max(d2[j], 0.0)) * scale)) for j in nearest]
+
+def fetch_embeddings(cursor, series):
+    """Embeddings of [(keyword, region)] from their last SPAN_WEEKS weeks in trends_raw"""
+    cursor.execute("""
+        SELECT t.keyword, t.region, t.date, t.value
+        FROM trends_raw t
+        JOIN series_versions v ON v.keyword = t.keyword AND v.region = t.region
+        WHERE (t.keyword, t.region) IN %s
+          AND t.date > v.max_date - %s
+        ORDER BY t.keyword, t.region, t.date
+    """, (tuple(series), SPAN_WEEKS * 7))
+    df = pd.DataFrame(cursor.fetchall(), columns=['keyword', 'region', 'date', 'value'])
+    embedded = {}
+    for (keyword, region), group in df.groupby(['keyword', 'region'], sort=False):
+        vector = embed(group['date'], group['value'])
+        if vector is not None:
+            embedded[(keyword, region)] = vector
+    return embedded
+
+def update_index(path=INDEX_PATH, rebuild=False):
+    """Re-embed the series whose content hash changed; returns (updated, removed)"""
+    index = SimilarityIndex() if rebuild else SimilarityIndex.load(path)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT keyword, region, content_hash FROM series_versions")
+    versions = {series_key(k, r): h for k, r, h in cursor.fetchall()}
+
+    stored = dict(zip(index.keys, index.hashes))
+    changed = [key for key, h in versions.items() if stored.get(key) != h]
+    removed = [key for key in stored if key not in versions]
+
+    updated = 0
+    for start in range(0, len(changed), BATCH_SIZE):
+        batch = changed[start:start + BATCH_SIZE]
+        embedded = fetch_embeddings(cursor, [tuple(key.split('|', 1)) for key in batch])
+        keys = [key for key in batch if tuple(key.split('|', 1)) in embedded]
+        # Series now too short or flat are dropped from the index
+        removed += [key for key in batch if key not in keys and key in stored]
+        if keys:
+            index.upsert(keys, [versions[key] for key in keys],
+                         np.stack([embedded[tuple(key.split('|', 1))] for key in keys]))
+            updated += len(keys)
+    cursor.close()
+    conn.close()
+
+    index.remove(removed)
+    if updated or removed or rebuild:
+        index.save(path)
+    return updated, len(removed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the series similarity index')
+    parser.add_argument('--rebuild', action='store_true', help='Re-embed every series')
+    parser.add_argument('--query', help='Keyword to search neighbours for (no update)')
+    parser.add_argument('--region', default='worldwide', help='Region of the query keyword')
+    parser.add_argument('-k', type=int, default=10, help='Number of neighbours')
+    args = parser.parse_args()
+
+    if args.query:
+        index = SimilarityIndex.load()
+        start = time.perf_counter()
+        neighbours = index.query(args.query, args.region, args.k)
+        elapsed = (time.perf_counter() - start) * 1000
+        for keyword, region, distance in neighbours:
+            print(f"   {keyword:30} {region:10} {distance:8.3f}")
+        print(f"   {len(index.keys)} series searched in {elapsed:.2f} ms")
+    else:
+        print("=" * 60)
+        print("🔎 Similarity Index")
+        print("=" * 60)
+        updated, removed = update_index(rebuild=args.rebuild)
+        print(f"   ✅ {updated} series embedded, {removed} removed ({INDEX_PATH})")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Top movers: period-over-period change of every keyword/region series
+
+For each period (week, month, quarter) the last period of a series (ending
+at its latest date) is compared with the one before: change and % change of
+the mean, acceleration (change minus the previous change) and the z-score of
+the last period against the preceding year. Results live in top_movers,
+indexed by (period, metric), so the API reads a top-N with an index scan and
+never touches trends_raw.
+
+Everything runs in SQL, and only series whose content hash in series_versions
+differs from the hash stored with their row are recomputed after a load.
+"""
+import argparse
+import uuid
+
+import psycopg2
+
+from data_versions import ensure_version_tables, record_version
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'trends_db',
+    'user': 'trends_user',
+    'password': 'trends_pass'
+}
+
+PERIODS = {'week': 7, 'month': 28, 'quarter': 91}
+BASELINE_DAYS = 364
+
+TOP_MOVERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS top_movers (
+        period VARCHAR(10) NOT NULL,
+        keyword VARCHAR(100) NOT NULL,
+        region VARCHAR(10) NOT NULL,
+        as_of DATE NOT NULL,
+        last_mean DOUBLE PRECISION NOT NULL,
+        prev_mean DOUBLE PRECISION NOT NULL,
+        change DOUBLE PRECISION NOT NULL,
+        pct_change DOUBLE PRECISION,
+        acceleration DOUBLE PRECISION,
+        z_score DOUBLE PRECISION,
+        content_hash CHAR(32) NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (period, keyword, region)
+    );
+    CREATE INDEX IF NOT EXISTS idx_top_movers_change ON top_movers (period, change);
+    CREATE INDEX IF NOT EXISTS idx_top_movers_pct_change ON top_movers (period, pct_change);
+    CREATE INDEX IF NOT EXISTS idx_top_movers_z_score ON top_movers (period, z_score);
+"""
+
+# bucket 0 is the last period of the series (dates in (max_date - days, max_date]),
+# bucket 1 the one before, and so on back to the baseline year
+MOVERS_UPSERT = """
+    WITH changed AS (
+        SELECT v.keyword, v.region, v.max_date, v.content_hash
+        FROM series_versions v
+        LEFT JOIN top_movers m
+               ON m.period = %(period)s AND m.keyword = v.keyword AND m.region = v.region
+        WHERE %(force)s OR m.content_hash IS DISTINCT FROM v.content_hash
+    ),
+    buckets AS (
+        SELECT c.keyword, c.region, c.max_date, c.content_hash,
+               (c.max_date - t.date) / %(days)s AS bucket, t.value
+        FROM changed c
+        JOIN trends_raw t ON t.keyword = c.keyword AND t.region = c.region
+        WHERE t.date > c.max_date - GREATEST(%(baseline)s + %(days)s, 3 * %(days)s)
+    ),
+    stats AS (
+        SELECT keyword, region, max_date, content_hash,
+               AVG(value) FILTER (WHERE bucket = 0) AS m0,
+               AVG(value) FILTER (WHERE bucket = 1) AS m1,
+               AVG(value) FILTER (WHERE bucket = 2) AS m2,
+               AVG(value) FILTER (WHERE bucket >= 1) AS base_mean,
+               STDDEV_SAMP(value) FILTER (WHERE bucket >= 1) AS base_std
+        FROM buckets
+        GROUP BY keyword, region, max_date, content_hash
+    )
+    INSERT INTO top_movers (period, keyword, region, as_of, last_mean, prev_mean, change,
+                            pct_change, acceleration, z_score, content_hash)
+    SELECT %(period)s, keyword, region, max_date, m0, m1, m0 - m1,
+           100 * (m0 - m1) / NULLIF(m1, 0),
+           (m0 - m1) - (m1 - m2),
+           (m0 - base_mean) / NULLIF(base_std, 0),
+           content_hash
+    FROM stats
+    WHERE m0 IS NOT NULL AND m1 IS NOT NULL
+    ON CONFLICT (period, keyword, region)
+    DO UPDATE SET as_of = EXCLUDED.as_of,
+                 last_mean = EXCLUDED.last_mean,
+                 prev_mean = EXCLUDED.prev_mean,
+                 change = EXCLUDED.change,
+                 pct_change = EXCLUDED.pct_change,
+                 acceleration = EXCLUDED.acceleration,
+                 z_score = EXCLUDED.z_score,
+                 content_hash = EXCLUDED.content_hash,
+                 computed_at = CURRENT_TIMESTAMP
+"""
+
+def get_db_connection():
+    """Create database connection"""
+    return psycopg2.connect(**DB_CONFIG)
+
+def ensure_top_movers_table(cursor):
+    """Create top_movers on databases initialized before it existed"""
+    cursor.execute(TOP_MOVERS_TABLE)
+
+def refresh_top_movers(periods=PERIODS, force=False):
+    """Recompute the movers of changed series for every period; returns rows written per period"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    ensure_version_tables(cursor)
+    ensure_top_movers_table(cursor)
+
+    written = {}
+    for period in periods:
+        cursor.execute(MOVERS_UPSERT, {'period': period, 'days': PERIODS[period],
+                                       'baseline': BASELINE_DAYS, 'force': force})
+        written[period] = cursor.rowcount
+        # Series removed from trends_raw leave series_versions too
+        cursor.execute("""
+            DELETE FROM top_movers m
+            WHERE m.period = %s AND NOT EXISTS (
+                SELECT 1 FROM series_versions v WHERE v.keyword = m.keyword AND v.region = m.region
+            )
+        """, (period,))
+        written[period] += cursor.rowcount
+    if any(written.values()):
+        # New watermark for the API's ETag / Last-Modified on /trends/movers
+        record_version(cursor, 'top_movers', uuid.uuid4().hex)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description='Rank keywords by period-over-period change')
+    parser.add_argument('--periods', nargs='+', choices=list(PERIODS), default=list(PERIODS),
+                       help='Periods to compute (default: all)')
+    parser.add_argument('--force', action='store_true',
+                       help='Recompute every series, not only the changed ones')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🚀 Top Movers")
+    print("=" * 60)
+    written = refresh_top_movers(args.periods, force=args.force)
+    for period, rows in written.items():
+        print(f"   {period:8} {rows} series updated")
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for period in args.periods:
+        cursor.execute("""
+            SELECT keyword, region, pct_change, z_score
+            FROM top_movers
+            WHERE period = %s
+            ORDER BY change DESC
+            LIMIT 5
+        """, (period,))
+        print(f"\n📈 Top risers ({period}):")
+        for keyword, region, pct_change, z_score in cursor.fetchall():
+            pct = f"{pct_change:+.1f}%" if pct_change is not None else "n/a"
+            z = f"{z_score:+.2f}" if z_score is not None else "n/a"
+            print(f"   {keyword:25} {region:10} {pct:>9}  z={z}")
+    cursor.close()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
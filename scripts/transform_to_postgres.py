@@ -1,13 +1,25 @@
 #!/usr/bin/env python3
 """
 Transform trends data and create analytics in PostgreSQL
+
+Evolution and peak detection run either as set-based SQL (window functions
+and INSERT ... SELECT, nothing leaves the database) or in Python with the
+vectorized rolling z-score kernel of airflow_scripts/rolling_zscore.py (--engine).
 """
+import argparse
+import time
 import pandas as pd
 import numpy as np
 import psycopg2
 from psycopg2.extras import execute_batch
 from scipy import stats
 
+from airflow_scripts.rolling_zscore import rolling_zscore, to_matrix
+from data_versions import input_version, is_up_to_date, record_version
+from forecast_store import record_forecast_run
+from pipeline_events import commit_with_events, publish
+from upsert import format_counts, upsert_rows, upsert_select
+
 # Database connection parameters
 DB_CONFIG = {
     'host': 'localhost',
@@ -17,118 +29,264 @@ DB_CONFIG = {
     'password': 'trends_pass'
 }
 
+# Rolling windows are expressed in time units so they stay 28 days whether
+# trends_raw holds daily or weekly points
+ROLLING_WINDOW = '28D'
+
+# Series shorter than this are not scanned for peaks
+MIN_PEAK_POINTS = 5
+
+# RANGE frames with an offset (used by the SQL engine) exist since PostgreSQL 11
+SQL_MIN_SERVER_VERSION = 110000
+ENGINES = ['auto', 'sql', 'python', 'both']
+
+EVOLUTION_TABLE = """
+    CREATE TABLE IF NOT EXISTS keyword_evolution (
+        keyword VARCHAR(100) NOT NULL,
+        region VARCHAR(10) NOT NULL DEFAULT 'worldwide',
+        date DATE NOT NULL,
+        value INTEGER NOT NULL,
+        rolling_28d_mean DECIMAL(10,2),
+        PRIMARY KEY (keyword, region, date)
+    )
+"""
+
 def get_db_connection():
     """Create database connection"""
     return psycopg2.connect(**DB_CONFIG)
 
-def transform_chatgpt_evolution():
-    """Transform ChatGPT data with rolling mean"""
-    print("📊 Transforming ChatGPT evolution data...")
-    
+def check_input_version(conn, computation, series, params=None, force=False):
+    """Return (up_to_date, version) of a computation over trends_raw series"""
+    cursor = conn.cursor()
+    version = input_version(cursor, series, params)
+    up_to_date = not force and is_up_to_date(cursor, computation, version)
+    cursor.close()
+    if up_to_date:
+        print("   ⏭️  Input data unchanged since last run, skipped")
+    return up_to_date, version
+
+def sql_window_frame():
+    """SQL frame equivalent to ROLLING_WINDOW over a DATE column
+
+    pandas' '28D' window covers (t - 28 days, t], i.e. the current day and the
+    27 before it.
+    """
+    days = pd.Timedelta(ROLLING_WINDOW).days - 1
+    return f"RANGE BETWEEN INTERVAL '{days} days' PRECEDING AND CURRENT ROW"
+
+def resolve_engine(engine):
+    """Pick the execution engine for 'auto': SQL when the server has RANGE offset frames"""
+    if engine != 'auto':
+        return engine
     conn = get_db_connection()
-    
-    # Read ChatGPT data
-    query = """
-        SELECT date, value 
-        FROM trends_raw 
+    server_version = conn.server_version
+    conn.close()
+    return 'sql' if server_version >= SQL_MIN_SERVER_VERSION else 'python'
+
+def stale_keywords(conn, prefix, keywords, params=None, force=False):
+    """Map keyword -> input version for the keywords whose computation must rerun"""
+    stale = {}
+    for keyword in keywords:
+        print(f"   • {keyword}")
+        up_to_date, version = check_input_version(conn, f'{prefix}:{keyword}', [(keyword, 'worldwide')],
+                                                  params=params, force=force)
+        if not up_to_date:
+            stale[keyword] = version
+    return stale
+
+def mirror_chatgpt_evolution(cursor):
+    """Copy the ChatGPT series of keyword_evolution into chatgpt_evolution (read by Grafana)"""
+    return upsert_select(cursor, """
+        INSERT INTO chatgpt_evolution (date, value, rolling_28d_mean)
+        SELECT date, value, rolling_28d_mean
+        FROM keyword_evolution
         WHERE keyword = 'ChatGPT' AND region = 'worldwide'
-        ORDER BY date
-    """
-    df = pd.read_sql(query, conn)
-    
-    if df.empty:
-        print("   ⚠️  No ChatGPT data found")
-        conn.close()
-        return
-    
-    # Calculate rolling mean (28 days / 4 weeks)
-    df['rolling_28d_mean'] = df['value'].rolling(window=4, min_periods=1).mean()
-    
-    # Insert into chatgpt_evolution table
-    cursor = conn.cursor()
-    
-    records = [(row['date'], int(row['value']), float(row['rolling_28d_mean'])) 
-               for _, row in df.iterrows()]
+        ON CONFLICT (date) 
+        DO UPDATE SET value = EXCLUDED.value, 
+                     rolling_28d_mean = EXCLUDED.rolling_28d_mean
+        WHERE (chatgpt_evolution.value, chatgpt_evolution.rolling_28d_mean)
+              IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rolling_28d_mean)
+        RETURNING (xmax = 0)
+    """)
+
+def evolution_python(cursor, conn, keywords):
+    """Rolling mean computed in pandas, rows sent back with a batched upsert"""
+    df = pd.read_sql("""
+        SELECT keyword, date, value 
+        FROM trends_raw 
+        WHERE keyword = ANY(%(keywords)s) AND region = 'worldwide'
+        ORDER BY keyword, date
+    """, conn, params={'keywords': list(keywords)})
+    
+    records = []
+    df['date'] = pd.to_datetime(df['date'])
+    for keyword, group in df.groupby('keyword', sort=False):
+        # Calculate rolling mean over 28 days (time-based, independent of sampling)
+        rolling_mean = group.set_index('date')['value'].rolling(ROLLING_WINDOW, min_periods=1).mean().values
+        records.extend((keyword, 'worldwide', date.date(), int(value), float(mean))
+                       for date, value, mean in zip(group['date'], group['value'], rolling_mean))
     
     insert_query = """
-        INSERT INTO chatgpt_evolution (date, value, rolling_28d_mean)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (date) 
+        INSERT INTO keyword_evolution (keyword, region, date, value, rolling_28d_mean)
+        VALUES %s
+        ON CONFLICT (keyword, region, date) 
         DO UPDATE SET value = EXCLUDED.value, 
                      rolling_28d_mean = EXCLUDED.rolling_28d_mean
+        WHERE (keyword_evolution.value, keyword_evolution.rolling_28d_mean)
+              IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rolling_28d_mean)
+        RETURNING (xmax = 0)
     """
+    return upsert_rows(cursor, insert_query, records)
+
+def evolution_sql(cursor, conn, keywords):
+    """Rolling mean computed by a window function, without leaving the database"""
+    return upsert_select(cursor, f"""
+        INSERT INTO keyword_evolution (keyword, region, date, value, rolling_28d_mean)
+        SELECT keyword, region, date, value, AVG(value) OVER w
+        FROM trends_raw
+        WHERE keyword = ANY(%(keywords)s) AND region = 'worldwide'
+        WINDOW w AS (PARTITION BY keyword, region ORDER BY date {sql_window_frame()})
+        ON CONFLICT (keyword, region, date) 
+        DO UPDATE SET value = EXCLUDED.value, 
+                     rolling_28d_mean = EXCLUDED.rolling_28d_mean
+        WHERE (keyword_evolution.value, keyword_evolution.rolling_28d_mean)
+              IS DISTINCT FROM (EXCLUDED.value, EXCLUDED.rolling_28d_mean)
+        RETURNING (xmax = 0)
+    """, {'keywords': list(keywords)})
+
+def transform_evolution(keywords=('ChatGPT',), engine='python', force=False):
+    """Rolling 28-day mean of each keyword into keyword_evolution (ChatGPT also into chatgpt_evolution)"""
+    print(f"📊 Transforming evolution data [{engine}]...")
     
-    execute_batch(cursor, insert_query, records)
+    conn = get_db_connection()
+    stale = stale_keywords(conn, 'evolution', keywords, params=ROLLING_WINDOW, force=force)
+    if not stale:
+        conn.close()
+        return
+    
+    cursor = conn.cursor()
+    cursor.execute(EVOLUTION_TABLE)
+    compute = evolution_sql if engine == 'sql' else evolution_python
+    counts = compute(cursor, conn, stale)
+    if 'ChatGPT' in stale:
+        mirror_chatgpt_evolution(cursor)
+    for keyword, version in stale.items():
+        record_version(cursor, f'evolution:{keyword}', version)
     conn.commit()
     
-    print(f"   ✅ Transformed {len(records)} ChatGPT records")
+    print(f"   ✅ Transformed evolution of {len(stale)} keyword(s) ({format_counts(counts)})")
     
     cursor.close()
     conn.close()
 
-def detect_peaks(keyword, z_threshold=1.5):
-    """Detect peaks in trends data using Z-score"""
-    print(f"\n🔍 Detecting peaks for: {keyword} (threshold: {z_threshold})")
-    
-    conn = get_db_connection()
-    
-    # Read data
-    query = f"""
-        SELECT date, value 
+def peaks_python(cursor, conn, keywords, z_threshold):
+    """Rolling z-scores of all keywords in one vectorized pass; returns the peak count per keyword"""
+    df = pd.read_sql("""
+        SELECT keyword, date, value 
         FROM trends_raw 
-        WHERE keyword = '{keyword}' AND region = 'worldwide'
-        ORDER BY date
-    """
-    df = pd.read_sql(query, conn)
+        WHERE keyword = ANY(%(keywords)s) AND region = 'worldwide'
+        ORDER BY keyword, date
+    """, conn, params={'keywords': list(keywords)})
+    df['date'] = pd.to_datetime(df['date'])
     
-    if df.empty or len(df) < 5:
+    counts = df.groupby('keyword')['value'].count()
+    for keyword in counts[counts < MIN_PEAK_POINTS].index:
         print(f"   ⚠️  Insufficient data for {keyword}")
-        conn.close()
-        return
-    
-    # Calculate rolling statistics (4 weeks window)
-    df['rolling_mean'] = df['value'].rolling(window=4, min_periods=1).mean()
-    df['rolling_std'] = df['value'].rolling(window=4, min_periods=1).std()
-    
-    # Calculate Z-score
-    df['z_score'] = (df['value'] - df['rolling_mean']) / (df['rolling_std'] + 1e-10)
-    
-    # Detect peaks
-    peaks = df[df['z_score'] > z_threshold]
-    
-    if peaks.empty:
-        print(f"   ℹ️  No peaks detected (data is stable)")
-        conn.close()
-        return
-    
-    # Insert peaks
-    cursor = conn.cursor()
-    
-    # Clear existing peaks for this keyword
-    cursor.execute("DELETE FROM ai_peaks WHERE keyword = %s", (keyword,))
-    
-    records = [(row['date'], int(row['value']), float(row['z_score']), keyword) 
-               for _, row in peaks.iterrows()]
+    df = df[df['keyword'].isin(counts[counts >= MIN_PEAK_POINTS].index)]
+    
+    records = []
+    found = {}
+    if not df.empty:
+        # Series x dates matrix (NaN where a keyword has no point), 28-day window
+        values, names, dates = to_matrix(df)
+        z_score = rolling_zscore(values, dates, window=ROLLING_WINDOW, min_periods=1, eps=1e-10).z
+        with np.errstate(invalid='ignore'):
+            series_idx, date_idx = np.nonzero(z_score > z_threshold)
+        found = dict.fromkeys(names, 0)
+        for i, t in zip(series_idx, date_idx):
+            found[names[i]] += 1
+            records.append((dates[t].date(), int(values[i, t]), float(z_score[i, t]), names[i]))
     
     insert_query = """
         INSERT INTO ai_peaks (date, peak_value, z_score, keyword)
         VALUES (%s, %s, %s, %s)
     """
-    
     execute_batch(cursor, insert_query, records)
-    conn.commit()
+    return found
+
+def peaks_sql(cursor, conn, keywords, z_threshold):
+    """Rolling z-scores computed by window functions; returns the peak count per keyword"""
+    cursor.execute(f"""
+        WITH scored AS (
+            SELECT keyword, date, value,
+                   (value - AVG(value::float8) OVER w) / (STDDEV_SAMP(value::float8) OVER w + 1e-10) AS z_score,
+                   COUNT(*) OVER (PARTITION BY keyword) AS n_points
+            FROM trends_raw
+            WHERE keyword = ANY(%(keywords)s) AND region = 'worldwide'
+            WINDOW w AS (PARTITION BY keyword ORDER BY date {sql_window_frame()})
+        )
+        INSERT INTO ai_peaks (date, peak_value, z_score, keyword)
+        SELECT date, value, z_score, keyword
+        FROM scored
+        WHERE n_points >= %(min_points)s AND z_score > %(z)s
+        RETURNING keyword
+    """, {'keywords': list(keywords), 'min_points': MIN_PEAK_POINTS, 'z': z_threshold})
+    found = dict.fromkeys(keywords, 0)
+    for (keyword,) in cursor.fetchall():
+        found[keyword] += 1
+    return found
+
+def detect_peaks(keywords, z_threshold=1.5, engine='python', force=False):
+    """Detect peaks in trends data using Z-score"""
+    print(f"\n🔍 Detecting peaks [{engine}] (threshold: {z_threshold})")
+    
+    conn = get_db_connection()
+    stale = stale_keywords(conn, 'peaks', keywords, params=(ROLLING_WINDOW, z_threshold), force=force)
+    if not stale:
+        conn.close()
+        return
     
-    print(f"   ✅ Detected {len(records)} peaks")
+    cursor = conn.cursor()
+    
+    # Clear existing peaks for these keywords
+    cursor.execute("DELETE FROM ai_peaks WHERE keyword = ANY(%s)", (list(stale),))
+    
+    compute = peaks_sql if engine == 'sql' else peaks_python
+    found = compute(cursor, conn, stale, z_threshold)
+    for keyword, version in stale.items():
+        record_version(cursor, f'peaks:{keyword}', version)
+    cursor.execute("""
+        SELECT keyword, MAX(date) FROM ai_peaks WHERE keyword = ANY(%s) GROUP BY keyword
+    """, (list(stale),))
+    latest = dict(cursor.fetchall())
+    publish(cursor, 'peaks', keywords=[
+        {'keyword': keyword, 'peaks': count, 'latest_peak': latest.get(keyword)}
+        for keyword, count in found.items()
+    ])
+    commit_with_events(conn)
+    
+    for keyword, count in found.items():
+        if count:
+            print(f"   ✅ {keyword}: detected {count} peaks")
+        else:
+            print(f"   ℹ️  {keyword}: no peaks detected (data is stable)")
     
     cursor.close()
     conn.close()
 
-def generate_forecast(keyword='AI', horizon=30):
+def generate_forecast(keyword='AI', horizon=30, force=False):
     """Generate simple forecast using naive seasonal method"""
     print(f"\n📈 Generating {horizon}-day forecast for: {keyword}")
     
     conn = get_db_connection()
     
+    computation = f'forecast:{keyword}'
+    up_to_date, version = check_input_version(conn, computation, [(keyword, 'worldwide')],
+                                              params=horizon, force=force)
+    if up_to_date:
+        conn.close()
+        return
+    
     # Read recent data
     query = f"""
         SELECT date, value 
@@ -172,43 +330,75 @@ def generate_forecast(keyword='AI', horizon=30):
             float(upper)
         ))
     
-    # Insert forecasts
+    # Store as a new forecast run; the latest pointer switches on commit
     cursor = conn.cursor()
+    run_id = record_forecast_run(cursor, keyword, 'heuristic', forecasts)
+    record_version(cursor, computation, version)
+    commit_with_events(conn)
     
-    # Clear existing forecasts
-    cursor.execute("DELETE FROM ai_forecast")
-    
-    insert_query = """
-        INSERT INTO ai_forecast (date, forecast, lower_bound, upper_bound)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (date) 
-        DO UPDATE SET forecast = EXCLUDED.forecast,
-                     lower_bound = EXCLUDED.lower_bound,
-                     upper_bound = EXCLUDED.upper_bound
-    """
-    
-    execute_batch(cursor, insert_query, forecasts)
-    conn.commit()
-    
-    print(f"   ✅ Generated {len(forecasts)} forecast points")
+    print(f"   ✅ Generated {len(forecasts)} forecast points (run {run_id})")
     
     cursor.close()
     conn.close()
 
+def run_timed(timings, label, func, *args, **kwargs):
+    """Run one transformation step and remember its wall time"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    timings.append((label, time.perf_counter() - start))
+
 def main():
+    parser = argparse.ArgumentParser(description='Transform trends data in PostgreSQL')
+    parser.add_argument('--steps', nargs='+', choices=['evolution', 'peaks', 'forecast'],
+                       default=['evolution', 'peaks', 'forecast'],
+                       help='Transformation steps to run')
+    parser.add_argument('--evolution-keywords', nargs='+', default=['ChatGPT'],
+                       help='Keywords for the rolling mean evolution')
+    parser.add_argument('--keywords', nargs='+', default=['AI', 'Data Science'],
+                       help='Keywords for peak detection')
+    parser.add_argument('--z-threshold', type=float, default=1.5,
+                       help='Z-score threshold for peak detection')
+    parser.add_argument('--engine', choices=ENGINES, default='auto',
+                       help='Run evolution/peaks as SQL window functions in the database, in Python, '
+                            'or both (forced, to compare timings); auto picks SQL when the server supports it')
+    parser.add_argument('--forecast-keyword', default='AI',
+                       help='Keyword to forecast')
+    parser.add_argument('--horizon', type=int, default=30,
+                       help='Forecast horizon in days')
+    parser.add_argument('--force', action='store_true',
+                       help='Recompute even if the input series are unchanged')
+    
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("🔄 Transform Trends Data in PostgreSQL")
     print("=" * 60)
     
-    # Transform ChatGPT evolution
-    transform_chatgpt_evolution()
-    
-    # Detect peaks for AI and Data Science
-    detect_peaks('AI', z_threshold=1.5)
-    detect_peaks('Data Science', z_threshold=1.5)
+    if args.engine == 'both':
+        engines, force = ['python', 'sql'], True
+    else:
+        engines, force = [resolve_engine(args.engine)], args.force
+    timings = []
+    
+    for engine in engines:
+        # Transform keyword evolution
+        if 'evolution' in args.steps:
+            run_timed(timings, f'evolution [{engine}]', transform_evolution,
+                      args.evolution_keywords, engine=engine, force=force)
+        
+        # Detect peaks
+        if 'peaks' in args.steps:
+            run_timed(timings, f'peaks [{engine}]', detect_peaks,
+                      args.keywords, z_threshold=args.z_threshold, engine=engine, force=force)
     
     # Generate forecast
-    generate_forecast('AI', horizon=30)
+    if 'forecast' in args.steps:
+        run_timed(timings, 'forecast', generate_forecast,
+                  args.forecast_keyword, horizon=args.horizon, force=args.force)
+    
+    print("\n⏱️  Timings:")
+    for label, elapsed in timings:
+        print(f"   {label:20} {elapsed:8.3f}s")
     
     print("\n" + "=" * 60)
     print("✅ Transformation complete!")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Upsert helpers that skip unchanged rows and report what happened
+
+Upsert queries add a WHERE clause to ON CONFLICT DO UPDATE so rows whose
+values did not change are neither rewritten nor WAL-logged, and end with
+RETURNING (xmax = 0): true for a fresh insert, false for an update. Rows
+missing from the result were skipped because they were identical.
+"""
+from psycopg2.extras import execute_values
+
+def upsert_rows(cursor, insert_query, records, page_size=1000):
+    """Run an INSERT ... VALUES %s ... RETURNING (xmax = 0) upsert over records"""
+    if not records:
+        return {'inserted': 0, 'updated': 0, 'skipped': 0}
+    rows = execute_values(cursor, insert_query, records, page_size=page_size, fetch=True)
+    inserted = sum(1 for (is_insert,) in rows if is_insert)
+    return {
+        'inserted': inserted,
+        'updated': len(rows) - inserted,
+        'skipped': len(records) - len(rows),
+    }
+
+def upsert_select(cursor, insert_query, params=None, source_rows=None):
+    """Run an INSERT ... SELECT ... RETURNING (xmax = 0) upsert
+
+    source_rows is the number of candidate rows, used to derive skipped.
+    """
+    cursor.execute(f"""
+        WITH upserted (is_insert) AS ({insert_query})
+        SELECT COUNT(*) FILTER (WHERE is_insert), COUNT(*) FILTER (WHERE NOT is_insert)
+        FROM upserted
+    """, params)
+    inserted, updated = cursor.fetchone()
+    skipped = source_rows - inserted - updated if source_rows is not None else None
+    return {'inserted': inserted, 'updated': updated, 'skipped': skipped}
+
+def format_counts(counts):
+    """One-line summary of upsert counts"""
+    text = f"{counts['inserted']} inserted, {counts['updated']} updated"
+    if counts.get('skipped') is not None:
+        text += f", {counts['skipped']} unchanged"
+    return text
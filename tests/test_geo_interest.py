@@ -0,0 +1,60 @@
+"""
+geo_interest COPY upsert against a live PostgreSQL (skipped without one)
+
+Run from the repo root: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+psycopg2 = pytest.importorskip('psycopg2')
+pytest.importorskip('pytrends')
+
+import extract_to_postgres  # noqa: E402
+
+# Same definition as init_db.sql; as a temp table it shadows geo_interest for this session
+GEO_INTEREST = """
+    CREATE TEMP TABLE geo_interest (
+        keyword VARCHAR(100) NOT NULL,
+        resolution VARCHAR(10) NOT NULL,
+        parent_geo VARCHAR(10) NOT NULL DEFAULT '',
+        geo_code VARCHAR(100) NOT NULL,
+        geo_name VARCHAR(200) NOT NULL,
+        value SMALLINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (keyword, resolution, parent_geo, geo_code)
+    )
+"""
+
+
+@pytest.fixture
+def cursor():
+    try:
+        conn = psycopg2.connect(**extract_to_postgres.DB_CONFIG)
+    except psycopg2.OperationalError:
+        pytest.skip('PostgreSQL not reachable')
+    cursor = conn.cursor()
+    cursor.execute(GEO_INTEREST)
+    yield cursor
+    conn.rollback()
+    conn.close()
+
+
+def test_country_rows_keep_empty_parent_geo(cursor):
+    records = [
+        ('Python', 'COUNTRY', '', 'FR', 'France', 100),
+        ('Python', 'REGION', 'FR', 'FR-IDF', 'Île-de-France', 80),
+    ]
+
+    counts = extract_to_postgres.upsert_geo_interest(cursor, records)
+
+    assert counts == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    cursor.execute("SELECT parent_geo, geo_code FROM geo_interest WHERE resolution = 'COUNTRY'")
+    assert cursor.fetchall() == [('', 'FR')]
+
+    # Reloading identical rows is a no-op (the staging table is dropped at commit in real loads)
+    cursor.execute("DROP TABLE geo_interest_stage")
+    counts = extract_to_postgres.upsert_geo_interest(cursor, records)
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 2}